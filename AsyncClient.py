@@ -0,0 +1,987 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from EndpointRegistry import getEndpointRegistry, getHost
+from Hedge import getHedgePolicy
+from Metrics import ThroughputMeter, getMetrics
+from Progress import getProgress
+from OptionsParser import ParseError, parseLink, parseResult
+from QualityPolicy import getQualityPolicy
+from RateLimiter import RateLimiter
+from Retry import RetryPolicy, getErrorKind, getRetryPolicy
+from VideoInfo import VideoInfo
+from Y2mateApi import *
+from os import path, remove, replace
+from time import monotonic
+import asyncio
+
+class AsyncRequest:
+    '''
+    Simple wrapper for make HTTP requests on asyncio, mirror of Request
+    over an aiohttp session. Failed requests are retried according retry
+    policy, the process wide one by default.
+    '''
+
+    def __init__(
+            self, session, method = 'GET', url = '', headers = {}, data = {},
+            debug = False, stream = False, timeout = 60, verify = True,
+            retry = None
+        ):
+        self.__data     = data
+        self.__debug    = debug
+        self.__headers  = headers
+        self.__method   = method
+        self.__session  = session
+        self.__url      = url
+        self.__stream   = stream
+        self.__timeout  = timeout
+        self.__verify   = verify
+        self.__retry    = retry
+        self.response   = None
+        self.retries    = 0
+
+    async def do( self ):
+        '''
+        Do request and return the response, its body is not read yet.
+        Streamed requests only timeout when reading stalls.
+        '''
+        import aiohttp
+
+        if self.__stream:
+            timeout = aiohttp.ClientTimeout(
+                total = None, sock_connect = self.__timeout,
+                sock_read = self.__timeout
+            )
+        else:
+            timeout = aiohttp.ClientTimeout( total = self.__timeout )
+
+        kwargs = { 'headers': self.__headers, 'timeout': timeout }
+
+        if self.__method == 'POST':
+            kwargs['data'] = { k: str( v ) for k, v in self.__data.items() }
+
+        if not self.__verify:
+            kwargs['ssl'] = False
+
+        if self.__debug:
+            print( '{}\n{} {}\n{}\n'.format(
+                '-' * 50, self.__method, self.__url, '-' * 50
+            ) )
+
+        # SEND REQUEST (RETRYING FAILED ATTEMPTS)
+        # ----------------------------------------------------------------------
+        policy  = self.__retry or getRetryPolicy()
+        started = monotonic()
+        self.retries = 0
+
+        while True:
+            try:
+                self.response = await self.__session.request(
+                    self.__method, self.__url, **kwargs
+                )
+            except ( aiohttp.ClientError, asyncio.TimeoutError ) as e:
+                kind  = getErrorKind( e )
+                delay = None
+
+                if kind is not None and policy.isRetryError( kind ):
+                    delay = policy.next( self.retries, started )
+
+                if delay is None:
+                    raise
+
+                reason = kind
+            else:
+                if self.__debug:
+                    print( '{}\n{} {} {}\n{}\n'.format(
+                        '-' * 50, self.response.status, self.response.reason,
+                        self.__url, '-' * 50
+                    ) )
+
+                if not policy.isRetryStatus( self.response.status ):
+                    break
+
+                delay = policy.next( self.retries, started )
+
+                if delay is None:
+                    break
+
+                reason = 'HTTP {}'.format( self.response.status )
+                self.response.release()
+
+            if self.__debug:
+                print( '[Retry] {} on {}, retrying in {:.1f} s...'.format(
+                    reason, self.__url, delay
+                ) )
+
+            await asyncio.sleep( delay )
+            self.retries += 1
+        # ----------------------------------------------------------------------
+
+        getMetrics().add( 'retries', self.retries )
+
+        return self.response
+
+class AsyncWriter:
+    '''
+    Writes of a file off the event loop, mirror of Download.WriterThread.
+    Every write runs on an executor thread. With buffers, put only
+    queues data and a writer task writes it in order, put waits while
+    buffers chunks are queued, so a slow disk slows the reader down
+    instead of piling data up; without them put waits for its write.
+    Writer errors are raised to the reader on its next put or close.
+
+        writer = AsyncWriter( f, offset, 4 )
+        await writer.put( data )
+        await writer.close()
+
+    Stats are the ones of WriterThread.
+    '''
+
+    def __init__( self, f, offset, buffers = 0, onWrite = None ):
+        '''
+        - f:       Unbuffered file open for writing, at offset.
+        - offset:  File position of first byte.
+        - buffers: Chunks queued at once, 0 waits for every write.
+        - onWrite: Called with offset and data of every write, on the
+                   executor thread.
+        '''
+        self.f        = f
+        self.position = offset
+        self.onWrite  = onWrite
+        self.stats    = {
+            'diskWaits': 0, 'diskWait': 0, 'netWaits': 0, 'netWait': 0
+        }
+        self.__loop   = asyncio.get_running_loop()
+        self.__queue  = None
+        self.__task   = None
+        self.__error  = None
+        self.__closed = False
+
+        if buffers > 0:
+            self.__queue = asyncio.Queue( buffers )
+            self.__task  = asyncio.ensure_future( self.__run() )
+
+    def __write( self, offset, data ):
+        from Download import writeAll
+
+        writeAll( self.f, data )
+
+        if self.onWrite is not None:
+            self.onWrite( offset, data )
+
+    async def __writeNext( self, data ):
+        await self.__loop.run_in_executor(
+            None, self.__write, self.position, data
+        )
+        self.position += len( data )
+
+    async def __run( self ):
+        while True:
+            if self.__queue.empty():
+                start = monotonic()
+                data  = await self.__queue.get()
+                self.stats['netWaits'] += 1
+                self.stats['netWait']  += monotonic() - start
+            else:
+                data = self.__queue.get_nowait()
+
+            if data is None:
+                return
+
+            # AFTER AN ERROR DATA IS ONLY DROPPED, SO put NEVER HANGS
+            if self.__error is None:
+                try:
+                    await self.__writeNext( data )
+                except Exception as e:
+                    self.__error = e
+
+    def check( self ):
+        '''Raise writer error, if any'''
+
+        if self.__error is not None:
+            raise self.__error
+
+    async def put( self, data ):
+        '''Write data or queue it, wait while every buffer is queued'''
+
+        self.check()
+
+        if self.__queue is None:
+            return await self.__writeNext( data )
+
+        if not self.__queue.full():
+            return self.__queue.put_nowait( data )
+
+        start = monotonic()
+        await self.__queue.put( data )
+        self.stats['diskWaits'] += 1
+        self.stats['diskWait']  += monotonic() - start
+
+    async def close( self, check = True ):
+        '''Wait until queued data is written, then check errors'''
+
+        if self.__task is not None and not self.__closed:
+            self.__closed = True
+            await self.__queue.put( None )
+            await self.__task
+
+        if check:
+            self.check()
+
+def openPart( partPath, offset ):
+    '''Open partPath unbuffered for writing at offset'''
+
+    f = open( partPath, 'r+b', buffering = 0 )
+    f.seek( offset )
+    return f
+
+def getSavedBytes( saved ):
+    '''
+    Get bytes saved from the start of a '.part' file by its sidecar
+    saved (see Download.loadPart), 0 when it's None. A single stream
+    continues from there, bytes of segments past the first pending one
+    are downloaded again.
+    '''
+    if saved is None:
+        return 0
+
+    done = 0
+
+    for start, end, written in sorted( saved['ranges'] ):
+        if start != done:
+            break
+
+        done += written
+
+        if written < end - start + 1:
+            break
+
+    return done
+
+class AsyncClient:
+    '''
+    Y2mate client on asyncio. Mirror of Y2mateClient, every phase
+    (analyze, convert and file download) has its own concurrency limit.
+
+    Use it as async context manager:
+        async with AsyncClient() as client:
+            await client.downloadURL( url, 'mp3' )
+    '''
+
+    def __init__(
+            self, analyzeLimit = 16, convertLimit = 16, downloadLimit = 8,
+            cache = None, engine = 'fast', chunk = 64 * 1024, timeout = 60,
+            limiter = None, fileRate = 0, ledger = None, manifest = None,
+            checksums = [], convertPoll = 3, convertDeadline = 600,
+            writeBuffers = 0, fsync = False, debug = False, verbose = False
+        ):
+        '''
+        - analyzeLimit:  Max concurrent analyze requests.
+        - convertLimit:  Max concurrent convert requests.
+        - downloadLimit: Max concurrent file downloads.
+        - cache:         OptionsCache for options results.
+        - engine:        Result HTML parser engine, 'fast' or 'advanced'.
+        - chunk:         Bytes read on every file stream iteration.
+        - timeout:       Requests timeout.
+        - limiter:       RateLimiter shared by all downloads.
+        - fileRate:      Bytes/sec limit of every download, 0 is unlimited.
+        - ledger:        DownloadLedger of completed downloads, SHA-256
+                         is computed for it.
+        - manifest:      Checksum.Manifest saved files are recorded on.
+        - checksums:     Checksum algorithms of saved files.
+        - convertPoll:   Seconds between requests of a file y2mate is
+                         still converting.
+        - convertDeadline: Max seconds a file conversion is waited for.
+        - writeBuffers:  Chunks read while earlier ones are written, 0
+                         waits for every write (see AsyncWriter).
+        - fsync:         Flush completed files to disk before they're
+                         renamed.
+        '''
+        self.analyzeLimit  = analyzeLimit
+        self.convertLimit  = convertLimit
+        self.downloadLimit = downloadLimit
+        self.cache         = cache
+        self.engine        = engine
+        self.chunk         = chunk
+        self.timeout       = timeout
+        self.limiter       = limiter
+        self.fileRate      = fileRate
+        self.ledger        = ledger
+        self.manifest      = manifest
+        self.checksums     = list( checksums )
+        self.convertPoll   = convertPoll
+        self.convertDeadline = convertDeadline
+        self.writeBuffers  = writeBuffers
+        self.fsync         = fsync
+        self.debug         = debug
+        self.verbose       = verbose
+        self.session       = None
+        self.__waits       = {}
+        self.__saved       = { 'bytes': 0, 'resumed': 0 }
+
+        # LEDGER ENTRIES KEEP SHA-256 OF THE DOWNLOAD, FILES AREN'T READ AGAIN
+        if ledger is not None and 'sha256' not in self.checksums:
+            self.checksums.append( 'sha256' )
+
+    async def __aenter__( self ):
+        import aiohttp
+
+        # SEMAPHORES ARE BOUND TO RUNNING LOOP
+        self.__analyze  = asyncio.Semaphore( self.analyzeLimit )
+        self.__convert  = asyncio.Semaphore( self.convertLimit )
+        self.__download = asyncio.Semaphore( self.downloadLimit )
+
+        self.session = aiohttp.ClientSession(
+            connector = aiohttp.TCPConnector(
+                limit = self.analyzeLimit + self.convertLimit \
+                    + self.downloadLimit
+            )
+        )
+        return self
+
+    async def __aexit__( self, *args ):
+        await self.session.close()
+
+    def __verbose( self, msg ):
+        if self.verbose:
+            print( msg )
+
+    async def __hedge( self, kind, request ):
+        '''
+        Do request() AsyncRequest and return the response status and its
+        JSON payload (None when it's malformed), hedged by process wide
+        hedge policy. The losing request is cancelled.
+        '''
+        async def call():
+            async with await request().do() as res:
+                try:
+                    payload = await res.json( content_type = None )
+                except ValueError:
+                    payload = None
+
+                return res.status, \
+                    payload if isResultPayload( payload ) else None
+
+        policy = getHedgePolicy()
+
+        if policy is None:
+            return await call()
+
+        return await policy.runAsync(
+            kind, call,
+            isGood = lambda r: r[0] == 200 and r[1] is not None
+        )
+
+    async def __post(
+            self, kind, getRequest, timeout, retry = None, host = None
+        ):
+        '''
+        POST to endpoints of kind from endpoint registry, mirror of
+        Y2mateClient.__post. Return the response status, its JSON
+        payload (None when it's malformed) and the endpoint URL that
+        gave them.
+        '''
+        import aiohttp
+
+        registry = getEndpointRegistry()
+        urls     = registry.select( kind, host )
+
+        if len( urls ) == 0:
+            raise ConvertError(
+                '[Error] No {} endpoint on {}!'.format( kind, host )
+            )
+
+        for index, endpointURL in enumerate( urls ):
+            last = index == len( urls ) - 1
+            url, headers, data = getRequest( endpointURL )
+            start = monotonic()
+            req   = lambda: AsyncRequest(
+                self.session, method = 'POST', url = url, headers = headers,
+                data = data, debug = self.debug, timeout = timeout,
+                retry = retry if last else RetryPolicy( attempts = 1 )
+            )
+
+            try:
+                status, payload = await self.__hedge( kind, req )
+            except ( aiohttp.ClientConnectionError, asyncio.TimeoutError ) as e:
+                registry.record( endpointURL, monotonic() - start, False )
+
+                # A CONVERT HELD UNTIL TIMEOUT IS POLLED AGAIN BY THE CALLER
+                if last:
+                    raise
+
+                reason = 'timeout' if isinstance( e, asyncio.TimeoutError ) \
+                    else 'connection error'
+            else:
+                ok = status == 200 and payload is not None
+                registry.record( endpointURL, monotonic() - start, ok )
+
+                if ok or last:
+                    return status, payload, endpointURL
+
+                reason = 'HTTP {}'.format( status ) \
+                    if status != 200 else 'malformed JSON'
+
+            if self.debug:
+                print( '[Failover] {} on {}, trying {}...'.format(
+                    reason, endpointURL, urls[index + 1]
+                ) )
+
+    async def getOptions( self, vID, mp3Convert = False, refresh = False ):
+        '''
+        Get VideoInfo of vID from cache or analyze API, None when options
+        can't be parsed.
+        '''
+        kind = getEndpointKind( 'analyze', mp3Convert )
+
+        # kID IS ONLY VALID ON ITS HOST, THE ONE TRIED FIRST IS PREFERRED
+        if self.cache is not None and not refresh:
+            for host in getEndpointRegistry().getHosts( kind ):
+                data = self.cache.get( vID, mp3Convert, host )
+
+                if data is not None:
+                    return VideoInfo.fromDict(
+                        vID, data, mp3Convert, True, host
+                    )
+
+        metrics = getMetrics()
+
+        async with self.__analyze:
+            with metrics.phase( 'analyze' ):
+                status, payload, endpointURL = await self.__post(
+                    kind, lambda url: getAnalyzeRequest( vID, mp3Convert, url ),
+                    self.timeout
+                )
+
+        if status != 200 or payload is None:
+            return None
+
+        try:
+            with metrics.phase( 'parse' ):
+                data = parseResult(
+                    payload['result'], mp3Convert = mp3Convert,
+                    engine = self.engine
+                )
+            info = VideoInfo.fromDict(
+                vID, data, mp3Convert, host = getHost( endpointURL )
+            )
+        except ( ParseError, ValueError, KeyError, TypeError ):
+            return None
+
+        if self.cache is not None:
+            self.cache.set( vID, mp3Convert, info.toDict(), info.host )
+
+        return info
+
+    async def getLink(
+            self, kID, vID, format, quality, mp3Convert = False,
+            deadline = None, host = None
+        ):
+        '''
+        Get file download link from convert API or raise Y2mateError.
+        While y2mate is converting the file (or the request timed out)
+        it's requested again, poll seconds later, until deadline seconds
+        passed (convertDeadline by default). Waits don't hold a convert
+        slot. With host only its endpoints are requested, the one that
+        gave kID (see VideoInfo.host).
+        '''
+        metrics  = getMetrics()
+        started  = monotonic()
+        deadline = started + (
+            self.convertDeadline if deadline is None else deadline
+        )
+
+        with metrics.phase( 'convert' ):
+            while True:
+                left = deadline - monotonic()
+
+                if left <= 0:
+                    raise ConvertError(
+                        '[Error] File not converted after {:.0f} s!'.format(
+                            monotonic() - started
+                        )
+                    )
+
+                try:
+                    result = await self.__requestLink(
+                        kID, vID, format, quality, mp3Convert,
+                        min( self.timeout, left ), host
+                    )
+                except asyncio.TimeoutError:
+                    # REQUEST HELD UNTIL TIMEOUT, THE SERVER IS STILL CONVERTING
+                    continue
+
+                if result is not None:
+                    break
+
+                await asyncio.sleep( min( self.convertPoll, left ) )
+
+        # DETECT TO LONG VIDEO ERROR
+        if 'video is too long' in result:
+            raise Y2mateError(
+                '[Error] Video is too long, try with shorter one!'
+            )
+
+        with metrics.phase( 'parse' ):
+            fileLink = parseLink( result, engine = self.engine )
+
+        if fileLink is None:
+            raise ConvertError(
+                '[Error] something is wrong with download... try again!'
+            )
+
+        return fixFileLink( fileLink )
+
+    async def __requestLink(
+            self, kID, vID, format, quality, mp3Convert, timeout, host
+        ):
+        '''
+        Do one convert request, get its result HTML or None when y2mate
+        is still converting. Timeouts are not retried, getLink polls.
+        '''
+        policy = getRetryPolicy()
+        retry  = RetryPolicy(
+            policy.attempts, policy.backoff, policy.maxBackoff,
+            policy.rules - { 'timeout' }, policy.deadline
+        )
+
+        async with self.__convert:
+            status, payload, _ = await self.__post(
+                getEndpointKind( 'convert', mp3Convert ),
+                lambda url: getConvertRequest(
+                    kID, vID, format, quality, mp3Convert, url
+                ),
+                timeout, retry, host
+            )
+
+        if status != 200:
+            raise ConvertError(
+                '[Server Error]: HTTP {} getting download link!'.format(
+                    status
+                )
+            )
+
+        if payload is None:
+            raise ConvertError( '[Error] Unexpected convert response!' )
+
+        result = payload['result']
+
+        return None if isConverting( payload ) else result
+
+    async def downloadFile( self, fileLink, filePath ):
+        '''
+        Stream fileLink at filePath ('.part' file renamed when complete)
+        and return download stats dict ( bytes, resumed, size, seconds,
+        segments, peak, checksums ), with writeBuffers AsyncWriter waits
+        too. Checksums are computed while it's written. Disk work runs
+        off the event loop, see AsyncWriter. A stream that drops or ends
+        before its content-length is requested again from its last byte,
+        according retry policy. Like Downloader, a '.part' file left by
+        a previous run is continued with Range and If-Range when its
+        '.part.json' sidecar matches. The download is followed by process
+        wide Progress.
+        '''
+        meter    = ThroughputMeter()
+        progress = getProgress()
+
+        if progress is None:
+            return await self.__saveFile( fileLink, filePath, meter )
+
+        # PROGRESS IS READ FROM meter, THE DOWNLOAD LOOP ONLY UPDATES IT
+        transfer = progress.start( path.basename( filePath ), meter )
+        ok       = False
+
+        try:
+            stats = await self.__saveFile( fileLink, filePath, meter )
+            ok    = True
+            return stats
+        finally:
+            progress.end( transfer, ok )
+
+    async def __saveFile( self, fileLink, filePath, meter ):
+        '''Download of downloadFile, meter counts its bytes'''
+
+        import aiohttp
+        from Checksum import StreamHasher
+        from Download import TruncatedError, loadPart, preallocate, \
+            savePartMeta, syncFile
+
+        start    = monotonic()
+        limiter  = self.limiter
+        metrics  = getMetrics()
+        loop     = asyncio.get_running_loop()
+        partPath = filePath + '.part'
+        policy   = getRetryPolicy()
+        attempt  = 0
+        size     = 0
+        written  = 0
+        hasher   = None
+        waits    = {}
+        meta     = None
+        checked  = False
+        resumed  = 0
+
+        if self.fileRate > 0:
+            limiter = RateLimiter( self.fileRate, parent = self.limiter )
+
+        async with self.__download:
+            while True:
+                headers = getFileHeaders( fileLink )
+
+                if written > 0:
+                    headers['Range'] = 'bytes={}-'.format( written )
+
+                    # ONLY GET PARTIAL CONTENT FROM THE SAME FILE
+                    validator = meta['etag'] or meta['lastModified']
+                    if validator:
+                        headers['If-Range'] = validator
+
+                req = AsyncRequest(
+                    self.session, url = fileLink, headers = headers,
+                    debug = self.debug, stream = True,
+                    timeout = self.timeout, verify = False
+                )
+                with metrics.phase( 'ttfb' ):
+                    res = await req.do()
+
+                try:
+                    async with res:
+                        if res.status == 404:
+                            raise Y2mateError(
+                                '[Server Error]: File not found!'
+                            )
+
+                        if res.status not in [ 200, 206 ]:
+                            raise Y2mateError(
+                                f'[Server Error]: HTTP {res.status} on ' \
+                                    + 'file download!'
+                            )
+
+                        # NEW FILE OR RANGE IGNORED, START AGAIN
+                        if res.status == 200:
+                            size    = int(
+                                res.headers.get( 'content-length', 0 )
+                            )
+                            written = 0
+                            meta    = {
+                                'link':         fileLink,
+                                'size':         size,
+                                'etag':         res.headers.get( 'etag' ),
+                                'lastModified': res.headers.get(
+                                    'last-modified'
+                                ),
+                                'ranges':       [ [ 0, size - 1, 0 ] ]
+                            }
+
+                            # CONTINUE '.part' OF A PREVIOUS RUN, SAVED
+                            # FROM ITS START ON
+                            if not checked:
+                                checked = True
+                                saved   = await loop.run_in_executor(
+                                    None, loadPart, filePath, meta
+                                )
+                                written = getSavedBytes( saved )
+                                resumed = written
+
+                            meta['ranges'][0][2] = written
+                            meter.total = size - written
+                            hasher  = StreamHasher(
+                                partPath, self.checksums,
+                                [ [ 0, size - 1, written ] ]
+                            ) if self.checksums else None
+
+                            if written > 0:
+                                await loop.run_in_executor(
+                                    None, savePartMeta, filePath, meta
+                                )
+                                continue
+
+                            await loop.run_in_executor(
+                                None, preallocate, partPath, size
+                            )
+
+                            if size > 0:
+                                await loop.run_in_executor(
+                                    None, savePartMeta, filePath, meta
+                                )
+
+                        # NOTHING IS OPENED ON THE EVENT LOOP
+                        f = await loop.run_in_executor(
+                            None, openPart, partPath, written
+                        )
+
+                        with metrics.phase( 'download' ), f:
+                            writer = AsyncWriter(
+                                f, written, self.writeBuffers,
+                                hasher.update if hasher is not None else None
+                            )
+
+                            try:
+                                async for data in res.content.iter_chunked(
+                                    self.chunk
+                                ):
+                                    await writer.put( data )
+                                    written += len( data )
+                                    meter.update( len( data ) )
+
+                                    if limiter is not None:
+                                        await limiter.consumeAsync(
+                                            len( data )
+                                        )
+                            finally:
+                                # READ DATA IS WRITTEN, WRITER ERRORS DON'T
+                                # HIDE OTHERS
+                                await writer.close( check = False )
+
+                                # NEXT ATTEMPT AND RUN CONTINUE FROM DISK
+                                written = writer.position
+
+                                if size > 0:
+                                    meta['ranges'][0][2] = written
+                                    await loop.run_in_executor(
+                                        None, savePartMeta, filePath, meta
+                                    )
+
+                                if self.writeBuffers > 0:
+                                    for k, v in writer.stats.items():
+                                        waits[k] = waits.get( k, 0 ) + v
+                                        self.__waits[k] = \
+                                            self.__waits.get( k, 0 ) + v
+
+                            writer.check()
+
+                    if size > 0 and written < size:
+                        raise TruncatedError(
+                            '[Error] Downloaded {} of {} bytes!'.format(
+                                written, size
+                            )
+                        )
+
+                    break
+                except (
+                    TruncatedError, aiohttp.ClientError, asyncio.TimeoutError
+                ) as e:
+                    kind  = 'connection' if isinstance( e, TruncatedError ) \
+                        else getErrorKind( e )
+                    delay = None
+
+                    # ONLY KNOWN SIZE FILES CAN BE CONTINUED
+                    if kind is not None and policy.isRetryError( kind ) \
+                        and size > 0:
+                        delay = policy.next( attempt, start )
+
+                    if delay is None:
+                        if isinstance( e, TruncatedError ):
+                            raise Y2mateError( str( e ) )
+                        raise
+
+                if self.debug:
+                    print( '[Retry] {} on {}, retrying in {:.1f} s...'.format(
+                        kind, fileLink, delay
+                    ) )
+
+                await asyncio.sleep( delay )
+                attempt += 1
+                metrics.add( 'retries' )
+
+        metrics.add( 'bytes', meter.bytes )
+        metrics.setPeak( meter.getPeak() )
+
+        if size > 0 and written != size:
+            raise Y2mateError(
+                '[Error] Downloaded {} of {} bytes!'.format( written, size )
+            )
+
+        # DOWNLOAD COMPLETED, DISK WORK RUNS OFF THE EVENT LOOP
+        if self.fsync:
+            await loop.run_in_executor( None, syncFile, partPath )
+
+        await loop.run_in_executor( None, replace, partPath, filePath )
+
+        if meta is not None and size > 0:
+            await loop.run_in_executor(
+                None, remove, filePath + '.part.json'
+            )
+
+        # RENAME IS KEPT TOO
+        if self.fsync:
+            await loop.run_in_executor(
+                None, syncFile, path.dirname( path.abspath( filePath ) )
+            )
+
+        # DOWNLOADED BYTES OF EVERY FILE, FOR BATCH STATS
+        self.__saved['bytes']   += written - resumed
+        self.__saved['resumed'] += resumed
+
+        return dict( waits, **{
+            'bytes':     written - resumed,
+            'resumed':   resumed,
+            'size':      size,
+            'seconds':   monotonic() - start,
+            'segments':  1,
+            'peak':      meter.getPeak(),
+            'checksums': await loop.run_in_executor( None, hasher.finish ) \
+                if hasher is not None else {}
+        } )
+
+    async def downloadURL(
+            self, url, format, quality = None, mp3Convert = False,
+            useCurrentDir = False, refresh = False, redownload = False
+        ):
+        '''
+        Run the full process for one url: video ID, options, quality
+        (see QualityPolicy), link and download. Return the saved file
+        path or raise Y2mateError. Existing files are never overwritten.
+        Options on download ledger are given from disk unless redownload
+        is True. Every call is a metrics run.
+        '''
+        with getMetrics().run( url ):
+            return await self.__downloadURL(
+                url, format, quality, mp3Convert, useCurrentDir, refresh,
+                redownload
+            )
+
+    async def __downloadURL(
+            self, url, format, quality, mp3Convert, useCurrentDir, refresh,
+            redownload
+        ):
+        with getMetrics().phase( 'videoID' ):
+            vID = parseVideoID( url )
+
+        if vID == '':
+            raise Y2mateError(
+                '[Error]: Can\'t get video ID from \'{}\'!'.format( url )
+            )
+
+        loop = asyncio.get_running_loop()
+        info = await self.getOptions( vID, mp3Convert, refresh )
+
+        if info == None:
+            raise OptionsError( '[Error]: Can\'t get download options!' )
+
+        asked = ( format, quality )
+
+        while True:
+            option  = getQualityPolicy().select( info.options, *asked )
+            format  = option.format
+            quality = option.quality
+
+            # SELECTED OPTION ALREADY DOWNLOADED, LEDGER CHECKS MAY READ
+            # WHOLE FILES
+            if self.ledger is not None and not redownload:
+                filePath = await loop.run_in_executor(
+                    None, self.ledger.fetch, vID, format, quality,
+                    useCurrentDir
+                )
+
+                if filePath is not None:
+                    self.__verbose(
+                        'Status: Already downloaded at \'{}\'...' \
+                            .format( filePath )
+                    )
+                    return filePath
+
+            try:
+                fileLink = await self.getLink(
+                    info.kID, vID, format, quality, mp3Convert,
+                    host = info.host
+                )
+                break
+            except ConvertError:
+                if not info.cached:
+                    raise
+
+            # STALE CACHED kID
+            self.cache.invalidate( vID, mp3Convert, info.host )
+            info = await self.getOptions( vID, mp3Convert, refresh = True )
+
+            if info == None:
+                raise OptionsError( '[Error]: Can\'t get download options!' )
+
+        fileName, filePath = getFilePath(
+            '{}.{}'.format( info.title, format ), format, useCurrentDir
+        )
+
+        if path.isfile( filePath ):
+            filePath = addFilePrefix( filePath )
+
+        filePath = path.normpath( filePath )
+        stats = await self.downloadFile( fileLink, filePath )
+
+        # SHA-256 WAS COMPUTED WHILE SAVING, THE FILE ISN'T READ AGAIN
+        if self.ledger is not None:
+            await loop.run_in_executor(
+                None, self.ledger.add, vID, format, quality, filePath,
+                stats['checksums'].get( 'sha256' )
+            )
+
+        if self.manifest is not None:
+            self.manifest.add( filePath, stats, fileLink )
+
+        self.__verbose( 'Status: Saved at \'{}\'...'.format( filePath ) )
+        return filePath
+
+    async def runBatch( self, urls, concurrency = 100, **kwargs ):
+        '''
+        Download every url from urls iterable, never more than
+        concurrency urls are in progress. Extra kwargs are passed to
+        downloadURL. Return a list of
+        ( url, status, filePath or error message ) tuples in input order
+        and the aggregate download stats.
+        '''
+        loop    = asyncio.get_running_loop()
+        slots   = asyncio.Semaphore( max( 1, concurrency ) )
+        urls    = iter( urls )
+        results = []
+        tasks   = set()
+        start   = monotonic()
+        waits   = dict( self.__waits )
+        saved   = dict( self.__saved )
+
+        async def run( index, url ):
+            try:
+                filePath = await self.downloadURL( url, **kwargs )
+                results.append( ( index, url, True, filePath ) )
+            except Exception as e:
+                results.append( ( index, url, False, str( e ) ) )
+            finally:
+                slots.release()
+
+            self.__verbose( 'Status: [{}] {}'.format(
+                'OK' if results[-1][2] else 'FAIL', url
+            ) )
+
+        index = 0
+        while True:
+            await slots.acquire()
+
+            # URLS MAY COME FROM A BLOCKING STREAM (STDIN)
+            url = await loop.run_in_executor( None, next, urls, None )
+
+            if url is None:
+                slots.release()
+                break
+
+            task = asyncio.ensure_future( run( index, url ) )
+            tasks.add( task )
+            task.add_done_callback( tasks.discard )
+            index += 1
+
+        await asyncio.gather( *tasks )
+
+        results.sort( key = lambda e: e[0] )
+        results = [ r[1:] for r in results ]
+
+        # BYTES DOWNLOADED BY THIS BATCH, NOT SIZES OF FILES ON LEDGER
+        stats = {
+            'bytes':    self.__saved['bytes'] - saved['bytes'],
+            'resumed':  self.__saved['resumed'] - saved['resumed'],
+            'seconds':  monotonic() - start,
+            'segments': 1
+        }
+
+        # WRITER WAITS OF EVERY DOWNLOAD OF THIS BATCH
+        for k, v in self.__waits.items():
+            stats[k] = v - waits.get( k, 0 )
+
+        return results, stats
@@ -0,0 +1,203 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Checksums of downloaded files computed while they're written, so a
+saved file is never read again just to hash it, and a manifest of saved
+files with their byte count and checksums.
+'''
+
+from bisect import bisect_right
+from os import makedirs, path
+from threading import Lock
+from time import time
+import json
+
+# CHECKSUM ALGORITHMS
+# ------------------------------------------------------------------------------
+# - sha256, sha1, md5: hashlib.
+# - xxh64, xxh3:       xxhash module (pip install xxhash), non
+#                      cryptographic but many times faster.
+# ------------------------------------------------------------------------------
+ALGORITHMS = [ 'sha256', 'sha1', 'md5', 'xxh64', 'xxh3' ]
+
+def newDigest( algorithm ):
+    '''
+    Get a new hash object of algorithm, see CHECKSUM ALGORITHMS. Raise
+    ValueError when it's unknown or its module isn't installed.
+    '''
+    if algorithm in [ 'sha256', 'sha1', 'md5' ]:
+        import hashlib
+        return hashlib.new( algorithm )
+
+    if algorithm in [ 'xxh64', 'xxh3' ]:
+        try:
+            import xxhash
+        except ImportError:
+            raise ValueError(
+                '{} needs xxhash module, pip install xxhash'.format(
+                    algorithm
+                )
+            )
+
+        return xxhash.xxh64() if algorithm == 'xxh64' else xxhash.xxh3_64()
+
+    raise ValueError( 'unknown checksum \'{}\''.format( algorithm ) )
+
+def getFileChecksums( filePath, algorithms, blockSize = 1024 * 1024 ):
+    '''Get { algorithm: hex digest } of filePath content (reads it all)'''
+
+    digests = [ newDigest( a ) for a in algorithms ]
+
+    with open( filePath, 'rb' ) as f:
+        for block in iter( lambda: f.read( blockSize ), b'' ):
+            for digest in digests:
+                digest.update( block )
+
+    return { a: d.hexdigest() for a, d in zip( algorithms, digests ) }
+
+class StreamHasher:
+    '''
+    Checksums of a file that is written on byte ranges, maybe in
+    parallel. Writers give every written block with update, blocks that
+    come in file order are hashed right away. Blocks written ahead of
+    the hashed offset (other segments, resumed bytes) are read back when
+    hashing reaches them, while they are still on page cache, so a
+    single stream download is hashed without any read.
+
+        hasher = StreamHasher( partPath, [ 'sha256' ], ranges )
+        ... write data at offset, hasher.update( offset, data ) ...
+        checksums = hasher.finish()
+    '''
+
+    def __init__(
+            self, filePath, algorithms, ranges, blockSize = 1024 * 1024
+        ):
+        '''
+        - filePath:   File being written.
+        - algorithms: Checksums computed, see CHECKSUM ALGORITHMS.
+        - ranges:     [ start, end, done ] ranges of the file (see
+                      Downloader.getRanges), done bytes are already
+                      written.
+        - blockSize:  Bytes read back at once.
+        '''
+        self.filePath   = filePath
+        self.algorithms = list( algorithms )
+        self.blockSize  = blockSize
+        self.position   = 0
+        self.__digests  = [ newDigest( a ) for a in self.algorithms ]
+        self.__starts   = sorted( r[0] for r in ranges ) or [ 0 ]
+        self.__written  = { start: start for start in self.__starts }
+        self.__reading  = False
+        self.__lock     = Lock()
+
+        for r in ranges:
+            self.__written[r[0]] = r[0] + r[2]
+
+    def __hash( self, data ):
+        for digest in self.__digests:
+            digest.update( data )
+
+    def __getRange( self, offset ):
+        '''Get start of range offset is on'''
+
+        index = bisect_right( self.__starts, offset ) - 1
+        return self.__starts[max( 0, index )]
+
+    def __isBehind( self ):
+        '''Check if there are written bytes from hashed offset on'''
+
+        written = self.__written[self.__getRange( self.position )]
+        return not self.__reading and written > self.position
+
+    def update( self, offset, data ):
+        '''Count data written at offset'''
+
+        with self.__lock:
+            start = self.__getRange( offset )
+            self.__written[start] = max(
+                self.__written[start], offset + len( data )
+            )
+
+            if offset == self.position and not self.__reading:
+                self.__hash( data )
+                self.position += len( data )
+
+            behind = self.__isBehind()
+            self.__reading = self.__reading or behind
+
+        if behind:
+            self.__readBack()
+
+    def __readBack( self ):
+        '''
+        Hash written bytes from hashed offset on, reading them from file.
+        Only one writer reads back at once, the others don't hash until
+        it's done.
+        '''
+        with open( self.filePath, 'rb' ) as f:
+            while True:
+                with self.__lock:
+                    offset = self.position
+                    end    = self.__written[self.__getRange( offset )]
+
+                    if end <= offset:
+                        self.__reading = False
+                        return
+
+                f.seek( offset )
+                block = f.read( min( self.blockSize, end - offset ) )
+
+                if not block:
+                    with self.__lock:
+                        self.__reading = False
+                    return
+
+                self.__hash( block )
+
+                with self.__lock:
+                    self.position += len( block )
+
+    def finish( self ):
+        '''Hash bytes not hashed yet and get { algorithm: hex digest }'''
+
+        with self.__lock:
+            behind = self.__isBehind()
+            self.__reading = self.__reading or behind
+
+        if behind:
+            self.__readBack()
+
+        return {
+            a: d.hexdigest() for a, d in zip( self.algorithms, self.__digests )
+        }
+
+class Manifest:
+    '''
+    JSON lines manifest of saved files: path, byte count, content-length
+    and checksums of every download. Thread safe.
+    '''
+
+    def __init__( self, filePath ):
+        self.filePath = filePath
+        self.__lock   = Lock()
+
+    def add( self, filePath, stats, link = None ):
+        '''Record saved filePath with its Downloader.save stats'''
+
+        data = {
+            'path':      path.abspath( filePath ),
+            'bytes':     stats['bytes'] + stats.get( 'resumed', 0 ),
+            'size':      stats.get( 'size', 0 ),
+            'checksums': stats.get( 'checksums', {} ),
+            'link':      link,
+            'time':      time()
+        }
+        folder = path.dirname( self.filePath )
+
+        with self.__lock:
+            if folder:
+                makedirs( folder, exist_ok = True )
+
+            with open( self.filePath, 'a' ) as f:
+                f.write( json.dumps( data ) + '\n' )
@@ -0,0 +1,277 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Tracker of convert jobs. Y2mate answers convert requests when the file
+is ready, which may take minutes with the MP3 converter, or says it's
+still converting. Instead of blocking on one request (and losing the
+work when it times out) every conversion is a job that is requested
+again until its link arrives or its deadline passes, so many
+conversions wait at once without holding a download slot.
+'''
+
+from QualityPolicy import getQualityPolicy
+from Retry import RetryPolicy, getErrorKind, getRetryPolicy
+from Y2mateApi import ConvertError
+from contextvars import copy_context
+from heapq import heappop, heappush
+from itertools import count
+from threading import Condition, Thread
+from time import monotonic
+
+STOPPED = '[Error] Convert tracker stopped!'
+
+class ConvertJob:
+    '''
+    Conversion of a video option, tracked by ConvertTracker. requested
+    keeps format and quality given to the quality policy, the option is
+    selected again from them when options are refreshed.
+    '''
+
+    def __init__(
+            self, info, format, quality, deadline, future, requested = None
+        ):
+        self.info      = info
+        self.format    = format
+        self.quality   = quality
+        self.requested = requested or ( format, quality )
+        self.deadline  = deadline
+        self.future    = future
+        self.polls     = 0
+        self.refreshed = False
+        self.started   = monotonic()
+
+        # POLLS RUN ON SUBMITTER CONTEXT, SO THEY COUNT ON ITS METRICS RUN
+        self.context   = copy_context()
+
+    def __repr__( self ):
+        return 'ConvertJob( {!r}, {!r}, {!r}, polls = {} )'.format(
+            self.info.vID, self.format, self.quality, self.polls
+        )
+
+class ConvertTracker:
+    '''
+    Convert jobs of a Y2mateClient requested by a fixed count of
+    worker threads. A job is requested again poll seconds after the
+    server says it's still converting, or right away when its request
+    timed out (the server keeps converting), until its deadline.
+
+        tracker = ConvertTracker( client, workers = 8 )
+        future  = tracker.submit( info, 'mp3', 128 )
+        link    = future.result()
+    '''
+
+    def __init__(
+            self, client, workers = 8, poll = 3, deadline = 600,
+            verbose = False
+        ):
+        '''
+        - client:   Y2mateClient that requests links.
+        - workers:  Convert requests in progress at once.
+        - poll:     Seconds between requests of a job still converting.
+        - deadline: Max seconds a job is waited for by default.
+        - verbose:  Show every job end.
+        '''
+        self.client    = client
+        self.workers   = max( 1, workers )
+        self.poll      = poll
+        self.deadline  = deadline
+        self.verbose   = verbose
+        self.stats     = { 'ready': 0, 'failed': 0, 'polls': 0 }
+        self.__pending = []
+        self.__order   = count()
+        self.__jobs    = 0
+        self.__changed = Condition()
+        self.__threads = []
+        self.__stopped = False
+
+    def __verbose( self, msg ):
+        if self.verbose:
+            print( msg )
+
+    def start( self ):
+        '''Start worker threads, submit starts them when needed'''
+
+        with self.__changed:
+            if self.__threads:
+                return self
+
+            self.__stopped = False
+
+            for i in range( self.workers ):
+                thread = Thread( target = self.__work, daemon = True )
+                thread.start()
+                self.__threads.append( thread )
+
+        return self
+
+    def stop( self ):
+        '''
+        Stop workers when they end their current request, pending jobs
+        fail with ConvertError.
+        '''
+        with self.__changed:
+            self.__stopped = True
+            pending, self.__pending = self.__pending, []
+            threads, self.__threads = self.__threads, []
+            self.__changed.notify_all()
+
+        for thread in threads:
+            thread.join()
+
+        for _, _, job in pending:
+            self.__fail( job, ConvertError( STOPPED ) )
+
+    def submit( self, info, format, quality = None, deadline = None ):
+        '''
+        Track conversion of info option selected by quality policy for
+        format and quality (see QualityPolicy) and return a Future of
+        its FileLink, which format may be a fallback one. Its exception
+        is Y2mateError when there is no link or ConvertError when it
+        isn't ready after deadline seconds (tracker deadline by default).
+        Unavailable formats are raised right away.
+        '''
+        from concurrent.futures import Future
+
+        option   = getQualityPolicy().select( info.options, format, quality )
+        deadline = self.deadline if deadline is None else deadline
+        job      = ConvertJob(
+            info, option.format, option.quality, monotonic() + deadline,
+            Future(), ( format, quality )
+        )
+
+        with self.__changed:
+            self.__jobs += 1
+
+        self.start()
+        self.__schedule( job, 0 )
+        return job.future
+
+    def getStats( self ):
+        '''Get count of jobs in progress, ready, failed and requests done'''
+
+        with self.__changed:
+            return dict( self.stats, converting = self.__jobs )
+
+    def __schedule( self, job, delay ):
+        with self.__changed:
+            stopped = self.__stopped
+
+            # NEVER WAIT PAST THE DEADLINE, THE JOB FAILS ON TIME
+            if not stopped:
+                due = min( monotonic() + delay, job.deadline )
+                heappush( self.__pending, ( due, next( self.__order ), job ) )
+                self.__changed.notify()
+
+        if stopped:
+            self.__fail( job, ConvertError( STOPPED ) )
+
+    def __next( self ):
+        '''Wait for the next due job, None when stopped'''
+
+        with self.__changed:
+            while not self.__stopped:
+                wait = None
+
+                if self.__pending:
+                    wait = self.__pending[0][0] - monotonic()
+
+                    if wait <= 0:
+                        return heappop( self.__pending )[2]
+
+                self.__changed.wait( wait )
+
+        return None
+
+    def __work( self ):
+        while True:
+            job = self.__next()
+
+            if job is None:
+                return
+
+            job.context.run( self.__poll, job )
+
+    def __end( self, job, stat ):
+        with self.__changed:
+            self.__jobs -= 1
+            self.stats[stat] += 1
+
+    def __fail( self, job, error ):
+        self.__end( job, 'failed' )
+        self.__verbose( 'Status: Link of {} {} {} failed {}'.format(
+            job.info.vID, job.format, job.quality, error
+        ) )
+        job.future.set_exception( error )
+
+    def __getRetryPolicy( self ):
+        '''
+        Client retry policy without timeout retries, a timed out convert
+        request is still converting and it's requested again by poll.
+        '''
+        policy = self.client.retry or getRetryPolicy()
+
+        return RetryPolicy(
+            policy.attempts, policy.backoff, policy.maxBackoff,
+            policy.rules - { 'timeout' }, policy.deadline
+        )
+
+    def __poll( self, job ):
+        client = self.client
+        left   = job.deadline - monotonic()
+        delay  = self.poll
+
+        if left <= 0:
+            return self.__fail( job, ConvertError(
+                '[Error] File not converted after {:.0f} s!'.format(
+                    monotonic() - job.started
+                )
+            ) )
+
+        job.polls += 1
+
+        with self.__changed:
+            self.stats['polls'] += 1
+
+        try:
+            link = client.getLink(
+                job.info, job.format, job.quality,
+                timeout = min( client.timeout, left ),
+                retry = self.__getRetryPolicy()
+            )
+        except ConvertError as e:
+            if job.refreshed or not job.info.cached or client.cache is None:
+                return self.__fail( job, e )
+
+            # STALE CACHED kID, OPTIONS ARE REQUESTED AGAIN ONCE
+            try:
+                client.cache.invalidate(
+                    job.info.vID, job.info.mp3Convert, job.info.host
+                )
+                job.info = client.getOptions(
+                    job.info.vID, job.info.mp3Convert, refresh = True
+                )
+                option = getQualityPolicy().select(
+                    job.info.options, *job.requested
+                )
+                job.format, job.quality = option.format, option.quality
+            except Exception as e:
+                return self.__fail( job, e )
+
+            job.refreshed = True
+            return self.__schedule( job, 0 )
+        except Exception as e:
+            if getErrorKind( e ) != 'timeout':
+                return self.__fail( job, e )
+
+            # REQUEST HELD UNTIL TIMEOUT, THE SERVER IS STILL CONVERTING
+            link, delay = None, 0
+
+        if link is None:
+            return self.__schedule( job, delay )
+
+        self.__end( job, 'ready' )
+        self.__verbose( 'Status: Link of {} {} {} ready in {:.1f} s'.format(
+            job.info.vID, job.format, job.quality, monotonic() - job.started
+        ) )
+        job.future.set_result( link )
@@ -0,0 +1,848 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from Checksum import StreamHasher
+from Metrics import ThroughputMeter, getMetrics
+from Profiler import getProfiler
+from Progress import getProgress
+from RateLimiter import RateLimiter
+from Request import Request
+from RequestUtils import urlGetNetloc
+from Retry import getErrorKind, getRetryPolicy
+from SessionPool import getSessionPool
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from os import path, remove, replace
+import os
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+import json
+
+class DownloadError( Exception ):
+    '''Error raised when a file can't be downloaded'''
+    pass
+
+class TruncatedError( DownloadError ):
+    '''
+    Error raised when a stream ends before its content-length, it's
+    retried from the last written byte like a dropped connection.
+    '''
+    pass
+
+class StatusError( DownloadError ):
+    '''
+    Error raised when a range request is answered with an error status
+    (after retry policy). The '.part' file and its sidecar are kept, so
+    a new attempt continues the download.
+    '''
+
+    def __init__( self, msg, status ):
+        super().__init__( msg )
+        self.status = status
+
+class RestartError( DownloadError ):
+    '''
+    Error raised when a range request is answered with the whole file
+    (HTTP 200), the download starts again on res stream.
+    '''
+
+    def __init__( self, res ):
+        super().__init__( '[Error] Range request answered with HTTP 200!' )
+        self.res = res
+
+class Downloader:
+    '''
+    Save files from HTTP responses, on a single stream or split on
+    byte ranges fetched in parallel (HTTP Range).
+
+    Files are written at '<filePath>.part' with a '<filePath>.part.json'
+    sidecar that keeps the progress of every range, so an interrupted
+    download is continued from its last saved byte on next run and
+    renamed to filePath only when it's complete. A file is complete
+    when its byte count is its content-length, streams that end before
+    it are requested again from their last byte.
+
+    Checksums (see Checksum.ALGORITHMS) are computed while the file is
+    written, so it's never read again to hash it.
+
+    With writeBuffers every range is written by a WriterThread, so
+    reads from the network go on while a slow disk (i.e. NFS) writes.
+    '''
+
+    # ADAPTIVE CHUNK SIZE LIMITS
+    MIN_CHUNK = 64 * 1024
+    MAX_CHUNK = 4 * 1024 * 1024
+
+    def __init__(
+            self, segments = 1, chunk = 'auto', minSegmentSize = 1024 * 1024,
+            timeout = 60, checkpoint = 4 * 1024 * 1024, verify = True,
+            limiter = None, fileRate = 0, checksums = [], writeBuffers = 0,
+            fsync = False, debug = False
+        ):
+        '''
+        - segments:       Max parallel connections for one file.
+        - chunk:          Bytes read on every stream iteration. With 'auto'
+                          it grows while reads are fast and shrinks when
+                          they are slow, between MIN_CHUNK and MAX_CHUNK.
+        - minSegmentSize: Files are never split on smaller segments.
+        - timeout:        Timeout for segment requests.
+        - checkpoint:     Bytes written by a range between sidecar saves.
+        - verify:         Verify SSL certificates of file hosts.
+        - limiter:        RateLimiter shared by all downloads.
+        - fileRate:       Bytes/sec limit of every download, 0 is
+                          unlimited.
+        - checksums:      Checksum algorithms of saved files.
+        - writeBuffers:   Buffers of chunk bytes filled by the network
+                          while a writer thread saves them, 0 writes on
+                          the reading thread.
+        - fsync:          Flush completed files to disk before they're
+                          renamed.
+        - debug:          Show debug info about HTTP requests.
+        '''
+        self.segments       = max( 1, segments )
+        self.chunk          = chunk
+        self.minSegmentSize = minSegmentSize
+        self.timeout        = timeout
+        self.checkpoint     = checkpoint
+        self.verify         = verify
+        self.limiter        = limiter
+        self.fileRate       = fileRate
+        self.checksums      = list( checksums )
+        self.writeBuffers   = writeBuffers
+        self.fsync          = fsync
+        self.debug          = debug
+
+    def getRanges( self, size ):
+        '''
+        Split size bytes on [ start, end, done ] ranges, end is inclusive
+        and done is the count of bytes already saved.
+        '''
+
+        segments = min( self.segments, max( 1, size // self.minSegmentSize ) )
+        step = size // segments
+
+        ranges = [
+            [ i * step, ( i + 1 ) * step - 1, 0 ] for i in range( segments )
+        ]
+        ranges[-1][1] = size - 1
+
+        return ranges
+
+    def save(
+            self, res, filePath, link, headers = {}, desc = '', meter = None
+        ):
+        '''
+        Save streamed response res (HTTP 200) at filePath and return
+        download stats dict ( bytes, resumed, size, seconds, segments,
+        peak, checksums ), size is content-length (0 when unknown). With
+        writeBuffers waits of the network and disk sides are added (see
+        WriterThread.stats).
+        Saved bytes and time are added to current metrics run. A given
+        ThroughputMeter lets callers follow the progress, its total is
+        set to the bytes left. The download is followed by process wide
+        Progress as desc (file name by default).
+
+        When a compatible '.part' file exists its pending ranges are
+        requested with Range and If-Range. When segments > 1 and the
+        server answers Range requests with HTTP 206, the file is fetched
+        on parallel segments over link. Otherwise res is saved on a
+        single stream.
+        '''
+        size  = int( res.headers.get( 'content-length', 0 ) )
+        meta  = {
+            'link':         link,
+            'size':         size,
+            'etag':         res.headers.get( 'etag' ),
+            'lastModified': res.headers.get( 'last-modified' ),
+            'ranges':       None
+        }
+        start = monotonic()
+
+        # CONTINUE PREVIOUS DOWNLOAD OR START A NEW ONE
+        # ---------------------------------------------------------------------
+        saved = self.loadPart( filePath, meta )
+
+        if saved is not None:
+            meta['ranges'] = saved['ranges']
+            # KEEP VALIDATORS THE PART FILE WAS DOWNLOADED WITH
+            meta['etag'] = saved['etag'] or meta['etag']
+            meta['lastModified'] = saved['lastModified'] or meta['lastModified']
+        elif size > 0:
+            meta['ranges'] = self.getRanges( size )
+        else:
+            meta['ranges'] = [ [ 0, -1, 0 ] ]
+        # ---------------------------------------------------------------------
+
+        metrics  = getMetrics()
+        profiler = getProfiler()
+        initial  = sum( r[2] for r in meta['ranges'] )
+
+        if meter is None:
+            meter = ThroughputMeter()
+
+        meter.total = max( 0, size - initial )
+
+        # PROGRESS IS READ FROM meter, THE DOWNLOAD LOOP ONLY UPDATES IT
+        progress = getProgress()
+        transfer = None if progress is None else progress.start(
+            desc or path.basename( filePath ), meter, initial
+        )
+        ok       = False
+        waits    = {}
+
+        # KEEP A POOLED CONNECTION FOR EVERY SEGMENT OF EVERY DOWNLOAD FROM
+        # HOST, A RESTART ONLY NEEDS ONE
+        host     = urlGetNetloc( meta['link'] )
+        segments = max( 1, len( [
+            r for r in meta['ranges'] if r[0] + r[2] <= r[1] or r[1] < 0
+        ] ) )
+        getSessionPool().reserveHostPool( host, segments )
+
+        try:
+            with metrics.phase( 'download' ), profiler.phase( 'download' ):
+                try:
+                    resumed, checksums = self.__savePart(
+                        res, filePath, meta, headers, transfer,
+                        self.getFileLimiter(), meter, waits
+                    )
+                finally:
+                    getSessionPool().releaseHostPool( host, segments )
+                    metrics.add( 'bytes', meter.bytes )
+                    metrics.setPeak( meter.getPeak() )
+
+            written = sum( r[2] for r in meta['ranges'] )
+
+            if meta['size'] > 0 and written != meta['size']:
+                raise DownloadError(
+                    '[Error] Downloaded {} of {} bytes!'.format(
+                        written, meta['size']
+                    )
+                )
+
+            ok = True
+        finally:
+            if transfer is not None:
+                progress.end( transfer, ok )
+
+        # DOWNLOAD COMPLETED
+        if self.fsync:
+            syncFile( filePath + '.part' )
+
+        replace( filePath + '.part', filePath )
+
+        if path.exists( filePath + '.part.json' ):
+            remove( filePath + '.part.json' )
+
+        # RENAME IS KEPT TOO
+        if self.fsync:
+            syncFile( path.dirname( path.abspath( filePath ) ) )
+
+        return dict( waits, **{
+            'bytes':    written - resumed,
+            'resumed':  resumed,
+            'seconds':  monotonic() - start,
+            'size':      meta['size'],
+            'segments':  len( meta['ranges'] ),
+            'peak':      meter.getPeak(),
+            'checksums': checksums
+        } )
+
+    def getFileLimiter( self ):
+        '''
+        Get rate limiter for a new download, segments of the same file
+        share it.
+        '''
+        if self.fileRate > 0:
+            return RateLimiter( self.fileRate, parent = self.limiter )
+
+        return self.limiter
+
+    def loadPart( self, filePath, meta ):
+        '''Load sidecar of filePath '.part' file, see loadPart'''
+
+        return loadPart( filePath, meta )
+
+    def savePartMeta( self, filePath, meta ):
+        '''Write sidecar of filePath '.part' file, see savePartMeta'''
+
+        savePartMeta( filePath, meta )
+
+    def __rangeRequest( self, link, headers, byteRange, meta ):
+        '''Do streamed GET request of byteRange pending bytes'''
+
+        headers = dict( headers )
+        headers['Range'] = 'bytes={}-{}'.format(
+            byteRange[0] + byteRange[2], byteRange[1]
+        )
+
+        # ONLY GET PARTIAL CONTENT FROM THE SAME FILE
+        validator = meta['etag'] or meta['lastModified']
+        if validator:
+            headers['If-Range'] = validator
+
+        req = Request(
+            url = link, headers = headers, stream = True,
+            timeout = self.timeout, debug = self.debug
+        )
+
+        if not self.verify:
+            req.disableSSLVerification()
+
+        return req.do()
+
+    def __savePart(
+            self, res, filePath, meta, headers, transfer, limiter, meter,
+            waits
+        ):
+        '''
+        Fetch pending ranges of meta in parallel and write them at their
+        offset of '.part' file. A range starting at byte 0 is read from
+        res, the others are requested over meta link. Return the count
+        of bytes that were already saved and the file checksums. Writer
+        waits of every range are added to waits dict.
+
+        A range whose stream drops (connection, timeout or truncated) is
+        requested again from its last written byte, according retry
+        policy. When a range request is answered with the whole file
+        (HTTP 200) the download starts again on its stream, error
+        statuses are raised as StatusError.
+        '''
+        partPath = filePath + '.part'
+        ranges   = meta['ranges']
+        pending  = [ r for r in ranges if r[0] + r[2] <= r[1] or r[1] < 0 ]
+        probe    = None
+
+        # PROBE RANGE SUPPORT WITH FIRST RANGE NOT READ FROM res
+        # ---------------------------------------------------------------------
+        toRequest = [ r for r in pending if r[0] + r[2] > 0 ]
+
+        if len( toRequest ) > 0:
+            probe = self.__rangeRequest(
+                meta['link'], headers, toRequest[0], meta
+            )
+
+            # ERROR PAGES (503, 416...) AREN'T THE FILE, KEEP .part AND ITS
+            # SIDECAR FOR THE NEXT ATTEMPT
+            if probe.status_code not in [ 200, 206 ]:
+                probe.close()
+                res.close()
+                raise StatusError(
+                    '[Server Error]: HTTP {} on range request!'.format(
+                        probe.status_code
+                    ),
+                    probe.status_code
+                )
+
+            # RANGE IGNORED OR FILE CHANGED, START AGAIN ON A SINGLE STREAM
+            if probe.status_code == 200:
+                res.close()
+                res, probe = probe, None
+                self.__restart( res, meta, meter, transfer )
+                pending = list( ranges )
+
+        if not any( r[0] + r[2] == 0 for r in pending ):
+            res.close()
+        # ---------------------------------------------------------------------
+
+        lock     = Lock()
+        stop     = Event()
+        resumed  = 0
+        hasher   = None
+        policy   = getRetryPolicy()
+        restarts = 0
+
+        def prepare():
+            nonlocal resumed, hasher
+
+            # PREALLOCATE FILE FOR NEW DOWNLOADS
+            resumed = sum( r[2] for r in ranges )
+
+            if resumed == 0:
+                preallocate( partPath, meta['size'] )
+
+            if meta['size'] > 0:
+                self.savePartMeta( filePath, meta )
+
+            if self.checksums:
+                hasher = StreamHasher( partPath, self.checksums, ranges )
+
+        def checkpoint():
+            if meta['size'] > 0:
+                with lock:
+                    self.savePartMeta( filePath, meta )
+
+        def fetch( byteRange ):
+            nonlocal probe
+
+            if byteRange[0] + byteRange[2] == 0:
+                segment = res
+            elif probe is not None and byteRange is toRequest[0]:
+                segment, probe = probe, None
+            else:
+                segment = self.__rangeRequest(
+                    meta['link'], headers, byteRange, meta
+                )
+
+            started = monotonic()
+            attempt = 0
+
+            while True:
+                # WHOLE FILE GIVEN, THE FIRST ONE RESTARTS THE DOWNLOAD
+                if segment is not res and segment.status_code == 200:
+                    if stop.is_set():
+                        segment.close()
+                        return
+
+                    stop.set()
+                    raise RestartError( segment )
+
+                if segment is not res and segment.status_code != 206:
+                    segment.close()
+                    raise StatusError(
+                        '[Server Error]: HTTP {} on segment {}-{}!'.format(
+                            segment.status_code, byteRange[0], byteRange[1]
+                        ),
+                        segment.status_code
+                    )
+
+                try:
+                    self.__saveRange( segment, partPath, byteRange, lock, \
+                        stop, checkpoint, limiter, meter, hasher, waits )
+                    return
+                except Exception as e:
+                    kind  = 'connection' if isinstance( e, TruncatedError ) \
+                        else getErrorKind( e )
+                    delay = None
+
+                    # ONLY KNOWN SIZE RANGES CAN BE CONTINUED
+                    if kind is not None and policy.isRetryError( kind ) \
+                        and meta['size'] > 0 and not stop.is_set():
+                        delay = policy.next( attempt, started )
+
+                    if delay is None:
+                        raise
+
+                if self.debug:
+                    print( '[Retry] {} on segment {}-{}, retrying in {:.1f} s...' \
+                        .format( kind, byteRange[0], byteRange[1], delay ) )
+
+                sleep( delay )
+                attempt += 1
+                getMetrics().add( 'retries' )
+                segment = self.__rangeRequest(
+                    meta['link'], headers, byteRange, meta
+                )
+
+        prepare()
+
+        while True:
+            try:
+                if len( pending ) == 1:
+                    fetch( pending[0] )
+                elif len( pending ) > 1:
+                    error = None
+
+                    with ThreadPoolExecutor(
+                        max_workers = len( pending )
+                    ) as pool:
+                        # SEGMENTS KEEP CURRENT METRICS RUN
+                        fetchSegment = getProfiler().wrap( 'download', fetch )
+                        futures      = [
+                            pool.submit( copy_context().run, fetchSegment, r )
+                            for r in pending
+                        ]
+
+                        try:
+                            [ f.result() for f in futures ]
+                        except BaseException as e:
+                            # LET OTHER SEGMENTS SAVE THEIR PROGRESS AND STOP
+                            stop.set()
+                            error = e
+
+                    if error is not None:
+                        # A RESTART WINS OVER ERRORS OF SEGMENTS IT STOPPED
+                        for f in futures:
+                            if isinstance( f.exception(), RestartError ):
+                                raise f.exception()
+                        raise error
+
+                break
+            except RestartError as e:
+                restarts += 1
+
+                # A SERVER THAT KEEPS DROPPING AND IGNORING RANGE FAILS
+                if restarts > policy.attempts:
+                    e.res.close()
+                    raise DownloadError(
+                        '[Error] Download restarted {} times!'.format(
+                            restarts
+                        )
+                    )
+
+                if self.debug:
+                    print( '[Retry] Range ignored, downloading {} again...' \
+                        .format( path.basename( filePath ) ) )
+
+                res.close()
+                res  = e.res
+                stop = Event()
+                self.__restart( res, meta, meter, transfer )
+                pending = list( ranges )
+                prepare()
+            finally:
+                if probe is not None:
+                    probe.close()
+                    probe = None
+                checkpoint()
+
+        return resumed, hasher.finish() if hasher is not None else {}
+
+    def __restart( self, res, meta, meter, transfer ):
+        '''
+        Start meta download again on res, a whole file stream (HTTP 200),
+        its size and validators replace the ones of meta.
+        '''
+        meta['size']         = int( res.headers.get( 'content-length', 0 ) )
+        meta['etag']         = res.headers.get( 'etag' )
+        meta['lastModified'] = res.headers.get( 'last-modified' )
+        meta['ranges'][:]    = [ [ 0, meta['size'] - 1, 0 ] ]
+        meter.total          = meta['size']
+
+        if transfer is not None:
+            transfer.initial = 0
+
+    def __saveRange(
+            self, res, partPath, byteRange, lock, stop, checkpoint,
+            limiter = None, meter = None, hasher = None, waits = None
+        ):
+        '''
+        Write range response at its file offset. Range done count is
+        updated only with written data, written data is given to hasher.
+        Raise TruncatedError when the stream ends before the range.
+
+        Body is read straight from the raw stream into reusable buffers
+        and written unbuffered, so there is no bytes object or extra
+        copy per chunk. With writeBuffers they are written by a
+        WriterThread while next ones are read, its waits are added to
+        waits dict.
+        '''
+        # UNKNOWN SIZE, READ UNTIL END OF STREAM
+        if byteRange[1] < 0:
+            left = float( 'inf' )
+        else:
+            left = byteRange[1] - byteRange[0] - byteRange[2] + 1
+
+        adaptive = self.chunk == 'auto'
+        chunk    = self.MIN_CHUNK if adaptive else int( self.chunk )
+        capacity = self.MAX_CHUNK if adaptive else chunk
+        buffer   = None
+        writer   = None
+        read     = byteRange[2]
+        unsaved  = 0
+
+        def getWritten():
+            '''Get range bytes on file'''
+            if writer is None:
+                return read
+
+            return writer.position - byteRange[0]
+
+        # DECODE CONTENT-ENCODING LIKE iter_content DOES
+        res.raw.decode_content = True
+
+        try:
+            with open( partPath, 'r+b', buffering = 0 ) as f:
+                f.seek( byteRange[0] + read )
+
+                if self.writeBuffers > 0:
+                    writer = WriterThread(
+                        f, byteRange[0] + read, self.writeBuffers, capacity,
+                        None if hasher is None else hasher.update
+                    )
+                else:
+                    buffer = memoryview( bytearray( capacity ) )
+
+                try:
+                    while left > 0 and not stop.is_set():
+                        if writer is not None:
+                            buffer = writer.getBuffer()
+
+                        start = monotonic()
+                        size  = res.raw.readinto( buffer[:min( chunk, left )] )
+
+                        if writer is not None:
+                            writer.put( buffer, size )
+                        elif size:
+                            writeAll( f, buffer[:size] )
+
+                            if hasher is not None:
+                                hasher.update(
+                                    byteRange[0] + read, buffer[:size]
+                                )
+
+                        if not size:
+                            break
+
+                        left    -= size
+                        read    += size
+                        unsaved += size
+
+                        if meter is not None:
+                            with lock:
+                                meter.update( size )
+
+                        if limiter is not None:
+                            limiter.consume( size )
+
+                        # FEWER READS WHILE THEY ARE FAST, SMALLER ON SLOW LINKS
+                        if adaptive:
+                            elapsed = monotonic() - start
+
+                            if elapsed < 0.05 and size == chunk:
+                                chunk = min( chunk * 2, self.MAX_CHUNK )
+                            elif elapsed > 0.5:
+                                chunk = max( chunk // 2, self.MIN_CHUNK )
+
+                        # SAVE PROGRESS ON SIDECAR
+                        if unsaved >= self.checkpoint:
+                            byteRange[2] = getWritten()
+                            unsaved = 0
+                            checkpoint()
+                finally:
+                    # READ DATA IS WRITTEN, WRITER ERRORS DON'T HIDE OTHERS
+                    if writer is not None:
+                        writer.close( check = False )
+
+                        with lock:
+                            for k, v in writer.stats.items():
+                                waits[k] = waits.get( k, 0 ) + v
+
+                if writer is not None:
+                    writer.check()
+
+            if left > 0 and left != float( 'inf' ) and not stop.is_set():
+                raise TruncatedError(
+                    '[Error] Stream of {}-{} ended {} bytes early!'.format(
+                        byteRange[0], byteRange[1], left
+                    )
+                )
+        finally:
+            byteRange[2] = getWritten()
+            res.close()
+
+class WriterThread:
+    '''
+    Writes of a file on their own thread. The reader fills one of
+    buffers with getBuffer and gives it back with put, the writer
+    thread writes it at position and makes it free again. When every
+    buffer is waiting to be written getBuffer waits, so a slow disk
+    slows the reader down instead of piling data up. Writer errors are
+    raised to the reader on its next getBuffer, put or close.
+
+        writer = WriterThread( f, offset, 4, chunk )
+        buffer = writer.getBuffer()
+        writer.put( buffer, res.raw.readinto( buffer ) )
+        writer.close()
+
+    Stats are diskWaits / diskWait, times (seconds) the reader waited
+    for a free buffer, and netWaits / netWait, times the writer waited
+    for data.
+    '''
+
+    def __init__( self, f, offset, buffers, size, onWrite = None ):
+        '''
+        - f:       Unbuffered file open for writing, at offset.
+        - offset:  File position of first byte.
+        - buffers: Buffers at once, at least 2 to overlap reads.
+        - size:    Bytes of every buffer.
+        - onWrite: Called with offset and data of every write.
+        '''
+        self.f        = f
+        self.position = offset
+        self.onWrite  = onWrite
+        self.stats    = {
+            'diskWaits': 0, 'diskWait': 0, 'netWaits': 0, 'netWait': 0
+        }
+        self.__free   = Queue()
+        self.__queued = Queue()
+        self.__error  = None
+        self.__closed = False
+
+        for _ in range( max( 2, buffers ) ):
+            self.__free.put( memoryview( bytearray( size ) ) )
+
+        # WRITES COUNT ON CALLER METRICS RUN AND DOWNLOAD PROFILE
+        self.__thread = Thread(
+            target = copy_context().run, daemon = True,
+            args = ( getProfiler().wrap( 'download', self.__run ), )
+        )
+        self.__thread.start()
+
+    def __get( self, queue, side ):
+        '''Get next item of queue, counting waits of side'''
+
+        try:
+            return queue.get_nowait()
+        except Empty:
+            pass
+
+        start = monotonic()
+        item  = queue.get()
+        self.stats[side + 'Waits'] += 1
+        self.stats[side + 'Wait']  += monotonic() - start
+        return item
+
+    def __run( self ):
+        while True:
+            item = self.__get( self.__queued, 'net' )
+
+            if item is None:
+                return
+
+            buffer, size = item
+
+            try:
+                # AFTER AN ERROR BUFFERS ARE ONLY MADE FREE
+                if self.__error is None and size:
+                    writeAll( self.f, buffer[:size] )
+
+                    if self.onWrite is not None:
+                        self.onWrite( self.position, buffer[:size] )
+
+                    self.position += size
+            except BaseException as e:
+                self.__error = e
+            finally:
+                self.__free.put( buffer )
+
+    def check( self ):
+        '''Raise writer error, if any'''
+
+        if self.__error is not None:
+            raise self.__error
+
+    def getBuffer( self ):
+        '''Get a free buffer, wait while every one is queued'''
+
+        self.check()
+        return self.__get( self.__free, 'disk' )
+
+    def put( self, buffer, size ):
+        '''Queue size bytes of buffer to be written, 0 makes it free'''
+
+        self.__queued.put( ( buffer, size ) )
+        self.check()
+
+    def close( self, check = True ):
+        '''Wait until queued buffers are written, then check errors'''
+
+        if not self.__closed:
+            self.__closed = True
+            self.__queued.put( None )
+            self.__thread.join()
+
+        if check:
+            self.check()
+
+def writeAll( f, data ):
+    '''Write all data on unbuffered file f, raw writes may be partial'''
+
+    while len( data ) > 0:
+        data = data[f.write( data ):]
+
+def syncFile( filePath ):
+    '''Flush file or folder filePath to disk'''
+
+    fd = os.open( filePath, os.O_RDONLY )
+
+    try:
+        os.fsync( fd )
+    finally:
+        os.close( fd )
+
+def loadPart( filePath, meta ):
+    '''
+    Load sidecar of filePath '.part' file. Return it when can be
+    continued with meta (same size and validators), None otherwise.
+    '''
+    partPath = filePath + '.part'
+    metaPath = filePath + '.part.json'
+
+    if not path.isfile( partPath ) or not path.isfile( metaPath ):
+        return None
+
+    try:
+        with open( metaPath, 'r' ) as f:
+            saved = json.load( f )
+    except ( OSError, ValueError ):
+        return None
+
+    # SAME FILE ONLY WHEN SIZE AND KNOWN VALIDATORS MATCH
+    if meta['size'] <= 0 or saved.get( 'size' ) != meta['size']:
+        return None
+
+    for k in [ 'etag', 'lastModified' ]:
+        if saved.get( k ) and meta[k] and saved[k] != meta[k]:
+            return None
+
+    if path.getsize( partPath ) != meta['size']:
+        return None
+
+    return saved
+
+def savePartMeta( filePath, meta ):
+    '''Write sidecar of filePath '.part' file'''
+
+    metaPath = filePath + '.part.json'
+
+    with open( metaPath + '.tmp', 'w' ) as f:
+        json.dump( meta, f )
+    replace( metaPath + '.tmp', metaPath )
+
+def preallocate( filePath, size ):
+    '''
+    Create filePath with size bytes reserved on disk. posix_fallocate
+    is used where available, so blocks are not allocated on every
+    write; otherwise the file is truncated to size.
+    '''
+    with open( filePath, 'wb' ) as f:
+        if size <= 0:
+            return
+
+        if hasattr( os, 'posix_fallocate' ):
+            try:
+                os.posix_fallocate( f.fileno(), 0, size )
+                return
+            except OSError:
+                # NOT SUPPORTED BY FILE SYSTEM
+                pass
+
+        f.truncate( size )
+
+def formatStats( stats ):
+    '''Get download stats in human readable string'''
+
+    mb = stats['bytes'] / ( 1024 * 1024 )
+    seconds = max( stats['seconds'], 1e-6 )
+
+    output = 'Downloaded {:.2f} MB in {:.2f} s ({:.2f} MB/s, {} segment{})' \
+        .format(
+            mb, seconds, mb / seconds, stats['segments'],
+            '' if stats['segments'] == 1 else 's'
+        )
+
+    if stats.get( 'resumed', 0 ) > 0:
+        output += ', resumed from {:.2f} MB'.format(
+            stats['resumed'] / ( 1024 * 1024 )
+        )
+
+    # WRITER THREAD WAITS, SLOW DISK OR SLOW NETWORK
+    if 'diskWaits' in stats:
+        output += ', waited {} times on disk ({:.2f} s), {} on network ' \
+            '({:.2f} s)'.format(
+                stats['diskWaits'], stats['diskWait'], stats['netWaits'],
+                stats['netWait']
+            )
+
+    return output
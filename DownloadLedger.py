@@ -0,0 +1,233 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from Y2mateApi import getFilePath
+from os import link, makedirs, path, replace
+from threading import Lock
+from time import time
+
+# LEDGER POLICIES
+# ------------------------------------------------------------------------------
+# verify, how a recorded file is checked before it's used:
+# - none:     Only that it exists.
+# - size:     Same size as recorded.
+# - checksum: Same SHA-256 as recorded (reads the whole file).
+#
+# mode, how a recorded file is given when it's asked on another path:
+# - skip: Recorded path is returned as is.
+# - link: Hard link at the asked path (copy across file systems).
+# - copy: Copy at the asked path.
+# ------------------------------------------------------------------------------
+VERIFY_POLICIES = [ 'none', 'size', 'checksum' ]
+MODES = [ 'skip', 'link', 'copy' ]
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS downloads (
+    vID      TEXT    NOT NULL,
+    format   TEXT    NOT NULL,
+    quality  INTEGER NOT NULL,
+    path     TEXT    NOT NULL,
+    size     INTEGER NOT NULL,
+    checksum TEXT    NOT NULL,
+    created  REAL    NOT NULL,
+    PRIMARY KEY ( vID, format, quality )
+)
+'''
+
+def getFileChecksum( filePath, blockSize = 1024 * 1024 ):
+    '''Get SHA-256 hex digest of filePath content'''
+    from hashlib import sha256
+
+    digest = sha256()
+
+    with open( filePath, 'rb' ) as f:
+        for block in iter( lambda: f.read( blockSize ), b'' ):
+            digest.update( block )
+
+    return digest.hexdigest()
+
+class DownloadLedger:
+    '''
+    SQLite ledger of completed downloads, one entry per
+    ( vID, format, quality ) with the path, size and checksum of the
+    saved file. A download that is already on the ledger (and passes
+    verify policy) is given from disk without any request. Thread safe.
+    '''
+
+    def __init__( self, filePath, verify = 'size', mode = 'skip' ):
+        '''
+        - filePath: SQLite database, its folder is created when it
+                    doesn't exist.
+        - verify:   Check of recorded files, see VERIFY_POLICIES.
+        - mode:     How recorded files are given on another path, see
+                    MODES.
+        '''
+        import sqlite3
+
+        folder = path.dirname( filePath )
+
+        if folder:
+            makedirs( folder, exist_ok = True )
+
+        self.filePath = filePath
+        self.verify   = verify
+        self.mode     = mode
+        self.__lock   = Lock()
+        self.__db     = sqlite3.connect(
+            filePath, timeout = 30, check_same_thread = False
+        )
+
+        with self.__lock, self.__db:
+            self.__db.execute( SCHEMA )
+
+    def close( self ):
+        with self.__lock:
+            self.__db.close()
+
+    def get( self, vID, format, quality = None ):
+        '''
+        Get entry dict of key, None when it's not recorded. When quality
+        is None the best recorded quality is given, like max quality is
+        selected from options.
+        '''
+        query = 'SELECT vID, format, quality, path, size, checksum, ' \
+            + 'created FROM downloads WHERE vID = ? AND format = ?'
+        params = [ vID, format ]
+
+        if quality is None:
+            query += ' ORDER BY quality DESC LIMIT 1'
+        else:
+            query += ' AND quality = ?'
+            params.append( quality )
+
+        with self.__lock:
+            row = self.__db.execute( query, params ).fetchone()
+
+        if row is None:
+            return None
+
+        return dict( zip(
+            [ 'vID', 'format', 'quality', 'path', 'size', 'checksum',
+                'created' ],
+            row
+        ) )
+
+    def add( self, vID, format, quality, filePath, checksum = None ):
+        '''
+        Record saved filePath of key, its checksum is computed when it
+        isn't given.
+        '''
+        filePath = path.abspath( filePath )
+
+        if checksum is None:
+            checksum = getFileChecksum( filePath )
+
+        with self.__lock, self.__db:
+            self.__db.execute(
+                'INSERT OR REPLACE INTO downloads VALUES ' \
+                    + '( ?, ?, ?, ?, ?, ?, ? )',
+                (
+                    vID, format, quality, filePath, path.getsize( filePath ),
+                    checksum, time()
+                )
+            )
+
+    def remove( self, vID, format, quality ):
+        '''Remove entry of key'''
+
+        with self.__lock, self.__db:
+            self.__db.execute(
+                'DELETE FROM downloads WHERE vID = ? AND format = ? ' \
+                    + 'AND quality = ?',
+                ( vID, format, quality )
+            )
+
+    def isValid( self, entry ):
+        '''Check recorded file of entry according verify policy'''
+
+        filePath = entry['path']
+
+        if not path.isfile( filePath ):
+            return False
+
+        if self.verify == 'none':
+            return True
+
+        if path.getsize( filePath ) != entry['size']:
+            return False
+
+        if self.verify == 'checksum':
+            return getFileChecksum( filePath ) == entry['checksum']
+
+        return True
+
+    def find( self, vID, format, quality = None ):
+        '''
+        Get entry of key when its file passes verify policy, None
+        otherwise (failed entries are removed).
+        '''
+        entry = self.get( vID, format, quality )
+
+        if entry is None:
+            return None
+
+        if not self.isValid( entry ):
+            self.remove( entry['vID'], entry['format'], entry['quality'] )
+            return None
+
+        return entry
+
+    def place( self, entry, filePath ):
+        '''
+        Give recorded file of entry at filePath according mode and return
+        the path it's at. Another file on filePath is never replaced.
+        '''
+        from shutil import copyfile
+
+        filePath = path.abspath( filePath )
+
+        if self.mode == 'skip':
+            return entry['path']
+
+        # ALREADY THERE
+        if path.isfile( filePath ):
+            if path.samefile( filePath, entry['path'] ):
+                return filePath
+
+            return entry['path']
+
+        tmpPath = filePath + '.tmp'
+
+        if self.mode == 'link':
+            try:
+                link( entry['path'], tmpPath )
+            except OSError:
+                copyfile( entry['path'], tmpPath )
+        else:
+            copyfile( entry['path'], tmpPath )
+
+        replace( tmpPath, filePath )
+        return filePath
+
+    def fetch(
+            self, vID, format, quality = None, useCurrentDir = False,
+            folder = None
+        ):
+        '''
+        Get path of recorded file of key, given on the folder it would
+        be downloaded to (see place). None when it isn't recorded or
+        doesn't pass verify policy.
+        '''
+        entry = self.find( vID, format, quality )
+
+        if entry is None:
+            return None
+
+        fileName, filePath = getFilePath(
+            path.basename( entry['path'] ), format, useCurrentDir
+        )
+
+        if folder:
+            filePath = path.join( folder, fileName )
+
+        return self.place( entry, filePath )
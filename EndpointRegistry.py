@@ -0,0 +1,277 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Registry of y2mate API endpoints with health tracking. Every endpoint
+kind (analyze, mp3Analyze, convert, mp3Convert) has candidate URLs: the
+path on base URL, the same path on every mirror and any registered one.
+Requests go to the fastest healthy candidate and fail over to the next
+ones, and health is saved on disk so a new run doesn't try a dead
+endpoint first. A kID is only known by the host whose analyze gave it,
+so convert candidates can be limited to that host.
+'''
+
+from ProcessWide import ProcessWide
+from Y2mateApi import ENDPOINT_PATHS, getBaseURL
+from os import getpid, makedirs, path, replace
+from threading import Lock
+from time import monotonic, time
+from urllib.parse import urlsplit
+import json
+
+# ENDPOINT HEALTH
+# ------------------------------------------------------------------------------
+# - latency:  Rolling seconds of successful requests (exponentially
+#             weighted by alpha).
+# - errors:   Rolling rate of failed requests, 0 to 1.
+# - failures: Consecutive failures. An endpoint is down for cooldown
+#             seconds after a failure, doubled on every consecutive one
+#             (up to maxCooldown). Down endpoints are tried last.
+# ------------------------------------------------------------------------------
+
+def getHost( url ):
+    '''Get scheme and host of endpoint url ( 'https://host:port' )'''
+
+    parts = urlsplit( url )
+    return '{}://{}'.format( parts.scheme, parts.netloc ).lower()
+
+class EndpointHealth:
+    '''Health of an endpoint URL, see ENDPOINT HEALTH'''
+
+    def __init__(
+            self, latency = None, errors = 0, failures = 0, failed = 0,
+            requests = 0
+        ):
+        self.latency  = latency
+        self.errors   = errors
+        self.failures = failures
+        self.failed   = failed
+        self.requests = requests
+
+    @classmethod
+    def fromDict( cls, data ):
+        return cls(
+            data.get( 'latency' ), data.get( 'errors', 0 ),
+            data.get( 'failures', 0 ), data.get( 'failed', 0 ),
+            data.get( 'requests', 0 )
+        )
+
+    def toDict( self ):
+        return {
+            'latency':  self.latency,
+            'errors':   self.errors,
+            'failures': self.failures,
+            'failed':   self.failed,
+            'requests': self.requests
+        }
+
+    def update( self, seconds, ok, alpha ):
+        '''Count a request that took seconds, ok or failed'''
+
+        self.requests += 1
+        self.errors    = ( 1 - alpha ) * self.errors \
+            + ( 0 if ok else alpha )
+
+        if not ok:
+            self.failures += 1
+            self.failed    = time()
+            return
+
+        self.failures = 0
+        self.latency  = seconds if self.latency is None \
+            else ( 1 - alpha ) * self.latency + alpha * seconds
+
+    def getDownUntil( self, cooldown, maxCooldown ):
+        '''Get wall time the endpoint is down until, 0 when it's up'''
+
+        if self.failures == 0:
+            return 0
+
+        return self.failed + min(
+            maxCooldown, cooldown * 2 ** ( self.failures - 1 )
+        )
+
+    def getScore( self ):
+        '''Get rank of an up endpoint, lower is better'''
+
+        return ( self.latency or 0 ) * ( 1 + 4 * self.errors )
+
+class EndpointRegistry:
+    '''
+    Candidate URLs of every endpoint kind and their health. Thread safe.
+
+        registry = EndpointRegistry( 'endpoints.json', mirrors = [ URL ] )
+        for url in registry.select( 'analyze' ):
+            ... request url, registry.record( url, seconds, ok ) ...
+    '''
+
+    def __init__(
+            self, filePath = None, mirrors = [], cooldown = 30,
+            maxCooldown = 3600, alpha = 0.3, saveInterval = 5
+        ):
+        '''
+        - filePath:     JSON file health is loaded from and saved to,
+                        None keeps it in memory only.
+        - mirrors:      Base URLs of hosts with the same API as base URL.
+        - cooldown:     Seconds an endpoint is down after a failure.
+        - maxCooldown:  Max seconds an endpoint is down.
+        - alpha:        Weight of last request on rolling values.
+        - saveInterval: Min seconds between saves after requests.
+        '''
+        self.filePath     = filePath
+        self.mirrors      = [ m.rstrip( '/' ) for m in mirrors ]
+        self.cooldown     = cooldown
+        self.maxCooldown  = maxCooldown
+        self.alpha        = alpha
+        self.saveInterval = saveInterval
+        self.__extra      = { kind: [] for kind in ENDPOINT_PATHS }
+        self.__health     = {}
+        self.__saved      = None
+        self.__lock       = Lock()
+
+        if filePath is not None:
+            self.load()
+
+    def register( self, kind, url ):
+        '''Add url as a candidate of endpoint kind'''
+
+        if kind not in ENDPOINT_PATHS:
+            raise ValueError( 'unknown endpoint kind \'{}\''.format( kind ) )
+
+        with self.__lock:
+            if url not in self.__extra[kind]:
+                self.__extra[kind].append( url )
+
+    def getCandidates( self, kind ):
+        '''Get candidate URLs of kind, on configuration order'''
+
+        urls = [
+            base + ENDPOINT_PATHS[kind]
+            for base in [ getBaseURL() ] + self.mirrors
+        ]
+
+        with self.__lock:
+            urls += self.__extra[kind]
+
+        # BASE URL MAY BE A MIRROR TOO
+        return list( dict.fromkeys( urls ) )
+
+    def select( self, kind, host = None ):
+        '''
+        Get candidate URLs of kind in the order they should be tried: up
+        endpoints by score, then never used ones, then down ones by the
+        time they come up.
+        - host: Only candidates on host (see getHost), i.e. convert of a
+                kID given by that host.
+        '''
+        now  = time()
+        up   = []
+        new  = []
+        down = []
+
+        for index, url in enumerate( self.getCandidates( kind ) ):
+            if host is not None and getHost( url ) != host:
+                continue
+
+            with self.__lock:
+                health = self.__health.get( url )
+
+            if health is None or health.requests == 0:
+                new.append( url )
+                continue
+
+            until = health.getDownUntil( self.cooldown, self.maxCooldown )
+
+            if until > now:
+                down.append( ( until, index, url ) )
+            else:
+                up.append( ( health.getScore(), index, url ) )
+
+        return [ e[2] for e in sorted( up ) ] + new \
+            + [ e[2] for e in sorted( down ) ]
+
+    def getHosts( self, kind ):
+        '''Get hosts of kind candidates in the order they should be tried'''
+
+        hosts = [ getHost( url ) for url in self.select( kind ) ]
+        return list( dict.fromkeys( hosts ) )
+
+    def record( self, url, seconds, ok ):
+        '''Count a request to url that took seconds, ok or failed'''
+
+        with self.__lock:
+            health = self.__health.setdefault( url, EndpointHealth() )
+            health.update( seconds, ok, self.alpha )
+            save = self.__saved is None \
+                or monotonic() - self.__saved >= self.saveInterval
+
+        # FAILURES ARE SAVED RIGHT AWAY, NEXT RUNS MUST KNOW THEM
+        if self.filePath is not None and ( save or not ok ):
+            self.save()
+
+    def getHealth( self, url ):
+        '''Get EndpointHealth of url, None when it was never used'''
+
+        with self.__lock:
+            return self.__health.get( url )
+
+    def getStats( self ):
+        '''Get health dict of every used URL'''
+
+        with self.__lock:
+            return {
+                url: health.toDict() for url, health in self.__health.items()
+            }
+
+    def load( self ):
+        '''Load health from file, a missing or broken one is ignored'''
+
+        try:
+            with open( self.filePath, 'r' ) as f:
+                data = json.load( f )
+        except ( OSError, ValueError ):
+            return
+
+        if not isinstance( data, dict ):
+            return
+
+        with self.__lock:
+            for url, health in data.get( 'endpoints', {} ).items():
+                if isinstance( health, dict ):
+                    self.__health[url] = EndpointHealth.fromDict( health )
+
+    def save( self ):
+        '''Save health to file'''
+
+        if self.filePath is None:
+            return
+
+        folder = path.dirname( self.filePath )
+
+        if folder:
+            makedirs( folder, exist_ok = True )
+
+        with self.__lock:
+            data = { 'updated': time(), 'endpoints': {
+                url: health.toDict() for url, health in self.__health.items()
+            } }
+            self.__saved = monotonic()
+
+            # OTHER RUNS MAY READ OR WRITE IT ANY TIME
+            tmpPath = '{}.{}.tmp'.format( self.filePath, getpid() )
+
+            with open( tmpPath, 'w' ) as f:
+                json.dump( data, f, indent = 2 )
+            replace( tmpPath, self.filePath )
+
+__registry = ProcessWide( EndpointRegistry )
+
+def getEndpointRegistry():
+    '''Get process wide endpoint registry'''
+
+    return __registry.get()
+
+def setEndpointRegistry( registry ):
+    '''Set process wide endpoint registry'''
+
+    __registry.set( registry )
@@ -0,0 +1,294 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Hedged requests. An analyze or convert request sometimes hangs until
+its timeout while the same request sent again answers in under a
+second, so a request still waiting after most of them ended is sent
+again and the first good answer is used.
+'''
+
+from ProcessWide import ProcessWide
+from collections import deque
+from contextlib import nullcontext
+from contextvars import copy_context
+from queue import Empty, Queue
+from threading import Lock, Thread
+from time import monotonic
+import math
+
+# HEDGED REQUESTS
+# ------------------------------------------------------------------------------
+# A request that didn't answer after the percentile latency of its kind
+# is sent again, the first good answer wins and the other one is
+# cancelled. Latency samples are the time of the attempt that won, from
+# its own start. Every request adds budget tokens (up to maxTokens) and
+# every hedge takes one, so hedges are never more than budget of
+# requests.
+# MP3 conversions are slow by design, they are polled (see
+# ConvertTracker) and never hedged.
+# ------------------------------------------------------------------------------
+HEDGED_KINDS = [ 'analyze', 'mp3Analyze', 'convert' ]
+
+class HedgePolicy:
+    '''
+    Hedged requests policy, see HEDGED REQUESTS. Hedge delay of a kind
+    is the percentile of its last window good request times, between
+    minDelay and maxDelay (maxDelay until there are minSamples).
+    Thread safe.
+    '''
+
+    def __init__(
+            self, percentile = 95, minDelay = 0.05, maxDelay = 2,
+            budget = 0.1, maxTokens = 5, window = 200, minSamples = 20,
+            kinds = HEDGED_KINDS
+        ):
+        '''
+        - percentile: Request times percentile a hedge is sent after.
+        - minDelay:   Min seconds before a hedge.
+        - maxDelay:   Max seconds before a hedge.
+        - budget:     Max hedges per request, 0.1 is one every 10.
+        - maxTokens:  Max hedges saved for a burst of slow requests.
+        - window:     Request times kept for every kind.
+        - minSamples: Request times needed to use percentile.
+        - kinds:      Endpoint kinds hedged.
+        '''
+        self.percentile = percentile
+        self.minDelay   = minDelay
+        self.maxDelay   = maxDelay
+        self.budget     = budget
+        self.maxTokens  = maxTokens
+        self.window     = window
+        self.minSamples = minSamples
+        self.kinds      = set( kinds )
+        self.stats      = { 'requests': 0, 'hedges': 0, 'wins': 0 }
+        self.__times    = {}
+        self.__tokens   = 1
+        self.__lock     = Lock()
+
+    def isHedged( self, kind ):
+        '''Check if requests of kind are hedged'''
+
+        return kind in self.kinds
+
+    def getDelay( self, kind ):
+        '''Get seconds before a request of kind is hedged'''
+
+        with self.__lock:
+            times = sorted( self.__times.get( kind, [] ) )
+
+        if len( times ) < self.minSamples:
+            return self.maxDelay
+
+        index = math.ceil( self.percentile / 100 * len( times ) ) - 1
+        index = min( len( times ) - 1, max( 0, index ) )
+        return min( self.maxDelay, max( self.minDelay, times[index] ) )
+
+    def getStats( self ):
+        '''Get count of requests, hedges sent and hedges that won'''
+
+        with self.__lock:
+            return dict( self.stats )
+
+    def __start( self ):
+        '''Count a request and its budget'''
+
+        with self.__lock:
+            self.stats['requests'] += 1
+            self.__tokens = min( self.maxTokens, self.__tokens + self.budget )
+
+    def __take( self ):
+        '''Take a hedge from budget, False when there is none'''
+
+        with self.__lock:
+            if self.__tokens < 1:
+                return False
+
+            self.__tokens -= 1
+            self.stats['hedges'] += 1
+            return True
+
+    def __end( self, kind, seconds, hedge ):
+        '''Count a good request that took seconds'''
+
+        with self.__lock:
+            if kind not in self.__times:
+                self.__times[kind] = deque( maxlen = self.window )
+
+            self.__times[kind].append( seconds )
+
+            if hedge:
+                self.stats['wins'] += 1
+
+    def run( self, kind, call, isGood = None, discard = None, scope = None ):
+        '''
+        Run call() and return its result, hedged when kind is. When it
+        doesn't end after hedge delay the same call is started again,
+        the first result isGood( result ) accepts wins. A thread can't be
+        cancelled, so every attempt runs call inside a scope() context
+        manager (see SessionPool.CancelScope) and the loser's one is
+        cancelled, its result is given to discard( result ) if it still
+        ends (i.e. to close it). When neither is good the first one is
+        returned (or raised).
+        '''
+        isGood  = isGood or ( lambda result: True )
+        discard = discard or ( lambda result: None )
+        scope   = scope or nullcontext
+
+        if not self.isHedged( kind ):
+            return call()
+
+        self.__start()
+
+        ended   = Queue()
+        lock    = Lock()
+        decided = []
+        scopes  = []
+
+        def attempt( hedge, attemptScope ):
+            started = monotonic()
+
+            try:
+                with attemptScope:
+                    result, error = call(), None
+            except Exception as e:
+                result, error = None, e
+
+            # A LATE RESULT IS DROPPED
+            with lock:
+                late = bool( decided )
+
+                if not late:
+                    seconds = monotonic() - started
+                    ended.put( ( hedge, result, error, seconds ) )
+
+            if late and error is None:
+                discard( result )
+
+        def launch( hedge ):
+            # CREATED HERE, SO IT'S CANCELLED EVEN BEFORE IT'S ENTERED
+            attemptScope = scope()
+            scopes.append( attemptScope )
+
+            # ATTEMPTS RUN ON CALLER CONTEXT, SO THEY COUNT ON ITS METRICS
+            Thread(
+                target = copy_context().run,
+                args = ( attempt, hedge, attemptScope ), daemon = True
+            ).start()
+
+        started = monotonic()
+        delay   = self.getDelay( kind )
+        running = 1
+        hedged  = False
+        first   = None
+        launch( False )
+
+        while True:
+            timeout = None if hedged \
+                else max( 0, delay - ( monotonic() - started ) )
+
+            try:
+                outcome = ended.get( timeout = timeout )
+            except Empty:
+                hedged = True
+
+                if self.__take():
+                    running += 1
+                    launch( True )
+
+                continue
+
+            running -= 1
+            hedge, result, error, seconds = outcome
+            good = error is None and isGood( result )
+
+            if not good and running > 0:
+                first = first or outcome
+                continue
+
+            with lock:
+                decided.append( hedge )
+
+            # ENDED ATTEMPTS HAVE NOTHING LEFT TO CANCEL
+            for attemptScope in scopes:
+                if hasattr( attemptScope, 'cancel' ):
+                    attemptScope.cancel()
+
+            if good:
+                self.__end( kind, seconds, hedge )
+
+                if first is not None and first[2] is None:
+                    discard( first[1] )
+
+                return result
+
+            # NONE IS GOOD, FIRST ONE IS GIVEN
+            if first is not None:
+                if error is None:
+                    discard( result )
+
+                hedge, result, error, seconds = first
+
+            if error is not None:
+                raise error
+
+            return result
+
+    async def runAsync( self, kind, call, isGood = None ):
+        '''
+        Mirror of run on asyncio, call() gives a coroutine. The loser is
+        cancelled.
+        '''
+        import asyncio
+
+        isGood = isGood or ( lambda result: True )
+
+        if not self.isHedged( kind ):
+            return await call()
+
+        self.__start()
+
+        # EVERY TASK GIVES ITS HEDGE FLAG AND START TIME
+        tasks = { asyncio.ensure_future( call() ): ( False, monotonic() ) }
+        first = None
+
+        try:
+            done, _ = await asyncio.wait(
+                tasks, timeout = self.getDelay( kind )
+            )
+
+            if not done and self.__take():
+                tasks[asyncio.ensure_future( call() )] = ( True, monotonic() )
+
+            while tasks:
+                done, _ = await asyncio.wait(
+                    tasks, return_when = asyncio.FIRST_COMPLETED
+                )
+
+                for task in done:
+                    hedge, started = tasks.pop( task )
+
+                    if task.exception() is None \
+                        and isGood( task.result() ):
+                        self.__end( kind, monotonic() - started, hedge )
+                        return task.result()
+
+                    first = first or task
+
+            # NONE IS GOOD, FIRST ONE IS GIVEN
+            return first.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+__policy = ProcessWide()
+
+def getHedgePolicy():
+    '''Get process wide hedge policy, None when requests aren't hedged'''
+
+    return __policy.get()
+
+def setHedgePolicy( policy ):
+    '''Set process wide hedge policy, None disables hedging'''
+
+    __policy.set( policy )
@@ -0,0 +1,168 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Client of the download daemon (see JobServer). It only needs the
+standard library, so submitting a job is as cheap as a python start.
+'''
+
+import json
+
+# DAEMON ADDRESS, 'unix:PATH' FOR UNIX SOCKETS OR 'HOST:PORT' FOR HTTP
+DEFAULT_ADDRESS = '127.0.0.1:8765'
+
+class JobError( Exception ):
+    '''
+    Error raised when the daemon can't be reached (status is None) or
+    answers with HTTP status error, i.e. 400 for rejected jobs.
+    '''
+
+    def __init__( self, msg, status = None ):
+        super().__init__( msg )
+        self.status = status
+
+def parseAddress( address ):
+    '''
+    Parse daemon address. Return ( 'unix', path ) for 'unix:PATH' or
+    any address with a '/', ( 'tcp', ( host, port ) ) for 'HOST:PORT'.
+    Raise ValueError when it's not valid.
+    '''
+    if address.startswith( 'unix:' ):
+        return 'unix', address[5:]
+
+    if '/' in address:
+        return 'unix', address
+
+    host, _, port = address.rpartition( ':' )
+
+    if not port.isdigit():
+        raise ValueError( 'invalid address \'{}\''.format( address ) )
+
+    return 'tcp', ( host or '127.0.0.1', int( port ) )
+
+class JobClient:
+    '''
+    Client of JobServer. Methods return job dicts (see Job.toDict) and
+    raise JobError.
+
+        client = JobClient( 'unix:/tmp/y2mate.sock' )
+        job    = client.submit( url, 'mp3' )
+        job    = client.wait( job['id'] )
+    '''
+
+    def __init__( self, address = DEFAULT_ADDRESS, timeout = 60 ):
+        '''
+        - address: Daemon address, see parseAddress.
+        - timeout: Seconds to wait for the daemon on every request.
+        '''
+        try:
+            self.kind, self.bind = parseAddress( address )
+        except ValueError as e:
+            raise JobError( '[Error]: {}!'.format( e ) )
+
+        self.address = address
+        self.timeout = timeout
+
+    def __connect( self, timeout ):
+        import http.client
+        import socket
+
+        if self.kind == 'tcp':
+            return http.client.HTTPConnection( *self.bind, timeout = timeout )
+
+        # REQUESTS GO ON AN ALREADY CONNECTED UNIX SOCKET
+        conn = http.client.HTTPConnection( 'localhost', timeout = timeout )
+        sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        sock.settimeout( timeout )
+
+        try:
+            sock.connect( self.bind )
+        except OSError:
+            sock.close()
+            raise
+
+        conn.sock = sock
+        return conn
+
+    def __request( self, method, url, data = None, timeout = None ):
+        from http.client import HTTPException
+
+        conn = None
+        body = None if data is None else json.dumps( data )
+
+        try:
+            conn = self.__connect( timeout or self.timeout )
+            conn.request(
+                method, url, body = body,
+                headers = { 'Content-Type': 'application/json' }
+            )
+            res    = conn.getresponse()
+            result = json.loads( res.read() or b'null' )
+        except ( OSError, HTTPException, ValueError ) as e:
+            raise JobError(
+                '[Error]: Daemon at \'{}\' not available ({})!'.format(
+                    self.address, e
+                )
+            )
+        finally:
+            if conn is not None:
+                conn.close()
+
+        if res.status >= 400:
+            raise JobError(
+                '[Error]: {}!'.format(
+                    result.get( 'error' ) if isinstance( result, dict ) \
+                        else 'HTTP {}'.format( res.status )
+                ),
+                res.status
+            )
+
+        return result
+
+    def submit(
+            self, url, format, quality = None, mp3Convert = False,
+            folder = None, redownload = False
+        ):
+        '''
+        Submit download job of url and return it. Files are saved on
+        folder (an absolute path) or on daemon's audio or video folder.
+        With redownload, files on daemon's download ledger are
+        downloaded again.
+        '''
+        return self.__request( 'POST', '/jobs', {
+            'url':        url,
+            'format':     format,
+            'quality':    quality,
+            'mp3Convert': mp3Convert,
+            'folder':     folder,
+            'redownload': redownload
+        } )
+
+    def get( self, id, wait = 0 ):
+        '''Get job id, waiting up to wait seconds for it to end'''
+
+        url = '/jobs/{}'.format( id )
+
+        if wait > 0:
+            url += '?wait={}'.format( wait )
+
+        return self.__request( 'GET', url, timeout = self.timeout + wait )
+
+    def wait( self, id, poll = 30 ):
+        '''Wait for job id to end and return it'''
+
+        while True:
+            job = self.get( id, wait = poll )
+
+            if job['state'] in [ 'done', 'failed' ]:
+                return job
+
+    def list( self ):
+        '''Get every known job'''
+
+        return self.__request( 'GET', '/jobs' )
+
+    def getStats( self ):
+        '''Get daemon jobs and connections stats'''
+
+        return self.__request( 'GET', '/stats' )
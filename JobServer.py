@@ -0,0 +1,521 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Resident download daemon. One process keeps a Y2mateClient (pooled
+connections and options cache) warm and runs download jobs submitted
+over a Unix domain socket or localhost HTTP, with JSON bodies:
+
+    POST /jobs               Submit job { url, format, quality,
+                             mp3Convert, folder, redownload }, answers
+                             the job.
+    GET  /jobs               Every known job.
+    GET  /jobs/<id>?wait=N   Job, waiting up to N seconds for it to end.
+    GET  /stats              Queue, conversions, endpoints, hedges
+                             and connections stats.
+
+Run it with y2mate-download --serve and submit jobs with --submit or
+JobClient.
+'''
+
+from JobClient import DEFAULT_ADDRESS, parseAddress
+from Metrics import ThroughputMeter, getMetrics
+from Y2mateApi import parseVideoID
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import path, remove
+from queue import Queue
+from socketserver import ThreadingMixIn, UnixStreamServer
+from threading import BoundedSemaphore, Condition, Lock, Thread
+from time import monotonic, time
+from urllib.parse import parse_qs, urlparse
+import json
+import signal
+import socket
+
+# JOB STATES
+# ------------------------------------------------------------------------------
+# - queued:  Waiting for a free worker.
+# - running: Being processed, see its phase (analyze, ledger, convert,
+#            download).
+# - done:    File saved, see filePath.
+# - failed:  See error.
+# ------------------------------------------------------------------------------
+STATES = [ 'queued', 'running', 'done', 'failed' ]
+
+class Job:
+    '''Download job of one url'''
+
+    def __init__(
+            self, id, url, format, quality = None, mp3Convert = False,
+            folder = None, redownload = False
+        ):
+        self.id         = id
+        self.url        = url
+        self.format     = format
+        self.quality    = quality
+        self.mp3Convert = mp3Convert
+        self.folder     = folder
+        self.redownload = redownload
+        self.state      = 'queued'
+        self.phase      = None
+        self.error      = None
+        self.filePath   = None
+        self.created    = time()
+        self.started    = None
+        self.finished   = None
+        self.rate       = 0
+        self.meter      = ThroughputMeter()
+
+    @property
+    def ended( self ):
+        return self.state in [ 'done', 'failed' ]
+
+    @classmethod
+    def fromDict( cls, id, data ):
+        '''Get Job from submitted data, raise ValueError when invalid'''
+
+        if not isinstance( data, dict ):
+            raise ValueError( 'job must be a JSON object' )
+
+        url     = data.get( 'url' )
+        format  = data.get( 'format' )
+        quality = data.get( 'quality' )
+        folder  = data.get( 'folder' )
+
+        if not isinstance( url, str ) or parseVideoID( url ) == '':
+            raise ValueError( 'invalid url \'{}\''.format( url ) )
+
+        if format not in [ 'm4a', 'mp3', 'mp4' ]:
+            raise ValueError( 'invalid format \'{}\''.format( format ) )
+
+        if quality is not None and not isinstance( quality, int ):
+            raise ValueError( 'quality must be an integer' )
+
+        if folder is not None and not path.isabs( str( folder ) ):
+            raise ValueError( 'folder must be an absolute path' )
+
+        return cls(
+            id, url, format, quality, bool( data.get( 'mp3Convert' ) ),
+            folder, bool( data.get( 'redownload' ) )
+        )
+
+    def toDict( self ):
+        '''Get job status and progress as JSON serializable dict'''
+
+        meter = self.meter
+
+        return {
+            'id':         self.id,
+            'url':        self.url,
+            'format':     self.format,
+            'quality':    self.quality,
+            'mp3Convert': self.mp3Convert,
+            'folder':     self.folder,
+            'redownload': self.redownload,
+            'state':      self.state,
+            'phase':      self.phase,
+            'error':      self.error,
+            'filePath':   self.filePath,
+            'created':    round( self.created, 3 ),
+            'started':    self.started and round( self.started, 3 ),
+            'finished':   self.finished and round( self.finished, 3 ),
+            'progress':   {
+                'bytes': meter.bytes,
+                'total': meter.total,
+                'rate':  round( self.rate ) if self.ended \
+                    else round( meter.getMean() ) if self.phase == 'download' \
+                    else 0
+            }
+        }
+
+class JobQueue:
+    '''
+    Jobs of a Y2mateClient run by a fixed count of worker threads, in
+    submit order. Only the last keep ended jobs are remembered.
+
+    Only workers jobs download at once, there are as many more threads
+    as client convert tracker workers, so jobs waiting for slow
+    conversions don't stop others from downloading.
+    '''
+
+    def __init__( self, client, workers = 4, keep = 1000, verbose = False ):
+        '''
+        - client:  Y2mateClient that runs the jobs.
+        - workers: Jobs downloading at once.
+        - keep:    Ended jobs remembered for status requests.
+        - verbose: Show every job start and end.
+        '''
+        self.client    = client
+        self.workers   = max( 1, workers )
+        self.keep      = keep
+        self.verbose   = verbose
+        self.jobs      = OrderedDict()
+        self.__queue   = Queue()
+        self.__lock    = Lock()
+        self.__changed = Condition( self.__lock )
+        self.__nextID  = 1
+        self.__slots   = BoundedSemaphore( self.workers )
+        self.__threads = []
+        self.__stopped = False
+
+    def __verbose( self, msg ):
+        if self.verbose:
+            print( msg, flush = True )
+
+    def start( self ):
+        '''Start worker threads'''
+
+        for i in range( self.workers + self.client.tracker.workers ):
+            thread = Thread( target = self.__work, daemon = True )
+            thread.start()
+            self.__threads.append( thread )
+
+        return self
+
+    def stop( self ):
+        '''
+        Stop workers when they end their current job, queued jobs are
+        left undone.
+        '''
+
+        self.__stopped = True
+
+        for thread in self.__threads:
+            self.__queue.put( None )
+
+        for thread in self.__threads:
+            thread.join()
+
+        self.__threads = []
+
+    def submit( self, data ):
+        '''Queue job from submitted data dict, raise ValueError if invalid'''
+
+        with self.__lock:
+            job = Job.fromDict( str( self.__nextID ), data )
+            self.__nextID += 1
+            self.jobs[job.id] = job
+
+        self.__verbose( 'Job {}: queued {}'.format( job.id, job.url ) )
+        self.__queue.put( job )
+        return job
+
+    def get( self, id ):
+        '''Get job id, None when it's unknown'''
+
+        with self.__lock:
+            return self.jobs.get( id )
+
+    def list( self ):
+        '''Get every known job'''
+
+        with self.__lock:
+            return list( self.jobs.values() )
+
+    def wait( self, id, timeout = None ):
+        '''
+        Wait up to timeout seconds (forever on None) for job id to end
+        and return it, None when it's unknown.
+        '''
+        deadline = None if timeout is None else monotonic() + timeout
+
+        with self.__changed:
+            job = self.jobs.get( id )
+
+            while job is not None and not job.ended:
+                left = None if deadline is None else deadline - monotonic()
+
+                if left is not None and left <= 0:
+                    break
+
+                self.__changed.wait( left )
+
+            return job
+
+    def getStats( self ):
+        '''Get count of jobs on every state'''
+
+        with self.__lock:
+            stats = { state: 0 for state in STATES }
+
+            for job in self.jobs.values():
+                stats[job.state] += 1
+
+        stats['workers'] = self.workers
+        return stats
+
+    def __setState( self, job, state, **values ):
+        with self.__changed:
+            job.state = state
+
+            for k, v in values.items():
+                setattr( job, k, v )
+
+            # FORGET OLDEST ENDED JOBS
+            if job.ended:
+                job.rate = job.meter.getMean() if job.meter.bytes else 0
+                ended = [ j.id for j in self.jobs.values() if j.ended ]
+
+                for id in ended[:max( 0, len( ended ) - self.keep )]:
+                    del self.jobs[id]
+
+            self.__changed.notify_all()
+
+    def __work( self ):
+        while True:
+            job = self.__queue.get()
+
+            if job is None or self.__stopped:
+                return
+
+            self.__run( job )
+
+    def __run( self, job ):
+        client = self.client
+        self.__setState( job, 'running', started = time() )
+        self.__verbose( 'Job {}: running {}'.format( job.id, job.url ) )
+
+        with getMetrics().run( job.url ) as run:
+            try:
+                vID    = client.parseVideoID( job.url )
+                result = None
+
+                job.phase = 'analyze'
+                info = client.getOptions( vID, job.mp3Convert )
+
+                if not job.redownload:
+                    job.phase = 'ledger'
+                    result = client.getDownloaded(
+                        info, job.format, job.quality, folder = job.folder
+                    )
+
+                if result is None:
+                    job.phase = 'convert'
+                    link = client.resolveLink(
+                        vID, job.format, job.quality, job.mp3Convert,
+                        info = info
+                    )
+
+                    with self.__slots:
+                        job.phase = 'download'
+                        job.meter = ThroughputMeter()
+                        result = client.download(
+                            link, folder = job.folder, meter = job.meter
+                        )
+            # A FAILED JOB NEVER STOPS THE DAEMON
+            except Exception as e:
+                run.fail( e )
+                self.__setState(
+                    job, 'failed', error = str( e ) or type( e ).__name__,
+                    finished = time()
+                )
+                self.__verbose(
+                    'Job {}: failed {}'.format( job.id, job.error )
+                )
+                return
+
+        self.__setState(
+            job, 'done', filePath = result.filePath, finished = time()
+        )
+        self.__verbose( 'Job {}: saved {}'.format( job.id, job.filePath ) )
+
+class JobHandler( BaseHTTPRequestHandler ):
+    '''HTTP API of JobServer'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message( self, format, *args ):
+        if self.server.verbose:
+            super().log_message( format, *args )
+
+    def address_string( self ):
+        # UNIX SOCKETS HAVE NO CLIENT ADDRESS
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def sendJSON( self, data, status = 200 ):
+        body = json.dumps( data ).encode()
+        self.send_response( status )
+        self.send_header( 'Content-Type', 'application/json' )
+        self.send_header( 'Content-Length', str( len( body ) ) )
+        self.end_headers()
+        self.wfile.write( body )
+
+    def sendError( self, status, msg ):
+        self.sendJSON( { 'error': msg }, status )
+
+    def do_POST( self ):
+        if urlparse( self.path ).path != '/jobs':
+            return self.sendError( 404, 'not found' )
+
+        length = int( self.headers.get( 'Content-Length', 0 ) )
+
+        try:
+            job = self.server.queue.submit(
+                json.loads( self.rfile.read( length ) or b'null' )
+            )
+        except ValueError as e:
+            return self.sendError( 400, str( e ) )
+
+        self.sendJSON( job.toDict(), 201 )
+
+    def do_GET( self ):
+        url   = urlparse( self.path )
+        queue = self.server.queue
+
+        if url.path == '/stats':
+            from EndpointRegistry import getEndpointRegistry
+            from Hedge import getHedgePolicy
+            from SessionPool import getSessionPool
+
+            hedge = queue.client.hedge or getHedgePolicy()
+
+            return self.sendJSON( {
+                'jobs':        queue.getStats(),
+                'converts':    queue.client.tracker.getStats(),
+                'endpoints':   ( queue.client.endpoints \
+                    or getEndpointRegistry() ).getStats(),
+                'hedges':      hedge.getStats() if hedge else None,
+                'connections': getSessionPool().getStats()
+            } )
+
+        if url.path == '/jobs':
+            return self.sendJSON( [ job.toDict() for job in queue.list() ] )
+
+        if not url.path.startswith( '/jobs/' ):
+            return self.sendError( 404, 'not found' )
+
+        id = url.path[6:]
+
+        try:
+            wait = float( parse_qs( url.query ).get( 'wait', [ 0 ] )[0] )
+        except ValueError:
+            return self.sendError( 400, 'wait must be seconds' )
+
+        job = queue.wait( id, wait ) if wait > 0 else queue.get( id )
+
+        if job is None:
+            return self.sendError( 404, 'unknown job \'{}\''.format( id ) )
+
+        self.sendJSON( job.toDict() )
+
+def isListening( socketPath ):
+    '''Check if some process accepts connections on Unix socket path'''
+
+    sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+
+    try:
+        sock.connect( socketPath )
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+class UnixHTTPServer( ThreadingMixIn, UnixStreamServer ):
+    '''HTTP server on a Unix domain socket'''
+
+    daemon_threads = True
+
+class JobServer:
+    '''
+    Download daemon, JobQueue served over HTTP on address (see
+    parseAddress).
+
+    Use it as context manager, it serves on a daemon thread:
+        with JobServer( client, 'unix:/tmp/y2mate.sock' ) as server:
+            ...
+    '''
+
+    def __init__(
+            self, client, address = DEFAULT_ADDRESS, workers = 4,
+            keep = 1000, verbose = False
+        ):
+        '''
+        - client:  Y2mateClient that runs the jobs.
+        - address: 'unix:PATH' or 'HOST:PORT', port 0 picks a free one.
+        - workers: Jobs downloading at once.
+        - keep:    Ended jobs remembered for status requests.
+        - verbose: Log every request and job.
+        '''
+        kind, bind = parseAddress( address )
+
+        if kind == 'unix':
+            # SOCKET FILE OF A PREVIOUS RUN, NEVER OF A LIVE DAEMON
+            if path.exists( bind ):
+                if isListening( bind ):
+                    raise OSError(
+                        'Daemon already running at \'{}\''.format( bind )
+                    )
+                remove( bind )
+
+            self.server = UnixHTTPServer( bind, JobHandler )
+        else:
+            self.server = ThreadingHTTPServer( bind, JobHandler )
+            self.server.daemon_threads = True
+
+        self.kind    = kind
+        self.queue   = JobQueue( client, workers, keep, verbose )
+        self.verbose = verbose
+
+        self.server.queue   = self.queue
+        self.server.verbose = verbose
+
+    @property
+    def address( self ):
+        '''Address clients connect to'''
+
+        if self.kind == 'unix':
+            return 'unix:' + self.server.server_address
+
+        host, port = self.server.server_address[:2]
+        return '{}:{}'.format( host, port )
+
+    def serveForever( self ):
+        '''
+        Run jobs and serve until interrupted, SIGTERM is taken as Ctrl-C
+        (KeyboardInterrupt) when it's called from main thread.
+        '''
+        def interrupt( signum, frame ):
+            raise KeyboardInterrupt
+
+        try:
+            signal.signal( signal.SIGTERM, interrupt )
+        except ValueError:
+            # NOT ON MAIN THREAD
+            pass
+
+        self.queue.start()
+
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def start( self ):
+        '''Run jobs and serve on a daemon thread'''
+
+        self.queue.start()
+        Thread( target = self.server.serve_forever, daemon = True ).start()
+        return self
+
+    def stop( self ):
+        '''Stop serving, running jobs end first'''
+
+        self.server.shutdown()
+        self.close()
+
+    def close( self ):
+        '''Stop workers and close the socket'''
+
+        self.queue.stop()
+        self.server.server_close()
+
+        if self.kind == 'unix' and path.exists( self.server.server_address ):
+            remove( self.server.server_address )
+
+    def __enter__( self ):
+        return self.start()
+
+    def __exit__( self, *args ):
+        self.stop()
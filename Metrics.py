@@ -0,0 +1,319 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from ProcessWide import ProcessWide
+from contextvars import ContextVar
+from os import replace
+from threading import Lock
+from time import monotonic, time
+import json
+
+# METRICS FORMATS
+# ------------------------------------------------------------------------------
+# - jsonl:      One JSON object per processed url, appended as it finishes.
+# - prometheus: Textfile (node_exporter textfile collector) with totals,
+#               rewritten after every url.
+# ------------------------------------------------------------------------------
+FORMATS = [ 'jsonl', 'prometheus' ]
+
+# PHASES OF A URL RUN
+# ------------------------------------------------------------------------------
+# - videoID:  Video ID parsing.
+# - analyze:  Analyze request (options).
+# - parse:    Result and convert HTML parsing.
+# - convert:  Convert request (download link).
+# - ttfb:     File request until response headers.
+# - download: File body saved.
+# ------------------------------------------------------------------------------
+PHASES = [ 'videoID', 'analyze', 'parse', 'convert', 'ttfb', 'download' ]
+
+class ThroughputMeter:
+    '''
+    Mean and peak throughput of a transfer in bytes/sec. Peak is the
+    best rate over window seconds, it's the mean for shorter transfers.
+    Total is the count of bytes expected, 0 when unknown.
+    Not thread safe, callers share a lock.
+    '''
+
+    def __init__( self, window = 1 ):
+        self.window  = window
+        self.bytes   = 0
+        self.total   = 0
+        self.peak    = 0
+        self.started = monotonic()
+        self.__mark  = self.started
+        self.__count = 0
+
+    def update( self, size ):
+        '''Count size transferred bytes'''
+
+        now = monotonic()
+        self.bytes   += size
+        self.__count += size
+
+        if now - self.__mark >= self.window:
+            self.peak = max( self.peak, self.__count / ( now - self.__mark ) )
+            self.__mark  = now
+            self.__count = 0
+
+    def getMean( self ):
+        '''Get mean bytes/sec since start'''
+
+        seconds = monotonic() - self.started
+        return self.bytes / seconds if seconds > 0 else 0
+
+    def getPeak( self ):
+        '''Get peak bytes/sec'''
+
+        return self.peak if self.peak > 0 else self.getMean()
+
+class RunMetrics:
+    '''Phase times and counters of one url, thread safe'''
+
+    def __init__( self, url ):
+        self.url      = url
+        self.time     = time()
+        self.started  = monotonic()
+        self.seconds  = 0
+        self.status   = 'ok'
+        self.error    = None
+        self.phases   = {}
+        self.counters = { 'bytes': 0, 'retries': 0 }
+        self.peak     = 0
+        self.__lock   = Lock()
+
+    def addPhase( self, phase, seconds ):
+        '''Add seconds to phase, a phase may run more than once'''
+
+        with self.__lock:
+            self.phases[phase] = self.phases.get( phase, 0 ) + seconds
+
+    def add( self, counter, value = 1 ):
+        '''Add value to counter'''
+
+        with self.__lock:
+            self.counters[counter] = self.counters.get( counter, 0 ) + value
+
+    def setPeak( self, peak ):
+        '''Keep max peak throughput in bytes/sec'''
+
+        with self.__lock:
+            self.peak = max( self.peak, peak )
+
+    def fail( self, error ):
+        '''Mark run as failed with error message'''
+
+        self.status = 'fail'
+        self.error  = str( error )
+
+    def toDict( self ):
+        '''Get run as JSON serializable dict'''
+
+        download = self.phases.get( 'download', 0 )
+
+        return {
+            'time':       round( self.time, 3 ),
+            'url':        self.url,
+            'status':     self.status,
+            'error':      self.error,
+            'seconds':    round( self.seconds, 6 ),
+            'phases':     {
+                k: round( v, 6 ) for k, v in self.phases.items()
+            },
+            'bytes':      self.counters['bytes'],
+            'throughput': round(
+                self.counters['bytes'] / download if download > 0 else 0
+            ),
+            'peak':       round( self.peak ),
+            'retries':    self.counters['retries']
+        }
+
+class PhaseTimer:
+    '''Context manager that adds its time to a phase of current run'''
+
+    def __init__( self, run, phase ):
+        self.run   = run
+        self.phase = phase
+
+    def __enter__( self ):
+        self.started = monotonic()
+        return self
+
+    def __exit__( self, *args ):
+        if self.run is not None:
+            self.run.addPhase( self.phase, monotonic() - self.started )
+
+class RunContext:
+    '''Context manager of a url run, see Metrics.run'''
+
+    def __init__( self, metrics, url ):
+        self.metrics = metrics
+        self.run     = RunMetrics( url )
+
+    def __enter__( self ):
+        self.__token = Metrics.current.set( self.run )
+        return self.run
+
+    def __exit__( self, excType, exc, tb ):
+        Metrics.current.reset( self.__token )
+        self.run.seconds = monotonic() - self.run.started
+
+        if excType is not None and self.run.status == 'ok':
+            self.run.fail( str( exc ) or excType.__name__ )
+
+        self.metrics.record( self.run )
+
+class Metrics:
+    '''
+    Per url timing and throughput metrics.
+
+    Every url is processed inside run( url ) context, code doing a phase
+    wraps it with phase( name ) and adds counters with add( name, value ).
+    Current run is kept on a context variable, so it follows threads
+    started with a copied context and asyncio tasks. Without filePath
+    nothing is written.
+    '''
+
+    current = ContextVar( 'y2mateRun', default = None )
+
+    def __init__( self, filePath = None, format = None ):
+        '''
+        - filePath: File metrics are written to, None disables them.
+        - format:   'jsonl' or 'prometheus', from filePath extension
+                    ('.prom') by default.
+        '''
+        if format is None:
+            format = 'prometheus' \
+                if filePath is not None and filePath.endswith( '.prom' ) \
+                else 'jsonl'
+
+        self.filePath = filePath
+        self.format   = format
+        self.__lock   = Lock()
+        self.__totals = {
+            'runs':    { 'ok': 0, 'fail': 0 },
+            'phases':  {},
+            'bytes':   0,
+            'retries': 0,
+            'peak':    0,
+            'last':    0
+        }
+
+    @property
+    def enabled( self ):
+        return self.filePath is not None
+
+    def run( self, url ):
+        '''Get context manager of url run, yields its RunMetrics'''
+
+        return RunContext( self, url )
+
+    def getRun( self ):
+        '''Get RunMetrics of current context, None outside a run'''
+
+        return Metrics.current.get()
+
+    def phase( self, name ):
+        '''Get context manager that times phase name of current run'''
+
+        return PhaseTimer( self.getRun(), name )
+
+    def add( self, counter, value = 1 ):
+        '''Add value to counter of current run'''
+
+        run = self.getRun()
+
+        if run is not None and value:
+            run.add( counter, value )
+
+    def setPeak( self, peak ):
+        '''Set peak throughput of current run'''
+
+        run = self.getRun()
+
+        if run is not None:
+            run.setPeak( peak )
+
+    def record( self, run ):
+        '''Write finished run'''
+
+        if not self.enabled:
+            return
+
+        data = run.toDict()
+
+        with self.__lock:
+            totals = self.__totals
+            totals['runs'][data['status']] += 1
+            totals['bytes']   += data['bytes']
+            totals['retries'] += data['retries']
+            totals['peak']     = max( totals['peak'], data['peak'] )
+            totals['last']     = data['time']
+
+            for phase, seconds in data['phases'].items():
+                total = totals['phases'].setdefault( phase, [ 0, 0 ] )
+                total[0] += seconds
+                total[1] += 1
+
+            if self.format == 'prometheus':
+                self.__writePrometheus()
+            else:
+                with open( self.filePath, 'a' ) as f:
+                    f.write( json.dumps( data ) + '\n' )
+
+    def __writePrometheus( self ):
+        totals = self.__totals
+        lines  = [
+            '# HELP y2mate_runs_total Processed urls by status.',
+            '# TYPE y2mate_runs_total counter'
+        ]
+        lines += [
+            'y2mate_runs_total{{status="{}"}} {}'.format( k, v )
+            for k, v in totals['runs'].items()
+        ]
+
+        lines += [
+            '# HELP y2mate_phase_seconds Time spent on every phase.',
+            '# TYPE y2mate_phase_seconds summary'
+        ]
+        for phase in PHASES:
+            if phase in totals['phases']:
+                seconds, count = totals['phases'][phase]
+                lines += [
+                    'y2mate_phase_seconds_sum{{phase="{}"}} {:.6f}' \
+                        .format( phase, seconds ),
+                    'y2mate_phase_seconds_count{{phase="{}"}} {}' \
+                        .format( phase, count )
+                ]
+
+        lines += [
+            '# HELP y2mate_download_bytes_total Downloaded bytes.',
+            '# TYPE y2mate_download_bytes_total counter',
+            'y2mate_download_bytes_total {}'.format( totals['bytes'] ),
+            '# HELP y2mate_retries_total Retried requests.',
+            '# TYPE y2mate_retries_total counter',
+            'y2mate_retries_total {}'.format( totals['retries'] ),
+            '# HELP y2mate_download_peak_bytes_per_second Best download rate.',
+            '# TYPE y2mate_download_peak_bytes_per_second gauge',
+            'y2mate_download_peak_bytes_per_second {}'.format( totals['peak'] ),
+            '# HELP y2mate_last_run_timestamp_seconds Last finished url.',
+            '# TYPE y2mate_last_run_timestamp_seconds gauge',
+            'y2mate_last_run_timestamp_seconds {}'.format( totals['last'] )
+        ]
+
+        # TEXTFILE COLLECTORS MUST NEVER READ A HALF WRITTEN FILE
+        with open( self.filePath + '.tmp', 'w' ) as f:
+            f.write( '\n'.join( lines ) + '\n' )
+        replace( self.filePath + '.tmp', self.filePath )
+
+__metrics = ProcessWide( Metrics )
+
+def getMetrics():
+    '''Get process wide metrics'''
+
+    return __metrics.get()
+
+def setMetrics( metrics ):
+    '''Set process wide metrics'''
+
+    __metrics.set( metrics )
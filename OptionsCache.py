@@ -0,0 +1,135 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from hashlib import sha1
+from os import getpid, listdir, makedirs, path, remove, replace, stat, utime
+from threading import Lock, get_ident
+from time import time
+import json
+import re
+
+# ENTRY FILES ARE NAMED BY THEIR KEY SHA1, OTHER FILES OF THE FOLDER
+# (ENDPOINT REGISTRY, DOWNLOAD LEDGER) AREN'T ENTRIES
+ENTRY_REGEX = re.compile( r'^[0-9a-f]{40}\.json$' )
+
+class OptionsCache:
+    '''
+    On-disk cache of y2mate options results, one JSON file per
+    ( vID, mp3Convert, host ) key. A kID is only valid on the API host
+    that gave it, so every host has its own entries.
+
+    Entries expire after ttl seconds. Least recently used entries are
+    removed when there are more than maxEntries or they use more than
+    maxBytes on disk. File modification time is used as last access.
+    '''
+
+    def __init__(
+            self, folder, ttl = 3600, maxEntries = 1000,
+            maxBytes = 50 * 1024 * 1024
+        ):
+        '''
+        - folder:     Cache files folder, created when doesn't exist.
+        - ttl:        Seconds before an entry expires.
+        - maxEntries: Max count of entries kept.
+        - maxBytes:   Max size of all entries on disk.
+        '''
+        self.folder     = folder
+        self.ttl        = ttl
+        self.maxEntries = maxEntries
+        self.maxBytes   = maxBytes
+        self.__lock     = Lock()
+
+    def __getPath( self, vID, mp3Convert, host ):
+        '''Get file path of key entry'''
+
+        key = '{}:{}'.format( vID, 'mp3' if mp3Convert else 'analyze' )
+
+        if host is not None:
+            key += '@' + host
+
+        return path.join(
+            self.folder, sha1( key.encode( 'utf-8' ) ).hexdigest() + '.json'
+        )
+
+    def get( self, vID, mp3Convert = False, host = None ):
+        '''Get cached data of key or None when missing or expired'''
+
+        filePath = self.__getPath( vID, mp3Convert, host )
+
+        try:
+            with open( filePath, 'r' ) as f:
+                entry = json.load( f )
+        except ( OSError, ValueError ):
+            return None
+
+        # EXPIRED ENTRY
+        if time() - entry.get( 'created', 0 ) > self.ttl:
+            self.invalidate( vID, mp3Convert, host )
+            return None
+
+        # MARK AS RECENTLY USED
+        try:
+            utime( filePath )
+        except OSError:
+            pass
+
+        return entry['data']
+
+    def set( self, vID, mp3Convert, data, host = None ):
+        '''Save data of key and evict old entries'''
+
+        makedirs( self.folder, exist_ok = True )
+        filePath = self.__getPath( vID, mp3Convert, host )
+        entry = {
+            'created': time(),
+            'key':     [ vID, mp3Convert, host ],
+            'data':    data
+        }
+
+        # PROCESSES AND THREADS SAVING THE SAME KEY WRITE THEIR OWN FILE
+        tmpPath = '{}.{}.{}.tmp'.format( filePath, getpid(), get_ident() )
+
+        with open( tmpPath, 'w' ) as f:
+            json.dump( entry, f )
+        replace( tmpPath, filePath )
+
+        self.evict()
+
+    def invalidate( self, vID, mp3Convert = False, host = None ):
+        '''Remove key entry'''
+
+        try:
+            remove( self.__getPath( vID, mp3Convert, host ) )
+        except OSError:
+            pass
+
+    def evict( self ):
+        '''Remove least recently used entries over size limits'''
+
+        with self.__lock:
+            entries = []
+
+            for name in listdir( self.folder ):
+                if ENTRY_REGEX.match( name ) is None:
+                    continue
+
+                try:
+                    st = stat( path.join( self.folder, name ) )
+                except OSError:
+                    continue
+                entries.append( ( st.st_mtime, st.st_size, name ) )
+
+            # NEWEST FIRST, REMOVE FROM THE END
+            entries.sort( reverse = True )
+            size = sum( e[1] for e in entries )
+
+            while len( entries ) > 0 and (
+                len( entries ) > self.maxEntries or size > self.maxBytes
+            ):
+                _, entrySize, name = entries.pop()
+                size -= entrySize
+
+                try:
+                    remove( path.join( self.folder, name ) )
+                except OSError:
+                    pass
@@ -0,0 +1,382 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from html.parser import HTMLParser
+import re
+
+# PARSER ENGINES
+# ------------------------------------------------------------------------------
+# - fast:     Single pass over result HTML with html.parser, no DOM is built.
+# - advanced: AdvancedHTMLParser DOM, one parser per options table and row.
+# ------------------------------------------------------------------------------
+ENGINES = [ 'fast', 'advanced' ]
+
+# ELEMENTS WITHOUT END TAG
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link',
+    'meta', 'param', 'source', 'track', 'wbr'
+}
+
+# OPTIONS TABS IDS ON Y2MATE YOUTUBE DOWNLOADER
+TABS = { 'mp4': 'mp4', 'mp3': 'mp3', 'audio': 'm4a' }
+
+KID_REGEX = re.compile( r'k__id = "([^"]*)"' )
+
+class ParseError( Exception ):
+    '''Error raised when y2mate result HTML has unexpected format'''
+    pass
+
+def parseResult( html, mp3Convert = False, engine = 'fast' ):
+    '''
+    Parse y2mate analyze or mp3 ajax result HTML and return a dict
+    with options, kID and title.
+    - html:       'result' value of JSON response.
+    - mp3Convert: Result comes from Y2mate Youtube MP3 Converter.
+    - engine:     'fast' or 'advanced'.
+    '''
+    # GET KID FROM SCRIPT CONTENT
+    kID = KID_REGEX.search( html )
+
+    if kID is None:
+        raise ParseError( '[Error] kID not found on result!' )
+
+    try:
+        if engine == 'advanced':
+            data = parseResultAdvanced( html, mp3Convert )
+        else:
+            data = parseResultFast( html, mp3Convert )
+    except (
+        AttributeError, IndexError, KeyError, TypeError, ValueError
+    ) as e:
+        raise ParseError( '[Error] Unexpected result format: {}'.format( e ) )
+
+    data['kID'] = kID.group( 1 )
+    return data
+
+def parseLink( html, engine = 'fast' ):
+    '''
+    Get download link (first <a> href) from y2mate convert result HTML,
+    None when there is no link.
+    '''
+    if engine == 'advanced':
+        import AdvancedHTMLParser
+
+        parser = AdvancedHTMLParser.AdvancedHTMLParser()
+        parser.parseStr( html )
+        links = parser.getElementsByTagName('a')
+
+        return links[0].href if len( links ) > 0 else None
+
+    parser = FastOptionsParser( linkOnly = True )
+    parser.feed( html )
+    parser.close()
+
+    return parser.link
+
+# FAST ENGINE
+# ==============================================================================
+class FastOptionsParser( HTMLParser ):
+    '''
+    Single pass y2mate result HTML parser.
+
+    Only a stack of open tags is kept, values are extracted while
+    tags are read:
+    - title: Direct text of first child of first '.caption' element.
+    - tabs:  Rows of first child of '#mp4', '#mp3' and '#audio' tabs,
+             every row is a list of ( td direct text, td child attrs ).
+    - mp3:   'onclick' attr of first child of every li of first ul.
+    - link:  'href' attr of first a element.
+    '''
+
+    def __init__( self, linkOnly = False ):
+        super().__init__( convert_charrefs = False )
+        self.linkOnly = linkOnly
+        self.title    = None
+        self.tabs     = {}
+        self.mp3      = []
+        self.link     = None
+
+        # OPEN TAGS: [ tag, role, childCount, payload ]
+        self.__stack   = []
+        self.__caption = False
+        self.__ul      = False
+        self.__tab     = None
+        self.__row     = None
+
+    def handle_starttag( self, tag, attrs ):
+        # FIRST LINK
+        if tag == 'a' and self.link is None:
+            self.link = dict( attrs ).get( 'href' )
+
+        if self.linkOnly:
+            return
+
+        parent = self.__stack[-1] if len( self.__stack ) > 0 else None
+        role, payload = None, None
+
+        if parent is not None:
+            parent[2] += 1
+            parentRole = parent[1]
+
+            # FIRST CHILD OF CAPTION HAS THE TITLE
+            if parentRole == 'caption' and parent[2] == 1:
+                role, payload = 'title', []
+                self.title = payload
+
+            # FIRST CHILD OF TAB IS OPTIONS TABLE
+            elif parentRole == 'tab' and parent[2] == 1:
+                role = 'table'
+                self.__tab = self.tabs.setdefault( parent[3], [] )
+
+            # CHILDREN OF OPTION CELL HAVE TYPE AND QUALITY
+            elif parentRole == 'td':
+                parent[3][1].append( dict( attrs ) )
+
+            # FIRST CHILD OF MP3 LIST ITEM HAS THE QUALITY
+            elif parentRole == 'li' and parent[2] == 1:
+                self.mp3.append( dict( attrs ).get( 'onclick' ) )
+
+            elif parentRole == 'ul' and tag == 'li':
+                role = 'li'
+
+        if role is None:
+            attrs = dict( attrs )
+            classes = ( attrs.get( 'class' ) or '' ).split()
+            tabID = attrs.get( 'id' )
+
+            if not self.__caption and 'caption' in classes:
+                role = 'caption'
+                self.__caption = True
+            elif tabID in TABS and tabID not in self.tabs:
+                role, payload = 'tab', tabID
+            elif tag == 'ul' and not self.__ul:
+                role = 'ul'
+                self.__ul = True
+            elif self.__tab is not None and tag == 'tr':
+                self.__row = []
+                self.__tab.append( self.__row )
+            elif self.__row is not None and tag == 'td':
+                role, payload = 'td', ( [], [] )
+                self.__row.append( payload )
+
+        if tag not in VOID_TAGS:
+            self.__stack.append( [ tag, role, 0, payload ] )
+
+    def handle_endtag( self, tag ):
+        if self.linkOnly or tag in VOID_TAGS:
+            return
+
+        # CLOSE UNTIL MATCHING TAG, IGNORE STRAY END TAGS
+        for i in range( len( self.__stack ) - 1, -1, -1 ):
+            if self.__stack[i][0] == tag:
+                break
+        else:
+            return
+
+        for frame in self.__stack[i:]:
+            if frame[1] == 'table':
+                self.__tab = None
+                self.__row = None
+        del self.__stack[i:]
+
+    def handle_data( self, data ):
+        if self.linkOnly or len( self.__stack ) == 0:
+            return
+
+        frame = self.__stack[-1]
+
+        if frame[1] == 'title':
+            frame[3].append( data )
+        elif frame[1] == 'td':
+            frame[3][0].append( data )
+
+    # KEEP REFERENCES AS THEY ARE WRITTEN, LIKE ADVANCED ENGINE
+    def handle_entityref( self, name ):
+        self.handle_data( '&' + name + ';' )
+
+    def handle_charref( self, name ):
+        self.handle_data( '&#' + name + ';' )
+
+def parseResultFast( html, mp3Convert = False ):
+    '''Parse result HTML with fast engine'''
+
+    parser = FastOptionsParser()
+    parser.feed( html )
+    parser.close()
+
+    data = { 'title': ''.join( parser.title ) }
+
+    # Y2MATE YOUTUBE MP3 CONVERTER
+    # --------------------------------------------------------------------------
+    if mp3Convert:
+        qualities = [
+            int( onclick.replace( 'changeMp3Type(', '' ).split( ',' )[0] )
+            for onclick in parser.mp3
+        ]
+        qualities.sort()
+
+        data['options'] = {
+            'mp3': [
+                { 'quality': q, 'size': '? MB', 'type': 'mp3' }
+                for q in qualities
+            ]
+        }
+        return data
+    # --------------------------------------------------------------------------
+
+    # Y2MATE YOUTUBE DOWNLOADER
+    # --------------------------------------------------------------------------
+    options = {}
+
+    for tabID, format in TABS.items():
+        rows = []
+
+        # FIRST AND LAST ROWS ARE TABLE HEADER AND FOOTER
+        for tds in parser.tabs.get( tabID, [] )[1:-1]:
+            children = tds[2][1]
+            # WHEN AUDIO TAB IS PROCESSED THERE IS BUTTON BEFORE A ELEMENT
+            button = children[1] if len( children ) == 2 else children[0]
+
+            rows.append( {
+                'quality': int(
+                    button['data-fquality'].replace( 'p', '' )
+                        .replace( 'HFR', '' )
+                ),
+                'size':    ''.join( tds[1][0] ),
+                'type':    button['data-ftype']
+            } )
+
+        if len( rows ) > 0:
+            options[format] = rows
+
+    # FILTER AUDIO MP3 ITEMS (THERE PROBABLY REPEATED)
+    if 'm4a' in options:
+        options['m4a'] = [ e for e in options['m4a'] if e['type'] != 'mp3' ]
+
+    data['options'] = options
+    return data
+    # --------------------------------------------------------------------------
+# ==============================================================================
+
+# ADVANCED ENGINE
+# ==============================================================================
+def parseResultAdvanced( html, mp3Convert = False ):
+    '''Parse result HTML with AdvancedHTMLParser engine'''
+
+    import AdvancedHTMLParser
+
+    parser = AdvancedHTMLParser.AdvancedHTMLParser()
+    parser.parseStr( html )
+
+    # GET VIDEO TITLE
+    title = parser.getElementsByClassName('caption')[0] \
+        .children[0] \
+        .innerText
+
+    if mp3Convert:
+        data = parseYoutubeMp3ConverterOptions( parser )
+    else:
+        data = parseYoutubeDownloaderOptions( parser )
+
+    data['title'] = title
+    return data
+
+def parseYoutubeMp3ConverterOptions( parser ):
+    '''
+    Parse data from Y2mate Youtube MP3 Converter
+    '''
+
+    ul = parser.getElementsByTagName('ul')[0]
+    options = {}
+    options['mp3'] = [
+        int(
+            li.children[0].getAttribute('onclick') \
+                .replace( 'changeMp3Type(', '' ) \
+                .split( ',' )[0]
+        )
+        for li in ul.children
+    ]
+    options['mp3'].sort()
+
+    # ADD EXTRA DATA
+    options['mp3'] = [
+        { 'quality': o, 'size': '? MB', 'type': 'mp3' }
+        for o in  options['mp3']
+    ]
+    return { 'options': options }
+
+def parseYoutubeDownloaderOptions( parser ):
+    '''
+    Parse data from Y2mate Youtube Downloader
+    '''
+
+    # GET OPTIONS
+    options = {}
+    options['mp4'] = parseOptions( parser.getElementById('mp4') )
+    options['mp3'] = parseOptions( parser.getElementById('mp3') )
+    options['m4a'] = parseOptions( parser.getElementById('audio') )
+
+    # CHECK FOR NO DATA
+    for k in list( options.keys() ):
+        if len( options[k] ) == 0:
+            del options[k]
+
+    # FILTER AUDIO MP3 ITEMS (THERE PROBABLY REPEATED)
+    if 'm4a' in options:
+        options['m4a'] = list(
+            filter(
+                (lambda e: e['type'] != 'mp3'),
+                options['m4a']
+            )
+        )
+
+    return { 'options': options }
+
+def parseOptions( tab ):
+    '''
+    Process tab options table on result HTML when
+    user paste video on download textbox at y2mate.com
+    '''
+    import AdvancedHTMLParser
+
+    # WHEN TAB IS NONE THERE IS NO DATA
+    if tab is None:
+        return []
+
+    # PARSE DATA
+    parser = AdvancedHTMLParser.AdvancedHTMLParser()
+    parser.parseStr( tab[0].innerHTML )
+
+    options = []
+
+    # PROCESS DATA
+    for tr in parser.getElementsByTagName('tr')[1:-1]:
+        trParser = AdvancedHTMLParser.AdvancedHTMLParser()
+        trParser.parseStr( tr.innerHTML )
+
+        tdList = trParser.getElementsByTagName('td')
+
+        # FILL OPTION DATA
+        option = { 'quality': None, 'size': tdList[1].innerText, 'type': None }
+        # WHEN AUDIO TAB IS PROCESSED THERE IS BUTTON BEFORE A ELEMENT
+        # ------------------------------------------------------------
+        if len( tdList[2].getChildren() ) == 2:
+            index = 1
+        else:
+            index = 0
+        # ------------------------------------------------------------
+        option['type']    = tdList[2].getChildren()[index] \
+            .getAttribute('data-ftype')
+
+        option['quality'] = tdList[2].getChildren()[index] \
+            .getAttribute('data-fquality')
+
+        # REPLACE p AND HFR strings ON quality INDEX
+        option['quality'] = option['quality'].replace('p', '')
+        option['quality'] = option['quality'].replace('HFR', '')
+
+        option['quality'] = int( option['quality'] )
+        options.append( option )
+
+    return options
+# ==============================================================================
@@ -0,0 +1,43 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from threading import Lock
+
+class ProcessWide:
+    '''
+    Process wide instance shared by every thread, created on first get.
+    Modules give it with their getX() and setX() functions:
+
+        __metrics = ProcessWide( Metrics )
+
+        def getMetrics():
+            return __metrics.get()
+    '''
+
+    def __init__( self, factory = None ):
+        '''
+        - factory: Creates the instance on first get, None gives None
+                   until it's set.
+        '''
+        self.__factory = factory
+        self.__value   = None
+        self.__created = factory is None
+        self.__lock    = Lock()
+
+    def get( self ):
+        '''Get the instance'''
+
+        if not self.__created:
+            with self.__lock:
+                if not self.__created:
+                    self.__value   = self.__factory()
+                    self.__created = True
+
+        return self.__value
+
+    def set( self, value ):
+        '''Replace the instance'''
+
+        with self.__lock:
+            self.__value   = value
+            self.__created = True
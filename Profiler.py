@@ -0,0 +1,405 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Profiling mode. Every phase of a run (analyze request, HTML parsing and
+download) is profiled with cProfile, its memory peak and allocation
+sites are traced with tracemalloc, and a report of every phase is
+written to a folder when the run ends.
+'''
+
+from ProcessWide import ProcessWide
+from contextlib import nullcontext
+from os import makedirs, path
+from threading import Lock, local
+from time import monotonic
+import io
+
+# PROFILED PHASES
+# ------------------------------------------------------------------------------
+# - analyze:  Analyze request of getOptions.
+# - parse:    Result and convert HTML parsing (parseResult, parseLink).
+# - download: File body saved, its segment and writer threads too.
+# - async:    Whole asyncio batch, its phases run interleaved on one
+#             thread so they aren't told apart.
+# Time of a phase running inside another one (parse on getOptions) only
+# counts on the inner one. CPU profiles are per thread, memory is process
+# wide: peaks and allocation sites are exact with one download at once
+# ('-w 1 -s 1').
+# ------------------------------------------------------------------------------
+PHASES = [ 'analyze', 'parse', 'download', 'async' ]
+
+class Section:
+    '''Phase running on a thread, phases inside it pause it'''
+
+    __slots__ = (
+        'phase', 'profile', 'started', 'paused', 'pausedAt', 'depth', 'base',
+        'peak', 'snapshot'
+    )
+
+    def __init__( self, phase, started ):
+        self.phase    = phase
+        self.profile  = None
+        self.started  = started
+        self.paused   = 0
+        self.pausedAt = None
+        self.depth    = 0
+        self.base     = 0
+        self.peak     = 0
+        self.snapshot = None
+
+class PhaseSection:
+    '''Context manager of a Profiler phase, see Profiler.phase'''
+
+    def __init__( self, profiler, phase ):
+        self.profiler = profiler
+        self.phase    = phase
+
+    def __enter__( self ):
+        self.profiler.enter( self.phase )
+        return self
+
+    def __exit__( self, *args ):
+        self.profiler.exit( self.phase )
+
+class Profiler:
+    '''
+    CPU and memory profiles of every phase, see PROFILED PHASES. Without
+    folder nothing is profiled. Thread safe.
+
+        with getProfiler().phase( 'parse' ):
+            data = parseResult( html )
+        ...
+        getProfiler().close()
+
+    Reports written by close to folder:
+    - PHASE.prof:  pstats dump of the phase (pstats, snakeviz...).
+    - PHASE.txt:   Time, memory peak, top allocation sites and top
+                   functions by cumulative and own time.
+    - summary.txt: Time and memory peak of every phase.
+    Seconds of a phase are summed over its sections, so phases running
+    on many threads at once take longer than the run.
+    '''
+
+    def __init__( self, folder = None, top = 30, samples = 5, frames = 1 ):
+        '''
+        - folder:  Folder reports are written to, None disables profiling.
+        - top:     Functions and allocation sites shown on reports.
+        - samples: Sections of every phase whose allocation sites are
+                   traced, memory snapshots are slow.
+        - frames:  Frames kept by tracemalloc of every allocation.
+        '''
+        self.folder   = folder
+        self.top      = top
+        self.samples  = samples
+        self.peak     = 0
+        self.__phases = {}
+        self.__counts = {}
+        self.__local  = local()
+        self.__lock   = Lock()
+        self.__closed = False
+
+        if self.enabled:
+            # LOADED BEFORE TRACING, THEY AREN'T ALLOCATIONS OF A PHASE
+            import cProfile
+            import pstats
+            import tracemalloc
+
+            if not tracemalloc.is_tracing():
+                tracemalloc.start( frames )
+
+    @property
+    def enabled( self ):
+        return self.folder is not None
+
+    def phase( self, name ):
+        '''Get context manager that profiles phase name on this thread'''
+
+        if not self.enabled or self.__closed:
+            return nullcontext()
+
+        return PhaseSection( self, name )
+
+    def wrap( self, name, function ):
+        '''Get function running on phase name, i.e. for other threads'''
+
+        if not self.enabled:
+            return function
+
+        def profiled( *args, **kwargs ):
+            with self.phase( name ):
+                return function( *args, **kwargs )
+
+        return profiled
+
+    def __getStack( self ):
+        if not hasattr( self.__local, 'stack' ):
+            self.__local.stack = []
+
+        return self.__local.stack
+
+    def __enable( self, profile ):
+        '''Enable profile, False when another one is running'''
+
+        try:
+            profile.enable()
+        except ValueError:
+            # PYTHON 3.12+ RUNS ONE PROFILER AT ONCE, OTHER THREADS SKIP
+            return False
+
+        return True
+
+    def __traceMemory( self, sections ):
+        '''Keep memory peak of sections, before tracemalloc peak reset'''
+
+        import tracemalloc
+
+        peak = tracemalloc.get_traced_memory()[1]
+
+        for section in sections:
+            section.peak = max( section.peak, peak - section.base )
+
+        with self.__lock:
+            self.peak = max( self.peak, peak )
+
+    def enter( self, phase ):
+        '''Start phase on this thread, pausing the running one'''
+
+        import cProfile
+        import tracemalloc
+
+        stack = self.__getStack()
+
+        if len( stack ) > 0 and stack[-1].phase == phase:
+            stack[-1].depth += 1
+            return
+
+        now = monotonic()
+
+        if len( stack ) > 0:
+            outer = stack[-1]
+            outer.pausedAt = now
+
+            if outer.profile is not None:
+                outer.profile.disable()
+
+        with self.__lock:
+            count = self.__counts.get( phase, 0 )
+            self.__counts[phase] = count + 1
+
+        # SNAPSHOT FIRST, ITS OWN MEMORY ISN'T PART OF THE PHASE PEAK
+        section = Section( phase, now )
+
+        if count < self.samples:
+            section.snapshot = tracemalloc.take_snapshot()
+
+        self.__traceMemory( stack )
+        section.base = tracemalloc.get_traced_memory()[0]
+
+        # PYTHON 3.8 HAS NO PEAK RESET, PHASE PEAKS ARE THE PROCESS ONE
+        if hasattr( tracemalloc, 'reset_peak' ):
+            tracemalloc.reset_peak()
+
+        stack.append( section )
+        section.profile = cProfile.Profile()
+
+        if not self.__enable( section.profile ):
+            section.profile = None
+
+    def exit( self, phase ):
+        '''End phase on this thread, resuming the paused one'''
+
+        stack   = self.__getStack()
+        section = stack[-1]
+
+        if section.depth > 0:
+            section.depth -= 1
+            return
+
+        if section.profile is not None:
+            section.profile.disable()
+
+        # PHASES OF THREADS STILL RUNNING AFTER close AREN'T RECORDED
+        if self.__closed:
+            stack.pop()
+            return
+
+        now     = monotonic()
+        seconds = now - section.started - section.paused
+        stack.pop()
+
+        self.__traceMemory( [ section ] + stack )
+        self.__record( section, seconds, self.__getSites( section.snapshot ) )
+        section.snapshot = None
+
+        if len( stack ) > 0:
+            outer = stack[-1]
+            outer.paused  += monotonic() - outer.pausedAt
+            outer.pausedAt = None
+
+            if outer.profile is not None:
+                self.__enable( outer.profile )
+
+    def __getSites( self, before ):
+        '''
+        Get [ ( Frame, bytes, blocks ) ] allocated since before snapshot
+        and still kept, [] without snapshot.
+        '''
+        import cProfile
+        import pstats
+        import tracemalloc
+
+        if before is None:
+            return []
+
+        # PROFILER ALLOCATIONS OF OTHER THREADS AREN'T SITES OF THE PHASE
+        ignored = [
+            tracemalloc.__file__, pstats.__file__, cProfile.__file__, __file__
+        ]
+        diffs   = tracemalloc.take_snapshot().compare_to( before, 'lineno' )
+        sites   = [
+            ( d.traceback[0], d.size_diff, d.count_diff ) for d in diffs
+            if d.size_diff > 0 and d.traceback[0].filename not in ignored
+        ]
+
+        return sites[:self.top]
+
+    def __record( self, section, seconds, sites ):
+        import pstats
+
+        with self.__lock:
+            data = self.__phases.setdefault( section.phase, {
+                'sections': 0,
+                'profiled': 0,
+                'seconds':  0,
+                'peak':     0,
+                'stats':    None,
+                'sites':    {}
+            } )
+            data['sections'] += 1
+            data['seconds']  += seconds
+            data['peak']      = max( data['peak'], section.peak )
+
+            # SECTIONS MAY RUN AT ONCE, EVERY SITE KEEPS ITS LARGEST ONE
+            for frame, size, count in sites:
+                site = ( frame.filename, frame.lineno )
+                data['sites'][site] = max(
+                    data['sites'].get( site, ( 0, 0 ) ), ( size, count )
+                )
+
+            if section.profile is not None:
+                data['profiled'] += 1
+
+                if data['stats'] is None:
+                    data['stats'] = pstats.Stats( section.profile )
+                else:
+                    data['stats'].add( section.profile )
+
+    def getReport( self, phase ):
+        '''Get text report of phase, see Profiler'''
+
+        mb = 1024 * 1024
+
+        with self.__lock:
+            data  = self.__phases[phase]
+            sites = sorted(
+                data['sites'].items(), key = lambda e: e[1][0], reverse = True
+            )[:self.top]
+            lines = [
+                'Phase: {}'.format( phase ),
+                'Sections: {} ({} profiled), {:.6f} s'.format(
+                    data['sections'], data['profiled'], data['seconds']
+                ),
+                'Memory peak: {:.2f} MB'.format( data['peak'] / mb ),
+                '',
+                'Top allocation sites (most bytes kept by a section, first '
+                '{} sections):'.format( self.samples )
+            ]
+            lines += [
+                '  {:10.2f} KB {:8} blocks  {}:{}'.format(
+                    size / 1024, count, filename, lineno
+                )
+                for ( filename, lineno ), ( size, count ) in sites
+            ]
+
+            if data['stats'] is not None:
+                for title, key in [
+                        ( 'cumulative time', 'cumulative' ),
+                        ( 'own time', 'tottime' )
+                    ]:
+                    stream = io.StringIO()
+                    data['stats'].stream = stream
+                    data['stats'].sort_stats( key ).print_stats( self.top )
+                    lines += [
+                        '', 'Functions by {}:'.format( title ),
+                        stream.getvalue().strip( '\n' )
+                    ]
+
+        return '\n'.join( lines ) + '\n'
+
+    def getSummary( self ):
+        '''Get text summary with time and memory peak of every phase'''
+
+        mb = 1024 * 1024
+
+        with self.__lock:
+            phases = dict( self.__phases )
+
+        lines = [
+            'Memory peak: {:.2f} MB'.format( self.peak / mb ),
+            '',
+            '{:10} {:>9} {:>12} {:>10}'.format(
+                'phase', 'sections', 'seconds', 'peak MB'
+            )
+        ]
+        lines += [
+            '{:10} {:9} {:12.6f} {:10.2f}'.format(
+                phase, data['sections'], data['seconds'], data['peak'] / mb
+            )
+            for phase, data in sorted(
+                phases.items(), key = lambda e: PHASES.index( e[0] )
+                    if e[0] in PHASES else len( PHASES )
+            )
+        ]
+
+        return '\n'.join( lines ) + '\n'
+
+    def close( self ):
+        '''Stop profiling and write reports to folder'''
+
+        if not self.enabled or self.__closed:
+            return
+
+        import tracemalloc
+
+        self.__closed = True
+        self.peak = max( self.peak, tracemalloc.get_traced_memory()[1] )
+        tracemalloc.stop()
+        makedirs( self.folder, exist_ok = True )
+
+        with self.__lock:
+            phases = dict( self.__phases )
+
+        for phase, data in phases.items():
+            if data['stats'] is not None:
+                data['stats'].dump_stats(
+                    path.join( self.folder, phase + '.prof' )
+                )
+
+            with open( path.join( self.folder, phase + '.txt' ), 'w' ) as f:
+                f.write( self.getReport( phase ) )
+
+        with open( path.join( self.folder, 'summary.txt' ), 'w' ) as f:
+            f.write( self.getSummary() )
+
+__profiler = ProcessWide( Profiler )
+
+def getProfiler():
+    '''Get process wide profiler'''
+
+    return __profiler.get()
+
+def setProfiler( profiler ):
+    '''Set process wide profiler'''
+
+    __profiler.set( profiler )
@@ -0,0 +1,350 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Progress of running downloads. A download registers the ThroughputMeter
+it already counts every chunk on, so the download loop does no extra
+work to publish its progress. A reporter thread renders all transfers
+together at a fixed rate: one aggregate bar, log lines, JSON events or
+nothing.
+'''
+
+from ProcessWide import ProcessWide
+from threading import Event, Lock, Thread
+from time import monotonic, time
+import json
+import sys
+
+# REPORTERS
+# ------------------------------------------------------------------------------
+# - bar:  One tqdm bar of all running downloads, the file name when
+#         there is only one.
+# - log:  A line with totals and the rate of every file.
+# - json: JSON events, 'start' and 'end' of every file and 'progress'
+#         with totals and every file.
+# - none: Progress is not followed.
+# Reporters write on stderr, so results on stdout are kept clean.
+# ------------------------------------------------------------------------------
+REPORTERS = [ 'bar', 'log', 'json', 'none' ]
+
+class Transfer:
+    '''
+    Download followed by Progress. Its bytes are counted by its meter,
+    initial bytes were saved before (resumed download).
+    '''
+
+    __slots__ = ( 'name', 'meter', 'initial', 'status', 'last', 'rate' )
+
+    def __init__( self, name, meter, initial = 0 ):
+        self.name    = name
+        self.meter   = meter
+        self.initial = initial
+        self.status  = 'running'
+        self.last    = None
+        self.rate    = 0
+
+    def getBytes( self ):
+        '''Get saved bytes, resumed ones too'''
+
+        return self.initial + self.meter.bytes
+
+    def getTotal( self ):
+        '''Get file bytes, 0 when unknown'''
+
+        return self.initial + self.meter.total if self.meter.total > 0 else 0
+
+    def toDict( self ):
+        return {
+            'name':   self.name,
+            'bytes':  self.getBytes(),
+            'total':  self.getTotal(),
+            'rate':   round( self.rate ),
+            'status': self.status
+        }
+
+class Reporter:
+    '''
+    Base reporter, it ignores everything. Reporters are called by one
+    thread at once.
+    - INTERVAL: Default seconds between renders.
+    '''
+
+    INTERVAL = 1
+
+    def __init__( self, file = None ):
+        self.file = file or sys.stderr
+
+    def start( self, transfer ):
+        '''A transfer started'''
+        pass
+
+    def end( self, transfer ):
+        '''A transfer ended, its status is 'ok' or 'fail' '''
+        pass
+
+    def render( self, snapshot ):
+        '''Show snapshot of Progress.getSnapshot'''
+        pass
+
+    def idle( self, snapshot ):
+        '''Last transfer running ended'''
+        pass
+
+    def write( self, line ):
+        self.file.write( line + '\n' )
+        self.file.flush()
+
+class BarReporter( Reporter ):
+    '''Single tqdm bar of every running transfer'''
+
+    INTERVAL = 0.2
+
+    def __init__( self, file = None ):
+        super().__init__( file )
+        self.bar  = None
+        self.base = ( 0, 0 )
+
+    def render( self, snapshot ):
+        from tqdm import tqdm
+
+        files = snapshot['files']
+        desc  = files[0]['name'] if len( files ) == 1 \
+            else '{} files'.format( len( files ) )
+
+        # BAR COUNTS TRANSFERS RUNNING SINCE IT WAS OPENED
+        if self.bar is None:
+            self.base = (
+                snapshot['bytes'] - sum( f['bytes'] for f in files ),
+                snapshot['total'] - sum( f['total'] for f in files )
+            )
+            self.bar  = tqdm(
+                desc = desc, total = snapshot['total'] - self.base[1] or None,
+                initial = snapshot['bytes'] - self.base[0], unit = 'iB',
+                unit_scale = True, unit_divisor = 1024, file = self.file
+            )
+        elif len( files ) > 0:
+            self.bar.set_description_str( desc, refresh = False )
+
+        self.bar.total = snapshot['total'] - self.base[1] or None
+        self.bar.update( snapshot['bytes'] - self.base[0] - self.bar.n )
+        self.bar.refresh()
+
+    def idle( self, snapshot ):
+        # FINAL STATE, NEXT DOWNLOADS GET A NEW BAR
+        self.render( snapshot )
+        self.bar.close()
+        self.bar = None
+
+class LogReporter( Reporter ):
+    '''Plain log lines with totals and the rate of every file'''
+
+    INTERVAL = 5
+
+    def end( self, transfer ):
+        self.write( '[Progress] {} \'{}\' {:.2f} MB'.format(
+            'Done' if transfer.status == 'ok' else 'Failed', transfer.name,
+            transfer.getBytes() / ( 1024 * 1024 )
+        ) )
+
+    def render( self, snapshot ):
+        mb   = 1024 * 1024
+        line = '[Progress] {} running, {} done, {} failed: {:.2f}'.format(
+            len( snapshot['files'] ), snapshot['done'], snapshot['failed'],
+            snapshot['bytes'] / mb
+        )
+
+        if snapshot['total'] > 0:
+            line += '/{:.2f}'.format( snapshot['total'] / mb )
+
+        parts = [ line + ' MB, {:.2f} MB/s'.format( snapshot['rate'] / mb ) ]
+
+        for f in snapshot['files']:
+            percent = '{:.0f}%'.format( 100 * f['bytes'] / f['total'] ) \
+                if f['total'] > 0 else '{:.2f} MB'.format( f['bytes'] / mb )
+
+            parts.append( '{} {} {:.2f} MB/s'.format(
+                f['name'], percent, f['rate'] / mb
+            ) )
+
+        self.write( ' | '.join( parts ) )
+
+class JSONReporter( Reporter ):
+    '''JSON lines events'''
+
+    INTERVAL = 1
+
+    def __event( self, event, data ):
+        self.write( json.dumps(
+            dict( event = event, time = round( time(), 3 ), **data ),
+            ensure_ascii = False
+        ) )
+
+    def start( self, transfer ):
+        self.__event( 'start', transfer.toDict() )
+
+    def end( self, transfer ):
+        self.__event( 'end', transfer.toDict() )
+
+    def render( self, snapshot ):
+        self.__event( 'progress', snapshot )
+
+def getReporter( name, file = None ):
+    '''Get reporter by name (see REPORTERS), None for 'none' '''
+
+    reporters = {
+        'bar': BarReporter, 'log': LogReporter, 'json': JSONReporter
+    }
+
+    if name == 'none':
+        return None
+
+    if name not in reporters:
+        raise ValueError( 'unknown reporter \'{}\''.format( name ) )
+
+    return reporters[name]( file )
+
+class Progress:
+    '''
+    Running transfers and the thread that renders them with reporter
+    every interval seconds (reporter INTERVAL by default) while there
+    are some. Thread safe.
+
+        transfer = progress.start( 'video.mp4', meter )
+        ... meter.update( size ) on every chunk ...
+        progress.end( transfer, ok = True )
+    '''
+
+    def __init__( self, reporter, interval = None ):
+        self.reporter = reporter
+        self.interval = interval or reporter.INTERVAL
+        self.running  = []
+        self.done     = 0
+        self.failed   = 0
+        self.bytes    = 0
+        self.total    = 0
+        self.__rate   = ( monotonic(), 0, 0 )
+        self.__thread = None
+        self.__wake   = Event()
+        self.__closed = False
+        self.__lock   = Lock()
+        self.__render = Lock()
+
+    def start( self, name, meter, initial = 0 ):
+        '''Follow a download of meter, get its Transfer'''
+
+        transfer = Transfer( name, meter, initial )
+
+        with self.__lock:
+            self.running.append( transfer )
+
+            if self.__thread is None and not self.__closed:
+                self.__thread = Thread( target = self.__loop, daemon = True )
+                self.__thread.start()
+
+        with self.__render:
+            self.reporter.start( transfer )
+
+        return transfer
+
+    def end( self, transfer, ok = True ):
+        '''Stop following transfer, ok is False when it failed'''
+
+        transfer.status = 'ok' if ok else 'fail'
+
+        with self.__render:
+            with self.__lock:
+                if transfer not in self.running:
+                    return
+
+                idle = len( self.running ) == 1
+
+            # FINAL STATE IS THE LAST RUNNING TRANSFER ONE
+            final = self.getSnapshot() if idle else None
+
+            with self.__lock:
+                self.running.remove( transfer )
+                self.done   += 1 if ok else 0
+                self.failed += 0 if ok else 1
+                self.bytes  += transfer.getBytes()
+                self.total  += transfer.getTotal()
+
+            transfer.rate = transfer.meter.getMean()
+            self.reporter.end( transfer )
+
+            if idle:
+                self.reporter.idle( final )
+
+    def getSnapshot( self ):
+        '''
+        Get totals ( bytes, total, rate, done, failed ) of every
+        transfer and the running ones on files. Rates are bytes/sec
+        since last snapshot.
+        '''
+        with self.__lock:
+            running = list( self.running )
+            done, failed = self.done, self.failed
+            saved, total = self.bytes, self.total
+
+        now      = monotonic()
+        last, previous, rate = self.__rate
+        seconds  = now - last
+        files    = []
+
+        for transfer in running:
+            count = transfer.getBytes()
+
+            if transfer.last is None:
+                transfer.rate = transfer.meter.getMean()
+            elif seconds > 0:
+                transfer.rate = ( count - transfer.last ) / seconds
+
+            transfer.last = count
+            saved        += count
+            total        += transfer.getTotal()
+            files.append( transfer.toDict() )
+
+        # RATE OF SHORT SNAPSHOT INTERVALS IS KEPT
+        if seconds >= self.interval / 2:
+            rate = max( 0, saved - previous ) / seconds
+            self.__rate = ( now, saved, rate )
+
+        return {
+            'bytes':  saved,
+            'total':  total,
+            'rate':   round( rate ),
+            'done':   done,
+            'failed': failed,
+            'files':  files
+        }
+
+    def __loop( self ):
+        while not self.__wake.wait( self.interval ):
+            with self.__lock:
+                if len( self.running ) == 0:
+                    continue
+
+            with self.__render:
+                self.reporter.render( self.getSnapshot() )
+
+    def close( self ):
+        '''Stop render thread'''
+
+        with self.__lock:
+            self.__closed = True
+
+        self.__wake.set()
+
+        if self.__thread is not None:
+            self.__thread.join()
+
+__progress = ProcessWide()
+
+def getProgress():
+    '''Get process wide Progress, None when downloads aren't followed'''
+
+    return __progress.get()
+
+def setProgress( progress ):
+    '''Set process wide Progress, None stops following downloads'''
+
+    __progress.set( progress )
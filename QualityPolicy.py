@@ -0,0 +1,148 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Quality selection policy. Which option of a video is downloaded: the
+closest quality to the one asked, the best one under a size budget or
+the smallest one at or above a min quality, falling back to other
+formats when the asked one has no option that fits.
+'''
+
+from ProcessWide import ProcessWide
+from Y2mateApi import Y2mateError
+
+# PREFERENCES
+# ------------------------------------------------------------------------------
+# - quality: Highest quality that fits, smallest file between equals.
+# - size:    Smallest file that fits, highest quality between equals.
+# Options of unknown size never fit a size budget and are the last ones
+# by size. When a quality is asked the closest one that fits is taken.
+# Asked quality and quality limits are p or kbps of asked format, so
+# fallback formats only have to fit the size budget.
+# ------------------------------------------------------------------------------
+PREFERENCES = [ 'quality', 'size' ]
+
+class QualityPolicy:
+    '''
+    Option selection policy, see PREFERENCES.
+
+        policy = QualityPolicy( maxSize = 200 * 1024 ** 2,
+            fallback = [ 'm4a', 'mp3' ] )
+        option = policy.select( info.options, 'mp4' )
+    '''
+
+    def __init__(
+            self, maxSize = None, minQuality = None, maxQuality = None,
+            prefer = 'quality', fallback = []
+        ):
+        '''
+        - maxSize:    Max option bytes, None is no budget.
+        - minQuality: Min quality (p or kbps) of selected option.
+        - maxQuality: Max quality (p or kbps) of selected option.
+        - prefer:     Option taken between the ones that fit, see
+                      PREFERENCES.
+        - fallback:   Formats tried in order when asked one has no
+                      option that fits.
+        '''
+        if prefer not in PREFERENCES:
+            raise ValueError( 'unknown preference \'{}\''.format( prefer ) )
+
+        self.maxSize    = maxSize
+        self.minQuality = minQuality
+        self.maxQuality = maxQuality
+        self.prefer     = prefer
+        self.fallback   = list( fallback )
+
+    def getFormats( self, format ):
+        '''Get formats tried for format, in order'''
+
+        return [ format ] + [ f for f in self.fallback if f != format ]
+
+    def fits( self, option, fallback = False ):
+        '''
+        Check if FormatOption is within policy limits, only size budget
+        when it's of a fallback format.
+        '''
+        if self.maxSize is not None \
+            and ( option.size is None or option.size > self.maxSize ):
+            return False
+
+        if fallback:
+            return True
+
+        if self.minQuality is not None and option.quality < self.minQuality:
+            return False
+
+        return self.maxQuality is None or option.quality <= self.maxQuality
+
+    def choose( self, options, quality = None, fallback = False ):
+        '''
+        Get FormatOption of options list that fits policy (closest to
+        quality when given), None when none fits.
+        '''
+        options = [ o for o in options if self.fits( o, fallback ) ]
+
+        if len( options ) == 0:
+            return None
+
+        if quality is not None:
+            return min( options, key = lambda o: (
+                abs( o.quality - quality ), o.quality
+            ) )
+
+        unknown = float( 'inf' )
+
+        if self.prefer == 'size':
+            return min( options, key = lambda o: (
+                unknown if o.size is None else o.size, -o.quality
+            ) )
+
+        return max( options, key = lambda o: (
+            o.quality, -( unknown if o.size is None else o.size )
+        ) )
+
+    def select( self, options, format, quality = None ):
+        '''
+        Get FormatOption of VideoInfo options to download for format and
+        quality, from fallback formats when format has none that fits.
+        Raise Y2mateError when no option fits.
+        '''
+        formats = self.getFormats( format )
+
+        for candidate in formats:
+            fallback = candidate != format
+            option   = self.choose(
+                options.get( candidate, [] ), None if fallback else quality,
+                fallback
+            )
+
+            if option is not None:
+                return option
+
+        if format not in options and len( formats ) == 1:
+            raise Y2mateError( '[Error]: Format specified not available!' )
+
+        raise Y2mateError(
+            '[Error]: No {} option fits quality policy!'.format(
+                ' or '.join( formats )
+            )
+        )
+
+    def __repr__( self ):
+        return 'QualityPolicy( maxSize = {!r}, quality = {!r}-{!r}, ' \
+            'prefer = {!r}, fallback = {!r} )'.format(
+                self.maxSize, self.minQuality, self.maxQuality, self.prefer,
+                self.fallback
+            )
+
+__policy = ProcessWide( QualityPolicy )
+
+def getQualityPolicy():
+    '''Get process wide quality policy, options are selected with it'''
+
+    return __policy.get()
+
+def setQualityPolicy( policy ):
+    '''Set process wide quality policy'''
+
+    __policy.set( policy )
@@ -0,0 +1,193 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from os import path
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+import signal
+
+# RATE SUFFIXES
+UNITS = { '': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3 }
+
+def parseRate( value ):
+    '''
+    Parse rate string in bytes/sec, with optional K, M or G suffix
+    ( '500K', '2M', '1.5M' ). '0' means unlimited.
+    '''
+    value = str( value ).strip().upper()
+
+    if value.endswith( 'B' ):
+        value = value[:-1]
+
+    unit = value[-1:] if value[-1:] in UNITS else ''
+    number = value[:-1] if unit != '' else value
+
+    try:
+        rate = float( number ) * UNITS[unit]
+    except ValueError:
+        raise ValueError( 'Invalid rate \'{}\'!'.format( value ) )
+
+    if rate < 0:
+        raise ValueError( 'Invalid rate \'{}\'!'.format( value ) )
+
+    return int( rate )
+
+class RateLimiter:
+    '''
+    Thread safe token bucket in bytes/sec.
+
+    Consumers take tokens after reading data and wait for the debt, so
+    any read size is allowed. A limiter may have a parent (i.e. a
+    per download limiter under a global one) and then both limits
+    are applied. Rate 0 means unlimited.
+    '''
+
+    def __init__( self, rate = 0, burst = None, parent = None ):
+        '''
+        - rate:   Bytes per second, 0 is unlimited.
+        - burst:  Bytes that may be consumed at once after idle time,
+                  one second of rate by default.
+        - parent: RateLimiter applied too.
+        '''
+        self.parent  = parent
+        self.__lock  = Lock()
+        self.__last  = monotonic()
+        self.setRate( rate, burst )
+        self.__tokens = self.burst
+
+    def setRate( self, rate, burst = None ):
+        '''Change rate and burst, it applies to next consumed bytes'''
+
+        with self.__lock:
+            self.rate  = max( 0, rate )
+            self.burst = burst if burst is not None else self.rate
+
+    def reserve( self, size ):
+        '''
+        Take size tokens and return seconds to wait before use them
+        (0 when there are tokens enough).
+        '''
+        wait = self.parent.reserve( size ) if self.parent else 0
+
+        with self.__lock:
+            if self.rate <= 0:
+                return wait
+
+            # REFILL BUCKET
+            now = monotonic()
+            self.__tokens = min(
+                self.burst,
+                self.__tokens + ( now - self.__last ) * self.rate
+            )
+            self.__last = now
+
+            self.__tokens -= size
+
+            if self.__tokens < 0:
+                wait = max( wait, -self.__tokens / self.rate )
+
+        return wait
+
+    def consume( self, size ):
+        '''Take size tokens, blocks while they are not available'''
+
+        wait = self.reserve( size )
+
+        if wait > 0:
+            sleep( wait )
+
+    async def consumeAsync( self, size ):
+        '''Take size tokens without blocking the event loop'''
+
+        import asyncio
+
+        wait = self.reserve( size )
+
+        if wait > 0:
+            await asyncio.sleep( wait )
+
+class RateControl:
+    '''
+    Change limiter rate at runtime from a control file.
+
+    File contains the rate and optionally the burst, i.e. '2M' or
+    '2M 4M' ('0' is unlimited). It's reloaded when it changes (checked
+    every interval seconds) and on SIGUSR1 where signals are available.
+    '''
+
+    def __init__( self, limiter, filePath, interval = 1, verbose = False ):
+        self.limiter  = limiter
+        self.filePath = filePath
+        self.interval = interval
+        self.verbose  = verbose
+        self.__mtime  = None
+        self.__stop   = Event()
+        self.__wake   = Event()
+
+    def reload( self ):
+        '''Read control file and apply its rate'''
+
+        try:
+            mtime = path.getmtime( self.filePath )
+
+            with open( self.filePath, 'r' ) as f:
+                values = f.read().split()
+        except OSError:
+            return
+
+        self.__mtime = mtime
+
+        if len( values ) == 0:
+            return
+
+        try:
+            rate  = parseRate( values[0] )
+            burst = parseRate( values[1] ) if len( values ) > 1 else None
+        except ValueError as e:
+            print( '[Error] {}: {}'.format( self.filePath, e ) )
+            return
+
+        self.limiter.setRate( rate, burst )
+
+        if self.verbose:
+            print( 'Status: Rate limit set to {} bytes/sec'.format( rate ) )
+
+    def __watch( self ):
+        while not self.__stop.is_set():
+            try:
+                mtime = path.getmtime( self.filePath )
+            except OSError:
+                mtime = None
+
+            if mtime is not None and mtime != self.__mtime:
+                self.reload()
+
+            self.__wake.wait( self.interval )
+
+            # SIGNAL ASKED FOR RELOAD
+            if self.__wake.is_set():
+                self.__wake.clear()
+                self.reload()
+
+    def start( self ):
+        '''Load control file and watch it on a daemon thread'''
+
+        self.reload()
+
+        # SIGNAL HANDLERS CAN ONLY BE SET ON MAIN THREAD
+        if hasattr( signal, 'SIGUSR1' ):
+            try:
+                signal.signal(
+                    signal.SIGUSR1, lambda signum, frame: self.__wake.set()
+                )
+            except ValueError:
+                pass
+
+        Thread( target = self.__watch, daemon = True ).start()
+        return self
+
+    def stop( self ):
+        '''Stop watching control file'''
+
+        self.__stop.set()
+        self.__wake.set()
@@ -1,15 +1,26 @@
 #!/usr/bin/python3.8
 # -*- coding: utf-8 -*-
 
+from Metrics import getMetrics
+from Retry import getErrorKind, getRetryPolicy
+from SessionPool import getSessionPool
+from time import monotonic, sleep
 from urllib.parse import urlparse
 import requests
 
 class Request:
-    '''Simple wrapper for make HTTP requests'''
+    '''
+    Simple wrapper for make HTTP requests.
+
+    When no session is given the process wide session pool is used, so
+    connections are kept alive between requests. Failed requests are
+    retried according retry policy, the process wide one by default.
+    '''
 
     def __init__(
             self, method = 'GET', url = '', headers = {}, data = {}, \
-            session = None, debug = False, stream = False, timeout = 60 \
+            session = None, debug = False, stream = False, timeout = 60, \
+            retry = None \
         ):
         self.__allowedMethods = ['GET', 'POST']
         self.__data     = data
@@ -20,8 +31,11 @@ class Request:
         self.__url      = url
         self.__stream   = stream
         self.__timeout  = timeout
+        self.__verify   = True
+        self.__retry    = retry
         self.request  = None
         self.response = None
+        self.retries  = 0
     
     def addData(self, key = '', value = ''):
         '''Add data item to data dict'''
@@ -90,11 +104,13 @@ class Request:
         print(debugText)
     
     def disableSSLVerification(self, hideWarnings  = True):
+        '''Send this request from the not verified session pool'''
+
         if hideWarnings:
             requests.packages.urllib3.disable_warnings()
 
-        self.__session = requests.Session()
-        self.__session.verify = False
+        self.__verify  = False
+        self.__session = getSessionPool().getSession( verify = False )
 
     def do(self):
         '''Do request and return the response'''
@@ -106,7 +122,7 @@ class Request:
             print( '[ERROR] url is empty!' )
 
         if self.__session is None:
-            self.__session = requests.Session()
+            self.__session = getSessionPool().getSession( self.__verify )
         
         # PREPARE REQUEST
         # ----------------------------------------------------------------------
@@ -125,13 +141,53 @@ class Request:
         if self.__debug:
             self.debugRequest()
         
-        # SEND REQUEST
-        self.response = self.__session \
-            .send( self.__preparedRequest, verify = True, \
-                stream = self.__stream, timeout = self.__timeout )
+        # SEND REQUEST (RETRYING FAILED ATTEMPTS)
+        # ----------------------------------------------------------------------
+        policy  = self.__retry or getRetryPolicy()
+        started = monotonic()
+        self.retries = 0
 
-        if self.__debug:
-            self.debugResponse()
+        while True:
+            try:
+                self.response = self.__session \
+                    .send( self.__preparedRequest, verify = self.__verify, \
+                        stream = self.__stream, timeout = self.__timeout )
+            except requests.RequestException as e:
+                kind  = getErrorKind( e )
+                delay = None
+
+                if kind is not None and policy.isRetryError( kind ):
+                    delay = policy.next( self.retries, started )
+
+                if delay is None:
+                    raise
+
+                reason = kind
+            else:
+                if self.__debug:
+                    self.debugResponse()
+
+                if not policy.isRetryStatus( self.response.status_code ):
+                    break
+
+                delay = policy.next( self.retries, started )
+
+                if delay is None:
+                    break
+
+                reason = 'HTTP {}'.format( self.response.status_code )
+                self.response.close()
+
+            if self.__debug:
+                print( '[Retry] {} on {}, retrying in {:.1f} s...'.format(
+                    reason, self.__url, delay
+                ) )
+
+            sleep( delay )
+            self.retries += 1
+        # ----------------------------------------------------------------------
+
+        getMetrics().add( 'retries', self.retries )
 
         return self.response
 
@@ -0,0 +1,132 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from ProcessWide import ProcessWide
+from time import monotonic
+import random
+
+# RETRY RULES
+# ------------------------------------------------------------------------------
+# - <status>:   HTTP status code, i.e. '522', '429'.
+# - 5xx:        Any HTTP server error.
+# - connection: Connection refused or reset.
+# - timeout:    Connect or read timeout.
+# ------------------------------------------------------------------------------
+DEFAULT_RULES = [ '522', '5xx', 'connection', 'timeout' ]
+
+class RetryPolicy:
+    '''
+    Retry policy with exponential backoff and full jitter.
+
+    Attempt n (from 0) waits a random time between 0 and
+    min( maxBackoff, backoff * 2 ** n ) before the next one. No more
+    attempts are made when deadline seconds passed since the first one.
+    '''
+
+    def __init__(
+            self, attempts = 1, backoff = 1, maxBackoff = 60,
+            rules = DEFAULT_RULES, deadline = 0
+        ):
+        '''
+        - attempts:   Max attempts of every request, 1 is no retries.
+        - backoff:    Base wait in seconds.
+        - maxBackoff: Max wait between attempts.
+        - rules:      What is retried, see RETRY RULES.
+        - deadline:   Max seconds for all attempts, 0 is no deadline.
+        '''
+        self.attempts   = max( 1, attempts )
+        self.backoff    = backoff
+        self.maxBackoff = maxBackoff
+        self.rules      = set( str( r ) for r in rules )
+        self.deadline   = deadline
+
+    def isRetryStatus( self, status ):
+        '''Check if HTTP status is retried'''
+
+        if str( status ) in self.rules:
+            return True
+
+        return '5xx' in self.rules and 500 <= status < 600
+
+    def isRetryError( self, kind ):
+        '''Check if error kind ( 'connection' or 'timeout' ) is retried'''
+
+        return kind in self.rules
+
+    def getDelay( self, attempt ):
+        '''Get seconds to wait after failed attempt (from 0)'''
+
+        return random.uniform(
+            0, min( self.maxBackoff, self.backoff * 2 ** attempt )
+        )
+
+    def next( self, attempt, started ):
+        '''
+        Get seconds to wait before retrying failed attempt (from 0)
+        started at monotonic time started, None when there are no
+        attempts left or deadline would be exceeded.
+        '''
+        if attempt + 1 >= self.attempts:
+            return None
+
+        delay = self.getDelay( attempt )
+
+        if self.deadline > 0 \
+            and monotonic() + delay - started > self.deadline:
+            return None
+
+        return delay
+
+def getErrorKind( error ):
+    '''
+    Classify requests, urllib3 or aiohttp exception as 'timeout', 'connection'
+    or None when it's not a network error.
+    '''
+    import requests
+    import urllib3
+
+    # STREAMED BODIES RAISE urllib3 ERRORS WHEN READ FROM raw
+    if isinstance( error, (
+        requests.exceptions.Timeout, urllib3.exceptions.TimeoutError
+    ) ):
+        return 'timeout'
+
+    if isinstance( error, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.ChunkedEncodingError,
+        urllib3.exceptions.ProtocolError,
+        ConnectionError
+    ) ):
+        return 'connection'
+
+    if isinstance( error, TimeoutError ):
+        return 'timeout'
+
+    try:
+        import asyncio
+        import aiohttp
+    except ImportError:
+        return None
+
+    if isinstance( error, ( asyncio.TimeoutError, aiohttp.ServerTimeoutError ) ):
+        return 'timeout'
+
+    # PAYLOAD ERRORS ARE STREAMS THAT DROPPED WHILE READ
+    if isinstance( error, (
+        aiohttp.ClientConnectionError, aiohttp.ClientPayloadError
+    ) ):
+        return 'connection'
+
+    return None
+
+__policy = ProcessWide( RetryPolicy )
+
+def getRetryPolicy():
+    '''Get process wide retry policy used by requests by default'''
+
+    return __policy.get()
+
+def setRetryPolicy( policy ):
+    '''Set process wide retry policy'''
+
+    __policy.set( policy )
@@ -0,0 +1,355 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from ProcessWide import ProcessWide
+from threading import Lock, get_ident
+import requests
+import socket
+import urllib3
+
+# CANCELLABLE REQUESTS
+# ------------------------------------------------------------------------------
+# Pools of the session pool adapters give every connection they hand out
+# to the CancelScope of the thread taking it, if any. Cancelling a scope
+# shuts its connections down, so a request blocked on them fails right
+# away, and makes its thread fail to take new ones. This way a hedged
+# request that lost doesn't keep a connection and pool slot until its
+# timeout. A request still connecting ends at its connect timeout.
+# ------------------------------------------------------------------------------
+
+class CancelScope:
+    '''
+    Requests of a thread that can be cancelled from another one, see
+    CANCELLABLE REQUESTS. It may be cancelled before it's entered.
+
+        scope = CancelScope()
+        with scope:
+            ... requests of this thread, scope.cancel() from another ...
+    '''
+
+    def __init__( self ):
+        self.cancelled     = False
+        self.__connections = set()
+        self.__lock        = Lock()
+
+    def __enter__( self ):
+        setCancelScope( self )
+        return self
+
+    def __exit__( self, *args ):
+        setCancelScope( None )
+
+    def take( self, conn ):
+        '''Track connection conn taken by the thread, raise if cancelled'''
+
+        with self.__lock:
+            if self.cancelled:
+                raise ConnectionAbortedError( 'Request cancelled' )
+
+            self.__connections.add( conn )
+            conn.cancelScope = self
+
+    def give( self, conn ):
+        '''Stop tracking connection conn, it's back on its pool'''
+
+        with self.__lock:
+            self.__connections.discard( conn )
+            conn.cancelScope = None
+
+    def cancel( self ):
+        '''Shut down connections in use, later ones fail to be taken'''
+
+        with self.__lock:
+            self.cancelled = True
+            connections    = list( self.__connections )
+
+        for conn in connections:
+            sock = getattr( conn, 'sock', None )
+
+            if sock is None:
+                continue
+
+            try:
+                sock.shutdown( socket.SHUT_RDWR )
+            except OSError:
+                pass
+
+def getTrackedPool( cls ):
+    '''
+    Get subclass of urllib3 pool class cls whose connections are tracked
+    by cancel scopes and counted while they're in use
+    '''
+    class TrackedPool( cls ):
+        def __init__( self, *args, **kwargs ):
+            super().__init__( *args, **kwargs )
+            self.inUse     = 0
+            self.inUseLock = Lock()
+
+        def _get_conn( self, timeout = None ):
+            conn  = super()._get_conn( timeout )
+            scope = getCancelScope()
+
+            if scope is not None:
+                try:
+                    scope.take( conn )
+                except ConnectionAbortedError:
+                    super()._put_conn( conn )
+                    raise
+
+            with self.inUseLock:
+                self.inUse += 1
+
+            return conn
+
+        def _put_conn( self, conn ):
+            # IT MAY BE GIVEN BACK BY ANOTHER THREAD
+            scope = getattr( conn, 'cancelScope', None )
+
+            if scope is not None:
+                scope.give( conn )
+
+            with self.inUseLock:
+                self.inUse = max( 0, self.inUse - 1 )
+
+            super()._put_conn( conn )
+
+    return TrackedPool
+
+TRACKED_POOLS = {
+    'http':  getTrackedPool( urllib3.HTTPConnectionPool ),
+    'https': getTrackedPool( urllib3.HTTPSConnectionPool )
+}
+
+class TrackedAdapter( requests.adapters.HTTPAdapter ):
+    '''HTTP adapter whose pools track connections, see CancelScope'''
+
+    def init_poolmanager( self, *args, **kwargs ):
+        super().init_poolmanager( *args, **kwargs )
+        self.poolmanager.pool_classes_by_scheme = TRACKED_POOLS
+
+class SessionPool:
+    '''
+    Process wide requests sessions with keep-alive connection pools.
+
+    Requests with and without SSL verification use different sessions,
+    so their connections are never mixed. Every host may have its own
+    pool size, downloads reserve connections of their host so the pool
+    grows to what concurrent downloads need. A pool replaced by a bigger
+    one is closed once none of its connections is in use.
+    '''
+
+    def __init__( self, poolConnections = 10, poolMaxsize = 10 ):
+        '''
+        - poolConnections: Count of hosts with cached connection pools.
+        - poolMaxsize:     Default kept-alive connections for each host.
+        '''
+        self.poolConnections = poolConnections
+        self.poolMaxsize     = poolMaxsize
+        self.__adapters      = {}
+        self.__closed        = { 'opened': 0, 'requests': 0 }
+        self.__hostSizes     = {}
+        self.__lock          = Lock()
+        self.__reserved      = {}
+        self.__retired       = []
+        self.__sessions      = {}
+
+    def __newAdapter( self, key, poolMaxsize ):
+        '''
+        Create HTTP adapter of key ( verify, host ) and keep it for stats,
+        the adapter it replaces is retired (closed when it's idle).
+        '''
+        adapter = TrackedAdapter(
+            pool_connections = self.poolConnections,
+            pool_maxsize     = poolMaxsize
+        )
+        old = self.__adapters.get( key )
+        self.__adapters[key] = adapter
+
+        # OTHER THREADS MAY STILL STREAM THROUGH IT
+        if old is not None:
+            self.__retired.append( old )
+
+        self.__closeRetired()
+        return adapter
+
+    def __closeRetired( self, force = False ):
+        '''Close retired adapters with no connection in use, all if force'''
+
+        for adapter in list( self.__retired ):
+            if not force and isAdapterBusy( adapter ):
+                continue
+
+            # STATS OF ITS CONNECTIONS ARE KEPT
+            stats = getAdapterStats( adapter )
+            self.__closed['opened']   += stats['opened']
+            self.__closed['requests'] += stats['requests']
+            self.__retired.remove( adapter )
+            adapter.close()
+
+    def __mountHost( self, session, host, size ):
+        '''Mount host adapter with its own pool size on session'''
+
+        adapter = self.__newAdapter( ( session.verify, host ), size )
+        session.mount( 'http://' + host + '/', adapter )
+        session.mount( 'https://' + host + '/', adapter )
+
+    def getSession( self, verify = True ):
+        '''Get shared session for verified or not verified requests'''
+
+        with self.__lock:
+            if verify in self.__sessions:
+                return self.__sessions[verify]
+
+            session = requests.Session()
+            session.verify = verify
+
+            adapter = self.__newAdapter( ( verify, None ), self.poolMaxsize )
+            session.mount( 'http://', adapter )
+            session.mount( 'https://', adapter )
+
+            for host, size in self.__hostSizes.items():
+                self.__mountHost( session, host, size )
+
+            self.__sessions[verify] = session
+            return session
+
+    def getHostPoolSize( self, host ):
+        '''Get connections kept alive for host'''
+
+        return self.__hostSizes.get( host, self.poolMaxsize )
+
+    def __setHostPoolSize( self, host, size ):
+        '''setHostPoolSize with the lock held'''
+
+        self.__hostSizes[host] = size
+
+        for session in self.__sessions.values():
+            self.__mountHost( session, host, size )
+
+    def setHostPoolSize( self, host, size ):
+        '''
+        Set connections kept alive for host (netloc). Its previous pool
+        is closed once its requests end, connections already opened to
+        host are not reused after this.
+        '''
+        with self.__lock:
+            self.__setHostPoolSize( host, size )
+
+    def ensureHostPoolSize( self, host, size ):
+        '''Grow host pool size to keep at least size connections'''
+
+        with self.__lock:
+            if self.__hostSizes.get( host, self.poolMaxsize ) < size:
+                self.__setHostPoolSize( host, size )
+
+    def reserveHostPool( self, host, count ):
+        '''
+        Reserve count connections of host (netloc) for a download, until
+        releaseHostPool. Host pool grows to keep the connections of all
+        the downloads from host at once.
+        '''
+        with self.__lock:
+            reserved = self.__reserved.get( host, 0 ) + count
+            self.__reserved[host] = reserved
+
+            if self.__hostSizes.get( host, self.poolMaxsize ) < reserved:
+                self.__setHostPoolSize( host, reserved )
+
+    def releaseHostPool( self, host, count ):
+        '''Release count connections of host reserved by reserveHostPool'''
+
+        with self.__lock:
+            self.__reserved[host] = max(
+                0, self.__reserved.get( host, 0 ) - count
+            )
+            self.__closeRetired()
+
+    def getStats( self ):
+        '''
+        Get connection stats of all pools: connections opened, requests
+        sent and connections reused.
+        '''
+        with self.__lock:
+            opened = self.__closed['opened']
+            sent   = self.__closed['requests']
+
+            for adapter in list( self.__adapters.values() ) + self.__retired:
+                stats   = getAdapterStats( adapter )
+                opened += stats['opened']
+                sent   += stats['requests']
+
+        return {
+            'opened':   opened,
+            'requests': sent,
+            'reused':   max( 0, sent - opened )
+        }
+
+    def close( self ):
+        '''Close all sessions and their connections'''
+
+        with self.__lock:
+            for session in self.__sessions.values():
+                session.close()
+            self.__sessions = {}
+            self.__closeRetired( True )
+
+def getAdapterStats( adapter ):
+    '''Get connections opened and requests sent by HTTP adapter pools'''
+
+    opened = 0
+    sent   = 0
+    pools  = adapter.poolmanager.pools
+
+    for key in pools.keys():
+        pool = pools.get( key )
+
+        if pool is not None:
+            opened += pool.num_connections
+            sent   += pool.num_requests
+
+    return { 'opened': opened, 'requests': sent }
+
+def isAdapterBusy( adapter ):
+    '''Tell whether HTTP adapter pools have connections in use'''
+
+    pools = adapter.poolmanager.pools
+
+    for key in pools.keys():
+        pool = pools.get( key )
+
+        if pool is not None and getattr( pool, 'inUse', 0 ) > 0:
+            return True
+
+    return False
+
+__scopes = {}
+__scopesLock = Lock()
+
+def getCancelScope():
+    '''Get CancelScope of this thread, None when it has none'''
+
+    with __scopesLock:
+        return __scopes.get( get_ident() )
+
+def setCancelScope( scope ):
+    '''Set CancelScope of this thread, None removes it'''
+
+    with __scopesLock:
+        if scope is None:
+            __scopes.pop( get_ident(), None )
+        else:
+            __scopes[get_ident()] = scope
+
+__pool = ProcessWide( SessionPool )
+
+def getSessionPool():
+    '''Get process wide session pool'''
+
+    return __pool.get()
+
+def formatPoolStats( stats ):
+    '''Get pool stats in human readable string'''
+
+    return 'Connections: {} opened, {} reused ({} requests)'.format(
+        stats['opened'], stats['reused'], stats['requests']
+    )
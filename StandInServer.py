@@ -0,0 +1,498 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Local y2mate stand-in server, for tests and benchmarks without hitting
+y2mate.com. It answers analyze, mp3 analyze, convert and mp3Convert
+endpoints with HTML like y2mate's (mp3 conversions may take a while),
+and serves generated files with Range support, latency, throttling and
+injected errors.
+
+Run it and point y2mate-download at it:
+    ./StandInServer.py --port 8080 --latency 0.05 --error-522 0.1
+    Y2MATE_BASE_URL=http://127.0.0.1:8080 ./y2mate-download.py -f mp4 URL
+'''
+
+from RateLimiter import RateLimiter, parseRate
+from Y2mateApi import ANALYZE_PATH, CONVERT_PATH, MP3_ANALYZE_PATH, \
+    MP3_CONVERT_PATH
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import monotonic, sleep
+from urllib.parse import parse_qs, urlparse
+import argparse
+import hashlib
+import html
+import json
+import random
+
+# GENERATED FILES ARE THIS BLOCK REPEATED
+BLOCK_SIZE = 64 * 1024
+
+# OPTIONS OFFERED FOR EVERY VIDEO: ( quality, size )
+MP4_OPTIONS = [
+    ( '1080p', '95.3 MB' ), ( '720p', '45.1 MB' ), ( '480p', '20.2 MB' ),
+    ( '360p', '12 MB' ), ( '144p', '3.1 MB' )
+]
+MP3_QUALITIES = [ 320, 256, 192, 128, 64 ]
+
+def getKID( vID ):
+    '''Get stand-in kID of vID'''
+
+    return hashlib.sha1( vID.encode() ).hexdigest()[:16]
+
+def getFileBlock( name ):
+    '''Get the block that file name content repeats'''
+
+    seed  = hashlib.sha256( name.encode() ).digest()
+    block = bytearray()
+
+    while len( block ) < BLOCK_SIZE:
+        seed = hashlib.sha256( seed ).digest()
+        block += seed
+
+    return bytes( block[:BLOCK_SIZE] )
+
+def getFileData( name, start, end, block = None ):
+    '''Get bytes start to end (inclusive) of generated file name'''
+
+    block  = block or getFileBlock( name )
+    offset = start % BLOCK_SIZE
+    size   = end - start + 1
+    copies = ( offset + size ) // BLOCK_SIZE + 1
+
+    return ( block * copies )[offset:offset + size]
+
+# RESULT HTML
+# ==============================================================================
+def getOptionRow( quality, size, ftype, button = False ):
+    '''Get options table row like y2mate ones'''
+
+    return (
+        '<tr><td><a href="#" rel="nofollow" onclick="return false;">'
+        '{q} (.{t})</a></td><td>{s}</td><td class="txt-center">{b}'
+        '<a href="#" rel="nofollow" type="button" class="btn btn-success" '
+        'data-toggle="modal" data-target="#progressModal" id="process_{t}" '
+        'data-ftype="{t}" data-fquality="{q}"><span class="glyphicon '
+        'glyphicon-download-alt"></span> Download</a></td></tr>\n'
+    ).format(
+        q = quality, s = size, t = ftype,
+        b = '<button class="btn btn-default" onclick="return false;">'
+            '<span class="glyphicon glyphicon-play"></span></button>' \
+            if button else ''
+    )
+
+def getOptionsTab( tabID, rows, active = '' ):
+    '''Get options tab, first and last rows are header and footer'''
+
+    return (
+        '<div role="tabpanel" class="tab-pane fade {a}" id="{i}">'
+        '<table class="table table-bordered"><thead><tr><th>Resolution</th>'
+        '<th>FileSize</th><th>Download</th></tr></thead><tbody>\n{r}'
+        '<tr><td colspan="3"><a href="#" class="more">More</a></td></tr>'
+        '</tbody></table></div>\n'
+    ).format( a = active, i = tabID, r = ''.join( rows ) )
+
+def getTitle( vID ):
+    '''Get stand-in video title'''
+
+    return 'Stand-in video {}'.format( vID )
+
+def getAnalyzeResult( vID ):
+    '''Get analyze ajax result HTML of Y2mate Youtube Downloader'''
+
+    mp4   = [ getOptionRow( q, s, 'mp4' ) for q, s in MP4_OPTIONS ]
+    mp3   = [ getOptionRow( '128', '3.3 MB', 'mp3' ) ]
+    audio = [
+        getOptionRow( '128', '3.3 MB', 'mp3', True ),
+        getOptionRow( '128', '3.5 MB', 'm4a', True )
+    ]
+
+    return (
+        '<div class="tabs row"><div class="col-xs-12 col-sm-5 col-md-5">'
+        '<div class="thumbnail cover"><a href="https://www.youtube.com/watch'
+        '?v={v}" rel="nofollow"><img class="img-thumbnail" '
+        'src="https://i.ytimg.com/vi/{v}/0.jpg" alt="{t}"></a>'
+        '<div class="caption text-left"><b>{t}</b></div></div></div>'
+        '<div class="col-xs-12 col-sm-7 col-md-7"><ul class="nav nav-tabs" '
+        'role="tablist"><li class="active"><a href="#mp4" data-toggle="tab">'
+        'Video</a></li><li><a href="#mp3">mp3</a></li><li><a href="#audio">'
+        'Audio</a></li></ul><div class="tab-content">{mp4}{mp3}{audio}</div>'
+        '</div></div><script type="text/javascript">var k__id = "{k}"; '
+        'var k_data_vid = "{v}";</script>'
+    ).format(
+        v = vID, t = html.escape( getTitle( vID ) ), k = getKID( vID ),
+        mp4 = getOptionsTab( 'mp4', mp4, 'active in' ),
+        mp3 = getOptionsTab( 'mp3', mp3 ),
+        audio = getOptionsTab( 'audio', audio )
+    )
+
+def getMp3Result( vID ):
+    '''Get mp3 ajax result HTML of Y2mate Youtube MP3 Converter'''
+
+    items = ''.join(
+        '<li><a href="#" onclick="changeMp3Type({q}, \'{v}\');'
+        'return false;">{q}kbps</a></li>'.format( q = q, v = vID )
+        for q in MP3_QUALITIES
+    )
+
+    return (
+        '<div class="row"><div class="thumbnail cover"><img src="https://'
+        'i.ytimg.com/vi/{v}/0.jpg"><div class="caption text-left"><b>{t}</b>'
+        '</div></div><ul class="list-mp3">{i}</ul></div>'
+        '<script>var k__id = "{k}";</script>'
+    ).format(
+        v = vID, t = html.escape( getTitle( vID ) ), i = items,
+        k = getKID( vID )
+    )
+
+def getConvertResult( fileLink ):
+    '''Get convert ajax result HTML with the file download link'''
+
+    return (
+        '<div class="form-group has-success has-feedback"><a href="{l}" '
+        'rel="nofollow" type="button" class="btn btn-success btn-file">'
+        '<i class="glyphicon glyphicon-download-alt"></i> Download</a></div>'
+    ).format( l = html.escape( fileLink ) )
+# ==============================================================================
+
+class StandInHandler( BaseHTTPRequestHandler ):
+    '''Request handler of StandInServer, settings are server attributes'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message( self, format, *args ):
+        if self.server.verbose:
+            super().log_message( format, *args )
+
+    def sendJSON( self, data, status = 200 ):
+        body = json.dumps( data ).encode()
+
+        self.send_response( status )
+        self.send_header( 'Content-Type', 'application/json' )
+        self.send_header( 'Content-Length', str( len( body ) ) )
+        self.end_headers()
+        self.wfile.write( body )
+
+    def sendEmpty( self, status ):
+        self.send_response( status )
+        self.send_header( 'Content-Length', '0' )
+        self.end_headers()
+
+    def do_POST( self ):
+        size = int( self.headers.get( 'Content-Length', 0 ) )
+        form = parse_qs( self.rfile.read( size ).decode() )
+        form = { k: v[0] for k, v in form.items() }
+        path = urlparse( self.path ).path
+
+        self.server.count( 'api' )
+        sleep( self.server.latency + self.server.getStall() )
+
+        # ANALYZE ENDPOINTS
+        if path in [ ANALYZE_PATH, MP3_ANALYZE_PATH ]:
+            vID = parse_qs( urlparse( form.get( 'url', '' ) ).query ) \
+                .get( 'v', [ '' ] )[0]
+
+            if vID == '':
+                return self.sendJSON( { 'status': 'error', 'result': '' } )
+
+            if path == ANALYZE_PATH:
+                result = getAnalyzeResult( vID )
+            else:
+                result = getMp3Result( vID )
+
+            return self.sendJSON( { 'status': 'success', 'result': result } )
+
+        # CONVERT ENDPOINTS
+        if path in [ CONVERT_PATH, MP3_CONVERT_PATH ]:
+            vID = form.get( 'v_id', '' )
+
+            if form.get( '_id' ) != getKID( vID ):
+                return self.sendJSON( { 'status': 'error', 'result': '' } )
+
+            # MP3 CONVERSIONS TAKE A WHILE, REQUESTS ARE HELD UP TO HOLD
+            if path == MP3_CONVERT_PATH:
+                left = self.server.getConvertLeft(
+                    vID, form.get( 'ftype' ), form.get( 'fquality' )
+                )
+
+                if left > self.server.convertHold:
+                    sleep( self.server.convertHold )
+                    return self.sendJSON( {
+                        'status': 'success', 'c_status': 'CONVERTING',
+                        'result': ''
+                    } )
+
+                sleep( left )
+
+            fileLink = 'http://{}/file/{}.{}?q={}'.format(
+                self.headers.get( 'Host' ), vID, form.get( 'ftype' ),
+                form.get( 'fquality' )
+            )
+            return self.sendJSON( {
+                'status': 'success', 'c_status': 'CONVERTED',
+                'result': getConvertResult( fileLink )
+            } )
+
+        self.sendEmpty( 404 )
+
+    def do_GET( self ):
+        path = urlparse( self.path ).path
+
+        if not path.startswith( '/file/' ):
+            return self.sendEmpty( 404 )
+
+        self.server.count( 'file' )
+        sleep( self.server.latency )
+
+        # INJECTED ERRORS
+        error = self.server.getError()
+
+        if error is not None:
+            return self.sendEmpty( error )
+
+        name = path[len( '/file/' ):]
+        size = self.server.fileSize
+        etag = '"{}"'.format(
+            hashlib.sha1( '{}:{}'.format( name, size ).encode() ).hexdigest()
+        )
+        start, end, status = 0, size - 1, 200
+
+        # RANGE ONLY WHEN IF-RANGE MATCHES
+        byteRange = self.headers.get( 'Range' )
+        ifRange   = self.headers.get( 'If-Range' )
+
+        if byteRange and byteRange.startswith( 'bytes=' ) \
+            and ( ifRange is None or ifRange == etag ):
+            first, last = byteRange[len( 'bytes=' ):].split( ',' )[0] \
+                .split( '-' )
+            start = int( first ) if first else max( 0, size - int( last ) )
+            end = min( int( last ), size - 1 ) if first and last else size - 1
+
+            if start > end:
+                self.send_response( 416 )
+                self.send_header( 'Content-Range', 'bytes */{}'.format( size ) )
+                self.send_header( 'Content-Length', '0' )
+                self.end_headers()
+                return
+
+            status = 206
+
+        self.send_response( status )
+        self.send_header( 'Content-Type', 'application/octet-stream' )
+        self.send_header( 'Content-Length', str( end - start + 1 ) )
+        self.send_header( 'Accept-Ranges', 'bytes' )
+        self.send_header( 'ETag', etag )
+        self.send_header( 'Last-Modified', self.server.lastModified )
+
+        if status == 206:
+            self.send_header(
+                'Content-Range', 'bytes {}-{}/{}'.format( start, end, size )
+            )
+        self.end_headers()
+
+        # THROTTLED BODY, MAYBE CUT BEFORE ITS CONTENT-LENGTH
+        block   = getFileBlock( name )
+        limiter = RateLimiter( self.server.rate ) if self.server.rate else None
+        chunk   = 64 * 1024
+        cut     = self.server.getCut( start, end )
+
+        try:
+            for offset in range( start, end + 1, chunk ):
+                last = min( offset + chunk - 1, end )
+
+                if cut is not None and last >= cut:
+                    self.close_connection = True
+                    return
+
+                if limiter is not None:
+                    limiter.consume( last - offset + 1 )
+
+                self.wfile.write( getFileData( name, offset, last, block ) )
+        except ( BrokenPipeError, ConnectionResetError ):
+            self.close_connection = True
+
+class StandInServer( ThreadingHTTPServer ):
+    '''
+    Local y2mate stand-in server.
+
+    Use it as context manager, it serves on a daemon thread:
+        with StandInServer( latency = 0.05 ) as server:
+            setBaseURL( server.url )
+    '''
+
+    daemon_threads = True
+
+    def __init__(
+            self, host = '127.0.0.1', port = 0, fileSize = 8 * 1024 * 1024,
+            latency = 0, rate = 0, error404 = 0, error522 = 0, seed = None,
+            convertTime = 0, convertHold = 30, stall = 0, stallTime = 30,
+            truncate = 0, verbose = False
+        ):
+        '''
+        - host, port: Address to listen on, port 0 picks a free one.
+        - fileSize:   Bytes of every served file.
+        - latency:    Seconds waited before answering any request.
+        - rate:       Bytes/sec of every file response, 0 is unlimited.
+        - error404:   Probability of HTTP 404 on file requests.
+        - error522:   Probability of HTTP 522 on file requests.
+        - seed:       Random seed of injected errors.
+        - convertTime: Seconds every mp3Convert conversion takes, from
+                      its first request.
+        - convertHold: Max seconds a mp3Convert request is held, then
+                      it answers the file is still converting.
+        - stall:      Probability of an API request answered stallTime
+                      seconds late (a straggler).
+        - truncate:   Probability of a file response closed before its
+                      content-length.
+        - verbose:    Log every request.
+        '''
+        super().__init__( ( host, port ), StandInHandler )
+        self.fileSize     = fileSize
+        self.latency      = latency
+        self.rate         = rate
+        self.error404     = error404
+        self.error522     = error522
+        self.verbose      = verbose
+        self.lastModified = formatdate( usegmt = True )
+        self.convertTime  = convertTime
+        self.convertHold  = convertHold
+        self.stall        = stall
+        self.stallTime    = stallTime
+        self.truncate     = truncate
+        self.requests     = { 'api': 0, 'file': 0 }
+        self.__converts   = {}
+        self.__random     = random.Random( seed )
+        self.__lock       = Lock()
+
+    @property
+    def url( self ):
+        '''Base URL of the server'''
+
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format( host, port )
+
+    def count( self, kind ):
+        '''Count a request of kind ( 'api' or 'file' )'''
+
+        with self.__lock:
+            self.requests[kind] += 1
+
+    def getConvertLeft( self, vID, format, quality ):
+        '''
+        Get seconds left for mp3Convert conversion of an option, the
+        first request starts it.
+        '''
+        with self.__lock:
+            started = self.__converts.setdefault(
+                ( vID, format, quality ), monotonic()
+            )
+
+        return max( 0, started + self.convertTime - monotonic() )
+
+    def getStall( self ):
+        '''Get injected seconds an API request is stalled, 0 mostly'''
+
+        if self.stall <= 0:
+            return 0
+
+        with self.__lock:
+            value = self.__random.random()
+
+        return self.stallTime if value < self.stall else 0
+
+    def getCut( self, start, end ):
+        '''
+        Get injected offset a file response from start to end is closed
+        at, None mostly
+        '''
+        if self.truncate <= 0 or end <= start:
+            return None
+
+        with self.__lock:
+            value = self.__random.random()
+            cut   = self.__random.randint( start, end )
+
+        return cut if value < self.truncate else None
+
+    def getError( self ):
+        '''Get injected error status for a file request, None for no error'''
+
+        with self.__lock:
+            value = self.__random.random()
+
+        if value < self.error404:
+            return 404
+
+        if value < self.error404 + self.error522:
+            return 522
+
+        return None
+
+    def start( self ):
+        '''Serve on a daemon thread'''
+
+        Thread( target = self.serve_forever, daemon = True ).start()
+        return self
+
+    def stop( self ):
+        '''Stop serving and close the socket'''
+
+        self.shutdown()
+        self.server_close()
+
+    def __enter__( self ):
+        return self.start()
+
+    def __exit__( self, *args ):
+        self.stop()
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser( description = 'Local y2mate stand-in server.' )
+    ap.add_argument( '--host', default = '127.0.0.1' )
+    ap.add_argument( '--port', type = int, default = 8080 )
+    ap.add_argument( '--file-size', dest = 'fileSize', type = parseRate, \
+        default = '8M', metavar = 'BYTES', help = 'Size of served files ' \
+        + '(i.e. 500K, 8M).' )
+    ap.add_argument( '--latency', type = float, default = 0, \
+        metavar = 'SECONDS', help = 'Wait before answering any request.' )
+    ap.add_argument( '--rate', type = parseRate, default = 0, \
+        help = 'Bytes/sec of every file response (i.e. 2M).' )
+    ap.add_argument( '--error-404', dest = 'error404', type = float, \
+        default = 0, metavar = 'P', help = 'Probability of HTTP 404 on files.' )
+    ap.add_argument( '--error-522', dest = 'error522', type = float, \
+        default = 0, metavar = 'P', help = 'Probability of HTTP 522 on files.' )
+    ap.add_argument( '--seed', type = int, default = None, \
+        help = 'Random seed of injected errors.' )
+    ap.add_argument( '--convert-time', dest = 'convertTime', type = float, \
+        default = 0, metavar = 'SECONDS', help = 'Time every mp3Convert ' \
+        + 'conversion takes.' )
+    ap.add_argument( '--convert-hold', dest = 'convertHold', type = float, \
+        default = 30, metavar = 'SECONDS', help = 'Max time a mp3Convert ' \
+        + 'request is held before answering it\'s converting.' )
+    ap.add_argument( '--stall', type = float, default = 0, metavar = 'P', \
+        help = 'Probability of an API request answered --stall-time late.' )
+    ap.add_argument( '--stall-time', dest = 'stallTime', type = float, \
+        default = 30, metavar = 'SECONDS', help = 'Delay of stalled API ' \
+        + 'requests.' )
+    ap.add_argument( '--truncate', type = float, default = 0, metavar = 'P', \
+        help = 'Probability of a file response closed before its end.' )
+    ap.add_argument( '-ve', '--verbose', action = 'store_true' )
+    args = ap.parse_args()
+
+    server = StandInServer(
+        args.host, args.port, fileSize = args.fileSize,
+        latency = args.latency, rate = args.rate, error404 = args.error404,
+        error522 = args.error522, seed = args.seed,
+        convertTime = args.convertTime, convertHold = args.convertHold,
+        stall = args.stall, stallTime = args.stallTime,
+        truncate = args.truncate,
+        verbose = args.verbose
+    )
+    print( 'Serving y2mate stand-in at {}'.format( server.url ) )
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
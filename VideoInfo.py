@@ -0,0 +1,145 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Result model of y2mate analyze: VideoInfo with the FormatOption list of
+every format. Both have fixed slots and sizes are bytes, they are built
+from parseResult or cached dicts and given back as JSON ready dicts.
+'''
+
+import re
+
+# SIZE UNITS OF Y2MATE OPTIONS ( '12.5 MB' )
+SIZE_UNITS  = { '': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3 }
+SIZE_REGEX  = re.compile(
+    r'^\s*([0-9]+(?:\.[0-9]+)?)\s*([KMG]?)I?B?\s*$', re.I
+)
+
+def parseSize( value ):
+    '''
+    Get bytes of y2mate option size ( '12.5 MB', bytes or None ), None
+    when it's unknown ( '? MB' ).
+    '''
+    if value is None or isinstance( value, int ):
+        return value
+
+    match = SIZE_REGEX.match( str( value ) )
+
+    if match is None:
+        return None
+
+    unit = SIZE_UNITS[match.group( 2 ).upper()]
+    return int( float( match.group( 1 ) ) * unit )
+
+def formatSize( size ):
+    '''Get option size bytes as y2mate shows them ( '12.5 MB' )'''
+
+    if size is None:
+        return '? MB'
+
+    for unit in [ 'G', 'M', 'K' ]:
+        if size >= SIZE_UNITS[unit]:
+            size = round( size / SIZE_UNITS[unit], 1 )
+            return '{:g} {}B'.format( size, unit )
+
+    return '{} B'.format( size )
+
+class FormatOption:
+    '''
+    Download option of a format.
+    - quality: Resolution (p) or bitrate (kbps).
+    - size:    Bytes, None when y2mate doesn't say it.
+    - type:    y2mate file type ( 'mp4', 'mp3', 'm4a'... ).
+    '''
+
+    __slots__ = ( 'format', 'quality', 'size', 'type' )
+
+    def __init__( self, format, quality, size = None, type = None ):
+        self.format  = format
+        self.quality = quality
+        self.size    = size
+        self.type    = type
+
+    @classmethod
+    def fromDict( cls, format, data ):
+        '''Get FormatOption from parseResult or cached option dict'''
+
+        return cls(
+            format, int( data['quality'] ), parseSize( data.get( 'size' ) ),
+            data.get( 'type' )
+        )
+
+    def toDict( self ):
+        return { 'quality': self.quality, 'size': self.size, 'type': self.type }
+
+    def __repr__( self ):
+        return 'FormatOption( {!r}, {!r}, size = {!r} )'.format(
+            self.format, self.quality, self.size
+        )
+
+class VideoInfo:
+    '''
+    Download options of a video, result of Y2mateClient.analyze.
+    - options: { format: [ FormatOption ] }
+    - cached:  Options come from cache, so kID may be expired.
+    - host:    API host kID was given by (see EndpointRegistry.getHost),
+               its convert is the only one that knows it.
+    '''
+
+    __slots__ = (
+        'vID', 'kID', 'title', 'options', 'mp3Convert', 'cached', 'host'
+    )
+
+    def __init__(
+            self, vID, kID, title, options, mp3Convert = False, cached = False,
+            host = None
+        ):
+        self.vID        = vID
+        self.kID        = kID
+        self.title      = title
+        self.options    = options
+        self.mp3Convert = mp3Convert
+        self.cached     = cached
+        self.host       = host
+
+    @classmethod
+    def fromDict(
+            cls, vID, data, mp3Convert = False, cached = False, host = None
+        ):
+        '''Get VideoInfo from parseResult or cached dict'''
+
+        options = {
+            format: [ FormatOption.fromDict( format, o ) for o in rows ]
+            for format, rows in data['options'].items()
+        }
+
+        return cls(
+            vID, data['kID'], data['title'], options, mp3Convert, cached, host
+        )
+
+    def toDict( self, formats = None ):
+        '''
+        Get dict stored on options cache, also given by '-sio --json'.
+        - formats: Formats included, all by default.
+        '''
+        return {
+            'vID':        self.vID,
+            'kID':        self.kID,
+            'title':      self.title,
+            'mp3Convert': self.mp3Convert,
+            'options':    {
+                format: [ o.toDict() for o in rows ]
+                for format, rows in self.options.items()
+                if formats is None or format in formats
+            }
+        }
+
+    def getQualities( self, format ):
+        '''Get qualities of format, [] when it's not available'''
+
+        return [ o.quality for o in self.options.get( format, [] ) ]
+
+    def __repr__( self ):
+        return 'VideoInfo( {!r}, {!r}, formats = {} )'.format(
+            self.vID, self.title, list( self.options.keys() )
+        )
@@ -0,0 +1,282 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from RequestUtils import *
+from os import getenv, path
+from urllib.parse import urlparse
+
+# Y2MATE ENDPOINTS (PATHS FROM BASE URL)
+# ------------------------------------------------------------------------------
+BASE_URL         = 'https://www.y2mate.com'
+ANALYZE_PATH     = '/mates/es19/analyze/ajax'
+MP3_ANALYZE_PATH = '/mates/en31/mp3/ajax'
+CONVERT_PATH     = '/mates/es/convert'
+MP3_CONVERT_PATH = '/mates/mp3Convert'
+
+# ENDPOINT KINDS, SEE EndpointRegistry
+ENDPOINT_PATHS = {
+    'analyze':    ANALYZE_PATH,
+    'mp3Analyze': MP3_ANALYZE_PATH,
+    'convert':    CONVERT_PATH,
+    'mp3Convert': MP3_CONVERT_PATH
+}
+# ------------------------------------------------------------------------------
+
+__baseURL = None
+
+class Y2mateError( Exception ):
+    '''
+    Error raised when a video can't be processed. Single url runs exit
+    with its message, batch runs record it and keep going.
+    '''
+    pass
+
+class OptionsError( Y2mateError ):
+    '''Error raised when y2mate doesn't give download options'''
+    pass
+
+class ConvertError( Y2mateError ):
+    '''
+    Error raised when y2mate doesn't give a download link. It may be
+    caused by an expired kID.
+    '''
+    pass
+
+class ServerError( Y2mateError ):
+    '''Error raised when a file host answers with HTTP status error'''
+
+    def __init__( self, msg, status ):
+        super().__init__( msg )
+        self.status = status
+
+def getAudioFolderPath():
+    '''
+    Get audio folder path from Y2MATE_AUDIO_FOLDER
+    enviroment variable.
+    '''
+    return getenv( 'Y2MATE_AUDIO_FOLDER', '' )
+
+def getVideoFolderPath():
+    '''
+    Get video folder path from Y2MATE_VIDEO_FOLDER
+    enviroment variable.
+    '''
+    return getenv( 'Y2MATE_VIDEO_FOLDER', './' )
+
+def getCacheFolderPath():
+    '''
+    Get options cache folder path from Y2MATE_CACHE_FOLDER
+    enviroment variable.
+    '''
+    return getenv(
+        'Y2MATE_CACHE_FOLDER',
+        path.join( path.expanduser( '~' ), '.cache', 'y2mate-download' )
+    )
+
+def getBaseURL():
+    '''
+    Get y2mate base URL, the one given to setBaseURL or the
+    Y2MATE_BASE_URL enviroment variable (y2mate.com by default).
+    '''
+    baseURL = __baseURL or getenv( 'Y2MATE_BASE_URL', '' ) or BASE_URL
+    return baseURL.rstrip( '/' )
+
+def setBaseURL( baseURL ):
+    '''Set y2mate base URL (i.e. a local stand-in server), None resets it'''
+
+    global __baseURL
+    __baseURL = baseURL
+
+def getEndpointURL( endpoint ):
+    '''Get URL of endpoint path from base URL'''
+
+    return getBaseURL() + endpoint
+
+def parseVideoID( youtubeURL ):
+    '''
+    Parse the video ID from youtube url, empty string when there
+    is no ID.
+
+    Note: Time '[?t|&t]=' param is avoided.
+    Formats admited:
+    - https://www.youtube.com/watch?v=VIDEO-ID
+    - https://yutu.be/VIDEO-ID
+    '''
+    parse = urlparse( youtubeURL )
+
+    # CHECK SHORT VERSION & GET VIDEO ID
+    if parse.netloc == 'youtu.be':
+        return parse.path[1:]
+
+    vID = list(
+        filter(
+            lambda e: 'v=' in e,
+            parse.query.split( '&' )
+        )
+    )
+    return vID[0].replace( 'v=', '') if len( vID ) > 0 else ''
+
+def getEndpointKind( endpoint, mp3Convert = False ):
+    '''Get kind of endpoint ( 'analyze' or 'convert' ) for mp3Convert'''
+
+    return 'mp3' + endpoint.capitalize() if mp3Convert else endpoint
+
+def getOrigin( url ):
+    '''Get scheme and netloc of url, i.e. https://www.y2mate.com'''
+
+    return '{}://{}'.format( urlGetScheme( url ), urlGetNetloc( url ) )
+
+def getAnalyzeRequest( vID, mp3Convert = False, optionsURL = None ):
+    '''
+    Get url, headers and form data of analyze request for vID.
+    - mp3Convert: Use Y2mate Youtube MP3 Converter
+    - optionsURL: Analyze endpoint URL, the one on base URL by default.
+    '''
+    optionsURL = optionsURL or getEndpointURL(
+        ENDPOINT_PATHS[getEndpointKind( 'analyze', mp3Convert )]
+    )
+
+    data = {
+        'url':    'https://youtube.com/watch?v=' + vID,
+        'q_auto': 0,
+        'ajax':   1
+    }
+    headers = {
+        'authority':    urlGetNetloc( optionsURL ),
+        'content-type': getContentType( 'form' ) ,
+        'method':       'POST',
+        'path':         urlGetPath( optionsURL ),
+        'referer':      getOrigin( optionsURL ) + '/es/youtube/' + vID,
+        'scheme':       urlGetScheme( optionsURL ),
+        'User-Agent':   getChromeAgent()
+    }
+    return optionsURL, headers, data
+
+def getConvertRequest(
+        kID, vID, format, quality, mp3Convert = False, getLinkURL = None
+    ):
+    '''
+    Get url, headers and form data of convert request that gives the
+    file download link.
+    - mp3Convert: Use Y2mate Youtube MP3 Converter
+    - getLinkURL: Convert endpoint URL, the one on base URL by default.
+    '''
+    getLinkURL = getLinkURL or getEndpointURL(
+        ENDPOINT_PATHS[getEndpointKind( 'convert', mp3Convert )]
+    )
+
+    data = {
+        'type':     'youtube',
+        '_id':      kID,
+        'v_id':     vID,
+        'ajax':     1,
+        'token':    '',
+        'ftype':    format,
+        'fquality': quality
+    }
+
+    headers = {
+        'authority':      urlGetNetloc( getLinkURL ),
+        'method':         'POST',
+        'path':           urlGetPath( getLinkURL ),
+        'scheme':         urlGetScheme( getLinkURL ),
+        'content-type':   getContentType( 'form' ),
+        'origin':         urlGetPath( getLinkURL ),
+        'pragma':         'no-cache',
+        'referer':        getOrigin( getLinkURL ) + '/es/youtube/' + vID,
+        'user-agent':     getChromeAgent(),
+        'x-request-with': 'XMLHttpRequest'
+    }
+    return getLinkURL, headers, data
+
+def fixFileLink( fileLink ):
+    '''Files are downloaded over HTTP, fix HTTPS => HTTP'''
+
+    if 'https' in fileLink:
+        fileLink = fileLink.replace( 'https', 'http' )
+
+    return fileLink
+
+def isResultPayload( data ):
+    '''Check if analyze or convert response data has its result HTML'''
+
+    return isinstance( data, dict ) and isinstance( data.get( 'result' ), str )
+
+def isConverting( data ):
+    '''
+    Check if convert response data says the file is still being
+    converted, so the same request must be done again later to get its
+    link.
+    '''
+    return isinstance( data, dict ) \
+        and str( data.get( 'c_status', '' ) ).upper() == 'CONVERTING'
+
+def getFileHeaders( fileLink ):
+    '''Get file download request headers'''
+
+    return {
+        'User-Agent': getChromeAgent(),
+        'authority': urlGetNetloc( fileLink ),
+        'Connection': 'Keep-Alive'
+    }
+
+def getFilePath( fileName, format, useCurrentDir = False ):
+    '''
+    Get clean file name and the path where it's saved, on current dir
+    or on audio or video folder according format.
+    '''
+    # REMOVE CHARACTERS
+    fileName = fileName.replace( '/', '' ) \
+            .replace( '[', '' ) \
+            .replace( ']', '' ) \
+            .replace( "'", '' )
+    fileName = fileName.split('.')
+    ext  = fileName.pop()
+    name = '.'.join(fileName).strip()
+    fileName = name + '.' + ext
+
+    # SET FILE PATH TO CURRENT DIRECTORY
+    if useCurrentDir:
+        filePath = './' + fileName
+    # CHOSE FILE PATH FROM ENVIROMENT VARIABLES
+    else:
+        # AUDIO FILES
+        if format in [ 'mp3', 'm4a' ]:
+            saveDir = getAudioFolderPath()
+        # VIDEO FILES
+        else:
+            saveDir = getVideoFolderPath()
+        filePath = saveDir + fileName
+
+    return fileName, filePath
+
+def addFilePrefix( filePath, prefix = '2_' ):
+    '''Add prefix to file name of filePath, for not overwrite it'''
+
+    head, tail = path.split( filePath )
+    return path.join( head, prefix + tail )
+
+def selectQuality( options, format, quality ):
+    '''
+    Select quality according given parameters.
+
+    When format is not available Y2mateError is raised.
+    If quality is None, then max value is returned.
+    Otherwise is the closest one.
+    '''
+    if format not in options:
+        raise Y2mateError( '[Error]: Format specified not available!' )
+    else:
+        option = options[format]
+        qualities = [ e.quality for e in option ]
+        qualities.sort()
+
+        # IF QUALITY IS NONE SELECT MAX QUALITY
+        if quality == None:
+            quality = max( qualities )
+
+        # GET CLOSEST QUALITY FROM AVAILABLE
+        else:
+            quality = min( qualities, key = lambda x:abs( x - quality ) )
+
+        return quality
@@ -0,0 +1,652 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+from ConvertTracker import ConvertTracker
+from EndpointRegistry import getEndpointRegistry, getHost
+from Hedge import getHedgePolicy
+from Metrics import getMetrics
+from OptionsParser import ParseError, parseLink, parseResult
+from Profiler import getProfiler
+from QualityPolicy import getQualityPolicy
+from VideoInfo import FormatOption, VideoInfo
+from Y2mateApi import *
+from os import path, remove
+from time import monotonic
+
+class FileLink:
+    '''File download link of a video option, result of resolveLink'''
+
+    def __init__( self, info, format, quality, link ):
+        self.info    = info
+        self.format  = format
+        self.quality = quality
+        self.link    = link
+
+    @property
+    def fileName( self ):
+        '''File name from video title'''
+
+        return '{}.{}'.format( self.info.title, self.format )
+
+    def __repr__( self ):
+        return 'FileLink( {!r}, {!r}, {!r} )'.format(
+            self.info.vID, self.format, self.quality
+        )
+
+class DownloadResult:
+    '''
+    Saved file, result of Y2mateClient.download. Files given by the
+    download ledger have no link and ledger set to True.
+    '''
+
+    def __init__( self, link, filePath, stats, ledger = False ):
+        self.link     = link
+        self.filePath = filePath
+        self.stats    = stats
+        self.ledger   = ledger
+
+    @property
+    def bytes( self ):
+        return self.stats['bytes']
+
+    def __repr__( self ):
+        return 'DownloadResult( {!r}, bytes = {} )'.format(
+            self.filePath, self.bytes
+        )
+
+class Y2mateClient:
+    '''
+    Y2mate client library. It owns the options cache, the downloader and
+    requests config, and uses the process wide session pool, so one
+    client per process keeps connections and cache warm.
+
+    Methods return VideoInfo, FileLink or DownloadResult and raise
+    Y2mateError (or its subclasses), they never ask. They only print
+    with debug (requests, retries, failovers) or verbose (batch status)
+    on, both are off by default.
+
+        client = Y2mateClient( cache = OptionsCache( getCacheFolderPath() ) )
+        info   = client.analyze( url )
+        link   = client.resolveLink( info.vID, 'mp4', 720, info = info )
+        result = client.download( link )
+    '''
+
+    def __init__(
+            self, cache = None, downloader = None, engine = 'fast',
+            timeout = 60, retry = None, ledger = None, manifest = None,
+            converts = 8, convertDeadline = 600, endpoints = None,
+            hedge = None, debug = False, verbose = False
+        ):
+        '''
+        - cache:      OptionsCache for analyze results, None disables it.
+        - ledger:     DownloadLedger of completed downloads, None
+                      disables it. Downloader computes SHA-256 for it.
+        - manifest:   Checksum.Manifest saved files are recorded on.
+        - downloader: Downloader that saves files (single stream by
+                      default).
+        - engine:     Result HTML parser engine, 'fast' or 'advanced'.
+        - timeout:    Requests timeout.
+        - retry:      RetryPolicy of requests, process wide one by default.
+        - converts:   Convert requests in progress at once, see
+                      ConvertTracker.
+        - convertDeadline: Max seconds a file conversion is waited for.
+        - endpoints:  EndpointRegistry of API endpoints, process wide one
+                      by default.
+        - hedge:      HedgePolicy of analyze and convert requests, process
+                      wide one by default (none).
+        - debug:      Show debug info about HTTP requests.
+        - verbose:    Show status of every url on batch runs.
+        '''
+        if downloader is None:
+            from Download import Downloader
+            downloader = Downloader( timeout = timeout, debug = debug )
+
+        # LEDGER ENTRIES KEEP SHA-256 OF THE DOWNLOAD, FILES AREN'T READ AGAIN
+        if ledger is not None and 'sha256' not in downloader.checksums:
+            downloader.checksums = list( downloader.checksums ) + [ 'sha256' ]
+
+        self.cache      = cache
+        self.downloader = downloader
+        self.engine     = engine
+        self.timeout    = timeout
+        self.retry      = retry
+        self.ledger     = ledger
+        self.manifest   = manifest
+        self.endpoints  = endpoints
+        self.hedge      = hedge
+        self.debug      = debug
+        self.verbose    = verbose
+        self.tracker    = ConvertTracker(
+            self, workers = converts, deadline = convertDeadline
+        )
+
+    def __verbose( self, msg ):
+        if self.verbose:
+            print( msg )
+
+    def __request( self, url, method = 'GET', headers = {}, data = {},
+            stream = False, timeout = None, retry = None
+        ):
+        from Request import Request
+
+        return Request(
+            method = method, url = url, headers = headers, data = data,
+            debug = self.debug, stream = stream,
+            timeout = timeout or self.timeout, retry = retry or self.retry
+        )
+
+    def __hedge( self, kind, request ):
+        '''
+        Do request() Request and return its response and JSON payload
+        (None when it's malformed), hedged by client or process wide
+        hedge policy. A hedge is a new Request, they keep response state.
+        '''
+        def call():
+            res = request().do()
+
+            try:
+                payload = res.json()
+            except ValueError:
+                payload = None
+
+            return res, payload if isResultPayload( payload ) else None
+
+        from SessionPool import CancelScope
+
+        policy = self.hedge or getHedgePolicy()
+
+        if policy is None:
+            return call()
+
+        # THE LOSER'S SOCKET IS SHUT, SO IT DOESN'T HOLD A POOL SLOT
+        return policy.run(
+            kind, call,
+            isGood = lambda r: r[0].status_code == 200 and r[1] is not None,
+            discard = lambda r: r[0].close(), scope = CancelScope
+        )
+
+    def __post(
+            self, kind, getRequest, timeout = None, retry = None, host = None
+        ):
+        '''
+        POST to endpoints of kind from endpoint registry, the fastest
+        healthy one first. getRequest( endpointURL ) gives url, headers
+        and form data. Error statuses, bodies without a JSON result,
+        connection errors and timeouts are recorded as failures and the
+        next endpoint is tried, only the last one is retried. Return the
+        response, its JSON payload (None when it's malformed) and the
+        endpoint URL that gave them.
+        - host: Only endpoints on host are tried, see VideoInfo.host.
+        '''
+        import requests
+        from Retry import RetryPolicy
+
+        registry = self.endpoints or getEndpointRegistry()
+        urls     = registry.select( kind, host )
+
+        if len( urls ) == 0:
+            raise ConvertError(
+                '[Error] No {} endpoint on {}!'.format( kind, host )
+            )
+
+        for index, endpointURL in enumerate( urls ):
+            last = index == len( urls ) - 1
+            url, headers, data = getRequest( endpointURL )
+            start = monotonic()
+
+            request = lambda: self.__request(
+                url, method = 'POST', headers = headers, data = data,
+                timeout = timeout,
+                retry = retry if last else RetryPolicy( attempts = 1 )
+            )
+
+            try:
+                res, payload = self.__hedge( kind, request )
+            except ( requests.ConnectionError, requests.Timeout ) as e:
+                registry.record( endpointURL, monotonic() - start, False )
+
+                if last:
+                    raise
+
+                reason = 'timeout' if isinstance( e, requests.Timeout ) \
+                    else 'connection error'
+            else:
+                ok = res.status_code == 200 and payload is not None
+                registry.record( endpointURL, monotonic() - start, ok )
+
+                if ok or last:
+                    return res, payload, endpointURL
+
+                reason = 'HTTP {}'.format( res.status_code ) \
+                    if res.status_code != 200 else 'malformed JSON'
+
+            if self.debug:
+                print( '[Failover] {} on {}, trying {}...'.format(
+                    reason, endpointURL, urls[index + 1]
+                ) )
+
+    def parseVideoID( self, url ):
+        '''Get video ID from youtube url or raise Y2mateError'''
+
+        with getMetrics().phase( 'videoID' ):
+            vID = parseVideoID( url )
+
+        if vID == '':
+            raise Y2mateError(
+                '[Error]: Can\'t get video ID from \'{}\'!'.format( url )
+            )
+
+        return vID
+
+    def getOptions( self, vID, mp3Convert = False, refresh = False ):
+        '''
+        Get VideoInfo of vID from cache or analyze API, raise
+        OptionsError when y2mate doesn't give them.
+        - mp3Convert: Use Y2mate Youtube MP3 Converter.
+        - refresh:    Ignore cached options and update them.
+        '''
+        registry = self.endpoints or getEndpointRegistry()
+        kind     = getEndpointKind( 'analyze', mp3Convert )
+
+        # kID IS ONLY VALID ON ITS HOST, THE ONE TRIED FIRST IS PREFERRED
+        if self.cache is not None and not refresh:
+            for host in registry.getHosts( kind ):
+                data = self.cache.get( vID, mp3Convert, host )
+
+                if data is not None:
+                    return VideoInfo.fromDict(
+                        vID, data, mp3Convert, True, host
+                    )
+
+        metrics  = getMetrics()
+        profiler = getProfiler()
+
+        with metrics.phase( 'analyze' ), profiler.phase( 'analyze' ):
+            res, payload, endpointURL = self.__post(
+                kind, lambda url: getAnalyzeRequest( vID, mp3Convert, url )
+            )
+
+        if res.status_code != 200:
+            raise OptionsError(
+                '[Server Error]: HTTP {} getting download options!' \
+                    .format( res.status_code )
+            )
+
+        if payload is None:
+            raise OptionsError( '[Error]: Unexpected options response!' )
+
+        try:
+            with metrics.phase( 'parse' ), profiler.phase( 'parse' ):
+                data = parseResult(
+                    payload['result'], mp3Convert = mp3Convert,
+                    engine = self.engine
+                )
+            info = VideoInfo.fromDict(
+                vID, data, mp3Convert, host = getHost( endpointURL )
+            )
+        except ( ParseError, ValueError, KeyError, TypeError ) as e:
+            raise OptionsError( str( e ) )
+
+        if self.cache is not None:
+            self.cache.set( vID, mp3Convert, info.toDict(), info.host )
+
+        return info
+
+    def analyze( self, url, mp3Convert = False, refresh = False ):
+        '''Get VideoInfo of youtube url, see getOptions'''
+
+        return self.getOptions( self.parseVideoID( url ), mp3Convert, refresh )
+
+    def getLink( self, info, format, quality, timeout = None, retry = None ):
+        '''
+        Request FileLink of info option from convert API once, None when
+        y2mate says it's still converting (see ConvertTracker). Raise
+        ConvertError when there is no link (kID may be expired). Only
+        endpoints on the host that gave kID are requested.
+        - timeout: Request timeout, client timeout by default.
+        - retry:   RetryPolicy of the request, client one by default.
+        '''
+        res, payload, _ = self.__post(
+            getEndpointKind( 'convert', info.mp3Convert ),
+            lambda url: getConvertRequest(
+                info.kID, info.vID, format, quality, info.mp3Convert, url
+            ),
+            timeout, retry, info.host
+        )
+
+        if res.status_code != 200:
+            raise ConvertError(
+                '[Server Error]: HTTP {} getting download link!'.format(
+                    res.status_code
+                )
+            )
+
+        if payload is None:
+            raise ConvertError( '[Error] Unexpected convert response!' )
+
+        result = payload['result']
+
+        if isConverting( payload ):
+            return None
+
+        # DETECT TO LONG VIDEO ERROR
+        if 'video is too long' in result:
+            raise Y2mateError(
+                '[Error] Video is too long, try with shorter one!'
+            )
+
+        with getMetrics().phase( 'parse' ), getProfiler().phase( 'parse' ):
+            fileLink = parseLink( result, engine = self.engine )
+
+        if fileLink is None:
+            raise ConvertError(
+                '[Error] something is wrong with download... try again!'
+            )
+
+        return FileLink( info, format, quality, fixFileLink( fileLink ) )
+
+    def convert( self, info, format, quality = None, deadline = None ):
+        '''
+        Submit conversion of info option selected by quality policy to
+        convert tracker and return a Future of its FileLink, see
+        ConvertTracker.submit.
+        '''
+        return self.tracker.submit( info, format, quality, deadline )
+
+    def resolveLink(
+            self, vID, format, quality = None, mp3Convert = False,
+            info = None, deadline = None
+        ):
+        '''
+        Get FileLink of vID option selected by quality policy for format
+        and quality (see QualityPolicy), its format may be a fallback one.
+
+        Options are got with getOptions when info is not given. The link
+        is waited for on convert tracker up to deadline seconds (client
+        convertDeadline by default), so slow conversions are requested
+        again instead of lost on timeout. When options come from cache
+        and y2mate doesn't give a link its kID is probably expired, so
+        the entry is invalidated and options are requested again once.
+        '''
+        if info is None:
+            info = self.getOptions( vID, mp3Convert )
+
+        future = self.convert( info, format, quality, deadline )
+
+        with getMetrics().phase( 'convert' ):
+            return future.result()
+
+    def getDownloaded(
+            self, info, format, quality = None, useCurrentDir = False,
+            folder = None
+        ):
+        '''
+        Get DownloadResult of VideoInfo option selected by quality policy
+        (the one convert would download) from download ledger, None when
+        it isn't recorded (or ledger is disabled). Raise Y2mateError when
+        no option fits quality policy.
+        '''
+        if self.ledger is None:
+            return None
+
+        start    = monotonic()
+        option   = getQualityPolicy().select( info.options, format, quality )
+        filePath = self.ledger.fetch(
+            info.vID, option.format, option.quality, useCurrentDir, folder
+        )
+
+        if filePath is None:
+            return None
+
+        return DownloadResult( None, filePath, {
+            'bytes':    0,
+            'resumed':  0,
+            'seconds':  monotonic() - start,
+            'segments': 0,
+            'peak':     0
+        }, ledger = True )
+
+    def getFilePath( self, link, useCurrentDir = False, folder = None ):
+        '''
+        Get path where link file is saved, on folder when it's given,
+        see getFilePath otherwise.
+        '''
+        fileName, filePath = getFilePath(
+            link.fileName, link.format, useCurrentDir
+        )
+
+        if folder:
+            filePath = path.join( folder, fileName )
+
+        return path.normpath( filePath )
+
+    def download(
+            self, link, filePath = None, useCurrentDir = False,
+            overwrite = False, timeout = None, folder = None, meter = None
+        ):
+        '''
+        Save link file and return its DownloadResult. Existing files are
+        replaced when overwrite is True, otherwise a '2_' prefix is added
+        to the new one. Error statuses are raised as ServerError. Saved
+        files are recorded on download ledger.
+        - filePath: Where file is saved, see getFilePath by default.
+        - timeout:  File request timeout, client timeout by default.
+        - folder:   Folder file is saved on when filePath isn't given.
+        - meter:    ThroughputMeter that follows the download progress.
+        '''
+        import requests
+        from Download import DownloadError, StatusError
+
+        metrics = getMetrics()
+
+        if filePath is None:
+            filePath = self.getFilePath( link, useCurrentDir, folder )
+
+        headers = getFileHeaders( link.link )
+        req = self.__request(
+            link.link, headers = headers, stream = True, timeout = timeout
+        )
+        req.disableSSLVerification()
+
+        with metrics.phase( 'ttfb' ):
+            res = req.do()
+
+        if res.status_code == 404:
+            res.close()
+            raise ServerError( '[Server Error]: File not found!', 404 )
+
+        if res.status_code == 522:
+            res.close()
+            raise ServerError(
+                '[Server Error]: HTTP 522 Connection timeout!', 522
+            )
+
+        if res.status_code != 200:
+            res.close()
+            raise ServerError(
+                '[Server Error]: HTTP {} on file download!'.format(
+                    res.status_code
+                ),
+                res.status_code
+            )
+
+        # NEVER OVERWRITE EXISTING FILES UNLESS ASKED
+        if path.isfile( filePath ):
+            if overwrite:
+                remove( filePath )
+            else:
+                filePath = addFilePrefix( filePath )
+
+        try:
+            stats = self.downloader.save(
+                res, filePath, link.link, headers = headers,
+                desc = path.basename( filePath ), meter = meter
+            )
+        except StatusError as e:
+            # '.part' IS KEPT, A RETRY CONTINUES IT
+            raise ServerError( str( e ), e.status )
+        except ( DownloadError, requests.RequestException ) as e:
+            raise Y2mateError( str( e ) )
+
+        # SHA-256 WAS COMPUTED WHILE SAVING, THE FILE ISN'T READ AGAIN
+        if self.ledger is not None:
+            self.ledger.add(
+                link.info.vID, link.format, link.quality, filePath,
+                checksum = stats.get( 'checksums', {} ).get( 'sha256' )
+            )
+
+        if self.manifest is not None:
+            self.manifest.add( filePath, stats, link.link )
+
+        return DownloadResult( link, filePath, stats )
+
+    def downloadURL(
+            self, url, format, quality = None, mp3Convert = False,
+            useCurrentDir = False, refresh = False, overwrite = False,
+            folder = None, meter = None, redownload = False, slots = None
+        ):
+        '''
+        Run the full process for one url: video ID, options, link and
+        download. Return its DownloadResult or raise Y2mateError. Every
+        call is a metrics run.
+
+        Options on download ledger are given from disk unless
+        redownload is True. With slots (a Semaphore) the download waits
+        for a free slot, the conversion doesn't hold one.
+        '''
+        with getMetrics().run( url ):
+            vID  = self.parseVideoID( url )
+            info = self.getOptions( vID, mp3Convert, refresh )
+
+            # SELECTED OPTION ALREADY DOWNLOADED
+            if not redownload:
+                result = self.getDownloaded(
+                    info, format, quality, useCurrentDir, folder
+                )
+
+                if result is not None:
+                    return result
+
+            link = self.resolveLink(
+                info.vID, format, quality, mp3Convert, info = info
+            )
+
+            if slots is None:
+                return self.download(
+                    link, useCurrentDir = useCurrentDir,
+                    overwrite = overwrite, folder = folder, meter = meter
+                )
+
+            with slots:
+                return self.download(
+                    link, useCurrentDir = useCurrentDir,
+                    overwrite = overwrite, folder = folder, meter = meter
+                )
+
+    def runBatch( self, urls, workers = 4, **kwargs ):
+        '''
+        Download every url from urls iterable, workers files at once.
+
+        Urls are consumed as a stream, never more than 2 * workers are
+        pending at once. With mp3Convert as many more urls as convert
+        tracker workers wait for their conversion meanwhile, so slow
+        conversions overlap with downloads of the others. Extra kwargs
+        are passed to downloadURL. A failed url doesn't stop the others.
+        Return a list of ( url, status, filePath or error message )
+        tuples in input order and the aggregate download stats.
+        '''
+        from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, \
+            wait
+        from threading import BoundedSemaphore
+
+        workers  = max( 1, workers )
+        converts = self.tracker.workers if kwargs.get( 'mp3Convert' ) else 0
+        slots    = BoundedSemaphore( workers )
+        results  = []
+        pending  = {}
+        start    = monotonic()
+        saved    = []
+
+        def collect( done ):
+            for future in done:
+                index, url = pending.pop( future )
+                try:
+                    result = future.result()
+                    saved.append( result.stats )
+                    results.append( ( index, url, True, result.filePath ) )
+                except Exception as e:
+                    results.append( ( index, url, False, str( e ) ) )
+
+                self.__verbose( 'Status: [{}] {}'.format(
+                    'OK' if results[-1][2] else 'FAIL', url
+                ) )
+
+        with ThreadPoolExecutor( max_workers = workers + converts ) as pool:
+            for index, url in enumerate( urls ):
+                # BOUNDED QUEUE, WAIT FOR A SLOT
+                while len( pending ) >= 2 * workers + converts:
+                    done, _ = wait( pending, return_when = FIRST_COMPLETED )
+                    collect( done )
+
+                future = pool.submit(
+                    self.downloadURL, url, slots = slots, **kwargs
+                )
+                pending[future] = ( index, url )
+
+            collect( wait( pending ).done )
+
+        results.sort( key = lambda e: e[0] )
+        results = [ r[1:] for r in results ]
+
+        stats = {
+            'bytes':    sum( s['bytes'] for s in saved ),
+            'resumed':  sum( s.get( 'resumed', 0 ) for s in saved ),
+            'seconds':  monotonic() - start,
+            'segments': max( [ s['segments'] for s in saved ] or [ 1 ] )
+        }
+
+        # WRITER THREAD WAITS OF EVERY DOWNLOAD
+        for key in [ 'diskWaits', 'diskWait', 'netWaits', 'netWait' ]:
+            if any( key in s for s in saved ):
+                stats[key] = sum( s.get( key, 0 ) for s in saved )
+
+        return results, stats
+
+    def analyzeBatch(
+            self, urls, workers = 4, mp3Convert = False, refresh = False
+        ):
+        '''
+        Get VideoInfo of every url from urls iterable, workers at once,
+        nothing is downloaded. Urls are consumed as a stream, never more
+        than 2 * workers are pending at once. Yield ( url, VideoInfo or
+        Y2mateError ) tuples in input order as they are ready, a failed
+        url doesn't stop the others. Every url is a metrics run.
+        '''
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+
+        workers = max( 1, workers )
+        pending = deque()
+
+        def analyze( url ):
+            with getMetrics().run( url ) as run:
+                try:
+                    return self.analyze( url, mp3Convert, refresh )
+                except Y2mateError as e:
+                    run.fail( e )
+                    return e
+
+        def oldest():
+            url, future = pending.popleft()
+            return url, future.result()
+
+        with ThreadPoolExecutor( max_workers = workers ) as pool:
+            for url in urls:
+                # BOUNDED QUEUE, WAIT FOR OLDEST RESULT
+                if len( pending ) >= 2 * workers:
+                    yield oldest()
+
+                pending.append( ( url, pool.submit( analyze, url ) ) )
+
+            while pending:
+                yield oldest()
@@ -0,0 +1,477 @@
+#!/usr/bin/python3.8
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark y2mate-download against a local y2mate stand-in server (or any
+--base-url). Reports latency per phase (analyze, convert, download) and
+download throughput of single, batch (threads), asyncio and CLI runs, and
+CLI startup time. Exits with error when startup checks fail.
+'''
+
+from Download import Downloader
+from Hedge import HedgePolicy, getHedgePolicy, setHedgePolicy
+from OptionsParser import ENGINES
+from Progress import REPORTERS, Progress, getReporter, setProgress
+from RateLimiter import parseRate
+from RequestUtils import urlGetNetloc
+from Retry import RetryPolicy, setRetryPolicy
+from SessionPool import formatPoolStats, getSessionPool
+from StandInServer import StandInServer
+from Y2mateApi import *
+from Y2mateClient import Y2mateClient
+from concurrent.futures import ThreadPoolExecutor
+from os import devnull, environ, listdir, path
+from shutil import rmtree
+from time import monotonic
+import argparse
+import json
+import math
+import subprocess
+import sys
+import tempfile
+
+SCRIPT = path.join( path.dirname( path.abspath( __file__ ) ), 'y2mate-download.py' )
+
+# MODULES THAT MUST NOT BE LOADED TO SHOW HELP OR VERSION
+LAZY_MODULES = [
+    'requests', 'urllib3', 'tqdm', 'asyncio', 'aiohttp', 'AdvancedHTMLParser',
+    'concurrent.futures'
+]
+
+# LOAD SCRIPT AS A MODULE, IT MUST NOT RUN
+IMPORT_CHECK = '''
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location( 'y2mate_download', sys.argv[1] )
+module = importlib.util.module_from_spec( spec )
+spec.loader.exec_module( module )
+assert callable( module.main )
+'''
+
+# MEASURE HELPERS
+# ==============================================================================
+def percentile( values, p ):
+    '''Get p percentile (0 to 100) of values, nearest rank'''
+
+    values = sorted( values )
+    index  = max( 0, math.ceil( p / 100 * len( values ) ) - 1 )
+    return values[index]
+
+def summarize( name, seconds, bytes = 0, wall = None ):
+    '''
+    Get phase result dict from a list of seconds per run. Throughput is
+    bytes over wall seconds (sum of runs by default).
+    '''
+    wall = wall if wall is not None else sum( seconds )
+
+    return {
+        'phase':  name,
+        'runs':   len( seconds ),
+        'mean':   sum( seconds ) / max( 1, len( seconds ) ),
+        'p50':    percentile( seconds, 50 ) if seconds else 0,
+        'p95':    percentile( seconds, 95 ) if seconds else 0,
+        'p99':    percentile( seconds, 99 ) if seconds else 0,
+        'wall':   wall,
+        'bytes':  bytes,
+        'mbps':   bytes / ( 1024 * 1024 ) / wall if wall > 0 else 0
+    }
+
+def formatResults( results ):
+    '''Get results table as string'''
+
+    lines = [
+        ' {:<16}{:>6}{:>11}{:>11}{:>11}{:>11}{:>12}'.format(
+            'Phase', 'Runs', 'Mean', 'p50', 'p95', 'p99', 'MB/s'
+        ),
+        ' ' + '-' * 78
+    ]
+
+    for r in results:
+        lines.append(
+            ' {:<16}{:>6}{:>8.1f} ms{:>8.1f} ms{:>8.1f} ms{:>8.1f} ms{:>12}' \
+                .format(
+                    r['phase'], r['runs'], r['mean'] * 1000, r['p50'] * 1000,
+                    r['p95'] * 1000, r['p99'] * 1000,
+                    '{:.2f}'.format( r['mbps'] ) if r['bytes'] else '-'
+                )
+        )
+
+    return '\n'.join( lines )
+# ==============================================================================
+
+# PHASES
+# ==============================================================================
+def runURL( client, vID, folder, format ):
+    '''Full process of one video, return saved bytes'''
+
+    info = client.getOptions( vID )
+    link = client.resolveLink( vID, format, info = info )
+
+    return client.download(
+        link, path.join( folder, '{}.{}'.format( vID, format ) )
+    ).bytes
+# ==============================================================================
+
+def benchPhases( args, folder, client ):
+    '''Sequential latency of every phase and single download throughput'''
+
+    times = { 'analyze': [], 'convert': [], 'download': [] }
+    saved = 0
+
+    for i in range( args.runs ):
+        vID = 'bench{}'.format( i )
+
+        start = monotonic()
+        info  = client.getOptions( vID )
+        times['analyze'].append( monotonic() - start )
+
+        start = monotonic()
+        link  = client.resolveLink( vID, args.format, info = info )
+        times['convert'].append( monotonic() - start )
+
+        start  = monotonic()
+        saved += client.download(
+            link, path.join( folder, 'single{}.{}'.format( i, args.format ) )
+        ).bytes
+        times['download'].append( monotonic() - start )
+
+    return [
+        summarize( 'analyze', times['analyze'] ),
+        summarize( 'convert', times['convert'] ),
+        summarize( 'download', times['download'], saved )
+    ]
+
+def benchBatch( args, folder, client ):
+    '''Full process of urls on a pool of threads'''
+
+    def run( i ):
+        start = monotonic()
+        saved = runURL( client, 'batch{}'.format( i ), folder, args.format )
+        return monotonic() - start, saved
+
+    start = monotonic()
+
+    with ThreadPoolExecutor( max_workers = args.workers ) as pool:
+        runs = list( pool.map( run, range( args.urls ) ) )
+
+    return summarize(
+        'batch x{}'.format( args.workers ), [ r[0] for r in runs ],
+        sum( r[1] for r in runs ), monotonic() - start
+    )
+
+def benchConverts( args, folder, client ):
+    '''
+    Batch of mp3Convert urls with client runBatch, slow conversions
+    (see --convert-time) overlap with downloads. One run, its wall time.
+    '''
+    results, stats = client.runBatch(
+        [ 'https://youtu.be/convert{}'.format( i ) for i in range( args.urls ) ],
+        workers = args.workers, format = 'mp3', mp3Convert = True,
+        folder = folder
+    )
+
+    for url, status, detail in results:
+        if not status:
+            raise Y2mateError( '{}: {}'.format( url, detail ) )
+
+    return summarize(
+        'mp3 batch x{}'.format( args.workers ), [ stats['seconds'] ],
+        stats['bytes'], stats['seconds']
+    )
+
+def benchAsync( args, folder ):
+    '''Full process of urls on AsyncClient, None without aiohttp'''
+
+    try:
+        import aiohttp
+    except ImportError:
+        return None
+
+    import asyncio
+    from AsyncClient import AsyncClient
+
+    async def run():
+        async with AsyncClient( engine = args.parser ) as client:
+            seconds = []
+
+            async def one( i ):
+                start = monotonic()
+                vID = 'async{}'.format( i )
+                info = await client.getOptions( vID )
+                quality = selectQuality( info.options, args.format, None )
+                link = await client.getLink(
+                    info.kID, vID, args.format, quality, host = info.host
+                )
+                stats = await client.downloadFile(
+                    link, path.join( folder, '{}.{}'.format( vID, args.format ) )
+                )
+                seconds.append( monotonic() - start )
+                return stats['bytes']
+
+            saved = await asyncio.gather( *[
+                one( i ) for i in range( args.urls )
+            ] )
+            return seconds, sum( saved )
+
+    start = monotonic()
+    seconds, saved = asyncio.run( run() )
+
+    return summarize(
+        'async x{}'.format( args.urls ), seconds, saved, monotonic() - start
+    )
+
+def getImportTimes( output ):
+    '''
+    Parse python -X importtime output. Return seconds of top level
+    imports (cumulative) and the set of every imported module.
+    '''
+    seconds = 0
+    modules = set()
+
+    for line in output.splitlines():
+        parts = line.split( '|' )
+
+        if not line.startswith( 'import time:' ) or len( parts ) != 3 \
+            or not parts[1].strip().isdigit():
+            continue
+
+        name = parts[2].rstrip()
+        modules.add( name.strip() )
+
+        # NESTED IMPORTS ARE INDENTED
+        if len( name ) - len( name.lstrip() ) == 1:
+            seconds += int( parts[1] ) / 1e6
+
+    return seconds, modules
+
+def benchStartup( args ):
+    '''
+    Wall and import time of y2mate-download -v and -h. Return results
+    and errors: heavy modules loaded on startup, or script running when
+    it's imported.
+    '''
+    results = []
+    errors  = []
+
+    for flag in [ '-v', '-h' ]:
+        command = [ sys.executable, SCRIPT, flag ]
+        wall, imports, modules = [], [], set()
+
+        for i in range( args.runs ):
+            start = monotonic()
+            subprocess.run(
+                command, check = True, stdout = subprocess.DEVNULL,
+                stderr = subprocess.DEVNULL
+            )
+            wall.append( monotonic() - start )
+
+            proc = subprocess.run(
+                command[:1] + [ '-X', 'importtime' ] + command[1:],
+                check = True, stdout = subprocess.DEVNULL,
+                stderr = subprocess.PIPE, universal_newlines = True
+            )
+            seconds, loaded = getImportTimes( proc.stderr )
+            imports.append( seconds )
+            modules |= loaded
+
+        for module in LAZY_MODULES:
+            if module in modules:
+                errors.append(
+                    '\'{}\' is imported by \'{}\''.format( module, flag )
+                )
+
+        results += [
+            summarize( 'startup ' + flag, wall ),
+            summarize( 'imports ' + flag, imports )
+        ]
+
+    proc = subprocess.run(
+        [ sys.executable, '-c', IMPORT_CHECK, SCRIPT ],
+        stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+        universal_newlines = True
+    )
+
+    if proc.returncode != 0 or proc.stdout != '':
+        errors.append( 'y2mate-download.py runs when it\'s imported' )
+
+    if args.maxStartup > 0:
+        for r in results[::2]:
+            if r['p50'] * 1000 > args.maxStartup:
+                errors.append( '{} p50 {:.1f} ms over {} ms'.format(
+                    r['phase'], r['p50'] * 1000, args.maxStartup
+                ) )
+
+    return results, errors
+
+def benchCLI( args, folder, baseURL ):
+    '''Wall time of y2mate-download runs, process startup included'''
+
+    script  = SCRIPT
+    env     = dict( environ, Y2MATE_CACHE_FOLDER = path.join( folder, 'cache' ) )
+    seconds = []
+
+    def getFolderSize():
+        return sum(
+            path.getsize( path.join( folder, f ) ) for f in listdir( folder )
+            if path.isfile( path.join( folder, f ) )
+        )
+
+    initial = getFolderSize()
+
+    for i in range( args.runs ):
+        start = monotonic()
+        subprocess.run(
+            [
+                sys.executable, script, '--base-url', baseURL,
+                '--non-interactive', '--no-cache', '-cd', '-s',
+                str( args.segments ), '-f', args.format,
+                'https://youtu.be/cli{}'.format( i )
+            ],
+            cwd = folder, env = env, check = True,
+            stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL
+        )
+        seconds.append( monotonic() - start )
+
+    return summarize( 'cli', seconds, getFolderSize() - initial )
+
+# CLI
+# ==============================================================================
+ap = argparse.ArgumentParser( description = __doc__.strip() )
+ap.add_argument( '--base-url', dest = 'baseURL', metavar = 'URL', \
+    help = 'Benchmark this server instead of a local stand-in one.' )
+ap.add_argument( '--runs', type = int, default = 10, \
+    help = 'Sequential runs of every phase.' )
+ap.add_argument( '--urls', type = int, default = 20, \
+    help = 'Urls of concurrent modes.' )
+ap.add_argument( '-w', '--workers', type = int, default = 4, \
+    help = 'Threads of batch mode.' )
+ap.add_argument( '-s', '--segments', type = int, default = 1, \
+    help = 'Parallel connections of every download.' )
+ap.add_argument( '-f', '--format', choices = [ 'mp3', 'mp4' ], default = 'mp4' )
+ap.add_argument( '--parser', choices = ENGINES, default = 'fast' )
+ap.add_argument( '--file-size', dest = 'fileSize', type = parseRate, \
+    default = '8M', metavar = 'BYTES', help = 'Stand-in file size.' )
+ap.add_argument( '--latency', type = float, default = 0, \
+    metavar = 'SECONDS', help = 'Stand-in latency of every request.' )
+ap.add_argument( '--rate', type = parseRate, default = 0, \
+    help = 'Stand-in bytes/sec of every file response.' )
+ap.add_argument( '--error-522', dest = 'error522', type = float, \
+    default = 0, metavar = 'P', help = 'Stand-in HTTP 522 probability.' )
+ap.add_argument( '--convert-time', dest = 'convertTime', type = float, \
+    default = 0, metavar = 'SECONDS', help = 'Stand-in time of every ' \
+    + 'mp3Convert conversion.' )
+ap.add_argument( '--stall', type = float, default = 0, metavar = 'P', \
+    help = 'Stand-in probability of a stalled API request.' )
+ap.add_argument( '--stall-time', dest = 'stallTime', type = float, \
+    default = 5, metavar = 'SECONDS', help = 'Stand-in delay of stalled ' \
+    + 'API requests.' )
+ap.add_argument( '--hedge', type = float, default = None, \
+    metavar = 'PERCENTILE', help = 'Hedge analyze and convert requests ' \
+    + 'slower than PERCENTILE of recent ones.' )
+ap.add_argument( '--checksum', dest = 'checksums', default = '', \
+    metavar = 'ALGORITHMS', help = 'Comma separated checksums computed ' \
+    + 'while files are saved.' )
+ap.add_argument( '--retries', type = int, default = 5, \
+    help = 'Max attempts of every request.' )
+ap.add_argument( '--progress', choices = REPORTERS, default = 'none', \
+    help = 'Progress reporter of downloads (output is dropped), to ' \
+    + 'measure its overhead.' )
+ap.add_argument( '--modes', default = 'startup,phases,batch,async,cli', \
+    help = 'Comma separated modes: startup, phases, batch, async, cli ' \
+    + 'and converts (mp3Convert batch).' )
+ap.add_argument( '--max-startup', dest = 'maxStartup', type = float, \
+    default = 0, metavar = 'MS', help = 'Fail when p50 startup time of ' \
+    + '-v or -h is over MS milliseconds.' )
+ap.add_argument( '--json', action = 'store_true', dest = 'asJSON', \
+    help = 'Print results as JSON.' )
+# ==============================================================================
+
+if __name__ == '__main__':
+    args   = ap.parse_args()
+    modes  = args.modes.split( ',' )
+    folder = tempfile.mkdtemp( prefix = 'y2mate-benchmark-' )
+    server = None
+
+    if args.baseURL:
+        baseURL = args.baseURL
+    else:
+        server = StandInServer(
+            fileSize = args.fileSize, latency = args.latency,
+            rate = args.rate, error522 = args.error522, seed = 0,
+            convertTime = args.convertTime, stall = args.stall,
+            stallTime = args.stallTime
+        ).start()
+        baseURL = server.url
+
+    setBaseURL( baseURL )
+    setRetryPolicy( RetryPolicy( attempts = args.retries, backoff = 0.05 ) )
+
+    if args.hedge is not None:
+        setHedgePolicy( HedgePolicy( percentile = args.hedge ) )
+    getSessionPool().ensureHostPoolSize(
+        urlGetNetloc( baseURL ), max( args.workers, args.segments )
+    )
+    client  = Y2mateClient(
+        downloader = Downloader(
+            segments = args.segments, verify = False,
+            checksums = [ a for a in args.checksums.split( ',' ) if a ]
+        ),
+        engine     = args.parser
+    )
+    results = []
+    errors  = []
+
+    # PROGRESS GOES TO STDERR, KEEP THE REPORT CLEAN
+    stderr, sys.stderr = sys.stderr, open( devnull, 'w' )
+    reporter = getReporter( args.progress )
+
+    if reporter is not None:
+        setProgress( Progress( reporter ) )
+
+    try:
+        if 'startup' in modes:
+            startup, errors = benchStartup( args )
+            results += startup
+
+        if 'phases' in modes:
+            results += benchPhases( args, folder, client )
+
+        if 'batch' in modes:
+            results.append( benchBatch( args, folder, client ) )
+
+        if 'converts' in modes:
+            results.append( benchConverts( args, folder, client ) )
+
+        if 'async' in modes:
+            result = benchAsync( args, folder )
+
+            if result is not None:
+                results.append( result )
+
+        if 'cli' in modes:
+            results.append( benchCLI( args, folder, baseURL ) )
+    finally:
+        sys.stderr.close()
+        sys.stderr = stderr
+        rmtree( folder, ignore_errors = True )
+
+        if server is not None:
+            server.stop()
+
+    if args.asJSON:
+        print( json.dumps( { 'results': results, 'errors': errors }, indent = 2 ) )
+    else:
+        print( ' Server: {}'.format( baseURL ) )
+        print( ' ' + formatPoolStats( getSessionPool().getStats() ) )
+
+        if getHedgePolicy() is not None:
+            print( ' Hedges: {hedges} sent, {wins} won ({requests} ' \
+                'requests)'.format( **getHedgePolicy().getStats() ) )
+
+        print()
+        print( formatResults( results ) )
+
+        for error in errors:
+            print( ' [Error] Startup: {}'.format( error ) )
+
+    # GUARD AGAINST STARTUP REGRESSIONS
+    exit( 1 if errors else 0 )
@@ -7,15 +7,32 @@ Date: 15-05-2021
 Email: francisca.leonor.alejandra.c@gmail.com
 """
 
-import AdvancedHTMLParser
 import argparse
-import copy
-import requests
+import atexit
+import json
 from RequestUtils import *
-from Request import Request
-from os import getenv, path, remove
-from tqdm import tqdm
-from sys import argv, version_info
+from Metrics import FORMATS, Metrics, getMetrics, setMetrics
+from OptionsParser import ENGINES
+from Profiler import Profiler, getProfiler, setProfiler
+from Progress import REPORTERS, Progress, getReporter, setProgress
+from QualityPolicy import PREFERENCES, QualityPolicy, setQualityPolicy
+from RateLimiter import parseRate
+from Retry import DEFAULT_RULES, RetryPolicy, getRetryPolicy, setRetryPolicy
+from Checksum import ALGORITHMS, Manifest, newDigest
+from DownloadLedger import MODES, VERIFY_POLICIES
+from JobClient import DEFAULT_ADDRESS, JobError
+from Y2mateApi import *
+from VideoInfo import formatSize, parseSize
+from Y2mateClient import Y2mateClient
+from os import getcwd, path
+from sys import argv, stdin, version_info
+from time import monotonic, sleep
+
+# HEAVY MODULES (requests, tqdm, asyncio, concurrent.futures, hashlib, sqlite3,
+# profilers...) ARE IMPORTED BY THE FUNCTIONS THAT USE THEM, HERE AND IN EVERY
+# MODULE, SO '-h' OR '-v' START FAST. y2mate-benchmark.py --modes startup FAILS
+# WHEN THEY'RE LOADED ON STARTUP. DOWNLOADS ARE DONE BY Y2mateClient, THIS
+# SCRIPT ONLY SHOWS STATUS AND ASKS THE USER
 
 # AUTHOR AND PROJECT INFO
 # ----------------------------------------------------
@@ -35,15 +52,12 @@ def checkVersion( interrupt = False, verbose = False ):
     '''
     Check min python required version or exit
     '''
-    v = float(
-        '{}.{}{}'.format(
-            str(version_info.major),
-            str(version_info.minor),
-            str(version_info.micro)
-        )
+    # COMPARE AS TUPLES, AS FLOAT 3.11 WOULD BE LOWER THAN 3.8
+    minVersion = tuple(
+        int( n ) for n in str( __project['pyMinVersion'] ).split( '.' )
     )
 
-    if  v < __project['pyMinVersion']:
+    if  tuple( version_info[:2] ) < minVersion:
         outMsg = 'Python {} or above is required!'.format(
             __project['pyMinVersion']
         )
@@ -84,438 +98,355 @@ def _ask_yes_not( msg = '' ):
 
     return Answer( answer == 'y', answer == 'n' )
 
-def getAudioFolderPath():
+def getVideoInfo( client, url, mp3Convert = False, refresh = False,
+        verbose = False ):
     '''
-    Get audio folder path from Y2MATE_AUDIO_FOLDER
-    enviroment variable.
+    Get VideoInfo of url with client, showing process status. Errors
+    are raised as Y2mateError.
     '''
-    return getenv( 'Y2MATE_AUDIO_FOLDER', '' )
+    _verbose( verbose, 'Status: Decoding video ID...', end = '' )
 
-def getVideoFolderPath():
-    '''
-    Get video folder path from Y2MATE_VIDEO_FOLDER
-    enviroment variable.
-    '''
-    return getenv( 'Y2MATE_VIDEO_FOLDER', './' )
+    try:
+        vID = client.parseVideoID( url )
+    except Y2mateError:
+        _verbose( verbose, '[Error]' )
+        raise
 
-def getVideoID( youtubeURL, verbose = False ):
-    '''
-    Parse the video ID from youtube url.
-    
-    Note: Time '[?t|&t]=' param is avoided.
-    Formats admited:
-    - https://www.youtube.com/watch?v=VIDEO-ID
-    - https://yutu.be/VIDEO-ID
-    
-    Params:
-    - v: Verbose. Show info about process status.
-    '''
-    _verbose( verbose, 'Status: Decoding video ID...', end = '' )
-    parse = requests.utils.urlparse( youtubeURL )
+    _verbose( verbose, '[OK]' )
+    _verbose( verbose, 'Status: Getting download available options...', end='' )
+
+    try:
+        info = client.getOptions( vID, mp3Convert, refresh )
+    except OptionsError:
+        _verbose( verbose, '[Error]' )
+        raise
 
-    # CHECK SHORT VERSION & GET VIDEO ID
-    # -------------------------------------------------------------------------
-    if parse.netloc == 'youtu.be':
-        vID = parse.path[1:]
-    else:
-        vID = list(
-            filter(
-                lambda e: 'v=' in e,
-                parse.query.split( '&' )
-            )
-        )[0].replace( 'v=', '')
-    # -------------------------------------------------------------------------
-    
     _verbose( verbose, '[OK]' )
-    return vID
 
-def getOptions( vID, verbose = False, debug = False, mp3Convert = False ):
+    if info.cached:
+        _verbose( verbose, 'Status: Using cached download options' )
+
+    return info
+
+def getDownloaded(
+        client, info, format, quality = None, useCurrentDir = False,
+        verbose = False
+    ):
     '''
-    Get available options from API.
-    - vID:        Youtube video ID.
-    - verbose:    Show info about process status.
-    - debug:      Show debug info about HTTP requests.
-    - mp3Convert: Get Options from Y2mate Youtube MP3 Converter
+    Get path of info option file when it's on client download ledger,
+    showing where it's at, None otherwise.
     '''
-    
-    if mp3Convert:
-        optionsURL = 'https://www.y2mate.com/mates/en31/mp3/ajax'
-    else:
-        optionsURL = 'https://www.y2mate.com/mates/es19/analyze/ajax'
-    
-    data = {
-        'url':    'https://youtube.com/watch?v=' + vID,
-        'q_auto': 0,
-        'ajax':   1
-    }
-    headers = {
-        'authority':    urlGetNetloc( optionsURL ),
-        'content-type': getContentType( 'form' ) ,
-        'method':       'POST',
-        'path':         urlGetPath( optionsURL ),
-        'referer':      'https://www.y2mate.com/es/youtube/' + vID,
-        'scheme':       urlGetScheme( optionsURL ),
-        'User-Agent':   getChromeAgent() 
-    }
-    req = Request(
-        url = optionsURL, method = 'POST', headers = headers, data = data, \
-        debug = debug
-    )
-    res = req.do()
-    _verbose( verbose, 'Status: Getting download available options...', end='' )
-    
-    if res.status_code == 200:
-        # GET AVAILABLE OPTIONS
-        if res.headers['Content-Type'] == 'application/json':
-            parser = AdvancedHTMLParser.AdvancedHTMLParser()
-            parser.parseStr( res.json()['result'] )
-            
-            # GET KID FROM SCRIPT CONTENT
-            kID = res.json()['result'].split('k__id = "')[1].split('"')[0]
-            
-            # GET VIDEO TITLE
-            title = parser.getElementsByClassName('caption')[0] \
-                .children[0] \
-                .innerText
-
-            if mp3Convert:
-                data = parseYoutubeMp3ConverterOptions( parser, verbose )
-            else:
-                data = parseYoutubeDownloaderOptions( parser, verbose )
-
-            data['kID']   = kID
-            data['title'] = title
-            return data
-        else:
-            _verbose( verbose, '[Error]' )
-            return None
+    if client.ledger is None:
+        return None
 
-    else:
+    _verbose( verbose, 'Status: Looking for file on download ledger...', end='' )
+
+    try:
+        result = client.getDownloaded( info, format, quality, useCurrentDir )
+    except Y2mateError:
+        _verbose( verbose, '[Error]' )
+        raise
+
+    if result is None:
+        _verbose( verbose, '[Not found]' )
         return None
 
-def parseYoutubeMp3ConverterOptions( parser, verbose ):
+    _verbose( verbose, '[OK]' )
+    print( 'Already downloaded, saved at \'{}\'...'.format( result.filePath ) )
+    return result.filePath
+
+def downloadFile(
+        client, info, format, quality = None, useCurrentDir = False,
+        verbose = False, interactive = True
+    ):
     '''
-    Parse data from Y2mate Youtube MP3 Converter
+    Download info option closest to quality with client and return the
+    saved file path. Errors are raised as Y2mateError.
+    - useCurrentDir: Let you download files on current directory
+    - verbose:       Show status info
+    - interactive:   Ask user on HTTP 522 (when automatic retries are
+                     exhausted) and existing files. When False 522 errors
+                     are raised and existing files are kept.
     '''
+    from Download import formatStats
 
-    ul = parser.getElementsByTagName('ul')[0]
-    options = {}
-    options['mp3'] = [
-        int(
-            li.children[0].getAttribute('onclick') \
-                .replace( 'changeMp3Type(', '' ) \
-                .split( ',' )[0]
-        )
-        for li in ul.children
-    ]
-    options['mp3'].sort()
-    
-    # ADD EXTRA DATA
-    options['mp3'] = [
-        { 'quality': o, 'size': '? MB', 'type': 'mp3' }
-        for o in  options['mp3']
-    ]
-    return { 'options': options }
-
-def parseYoutubeDownloaderOptions( parser, verbose ):
-    '''
-    Parse data from Y2mate Youtube Downloader
-    ''' 
-
-    # GET OPTIONS
-    options = {}
-    options['mp4'] = parseOptions( parser.getElementById('mp4') )
-    options['mp3'] = parseOptions( parser.getElementById('mp3') )
-    options['m4a'] = parseOptions( parser.getElementById('audio') )
-
-    # CHECK FOR NO DATA
-    for k in list( options.keys() ):
-        if len( options[k] ) == 0:
-            del options[k]
-
-    # FILTER AUDIO MP3 ITEMS (THERE PROBABLY REPEATED)
-    if 'm4a' in options:
-        options['m4a'] = list(
-            filter(
-                (lambda e: e['type'] != 'mp3'),
-                options['m4a']
-            )
+    # GET DOWNLOAD LINK
+    ###########################################################################
+    if info.mp3Convert:
+        print( 'This may take a while, please be patient!\n' )
+
+    _verbose( verbose, 'Status: Getting file download link...', end = '' )
+
+    try:
+        link = client.resolveLink(
+            info.vID, format, quality, info.mp3Convert, info = info
         )
+    except Y2mateError:
+        _verbose( verbose, '[Error]' )
+        raise
 
     _verbose( verbose, '[OK]' )
-    return { 'options': options }
-    
-def parseOptions( tab ):
-    '''
-    Process tab options table on result HTML when
-    user paste video on download textbox at y2mate.com
-    '''
-    
-    # WHEN TAB IS NONE THERE IS NO DATA
-    if tab is None:
-        return []
 
-    # PARSE DATA
-    parser = AdvancedHTMLParser.AdvancedHTMLParser()
-    parser.parseStr( tab[0].innerHTML )
-    
-    # PREPARE FOR SAVE DATA
-    optionSample = { 'quality': None, 'size': None, 'type': None }
-    options = []
-    
-    # PROCESS DATA
-    for tr in parser.getElementsByTagName('tr')[1:-1]:
-        trParser = AdvancedHTMLParser.AdvancedHTMLParser()
-        trParser.parseStr( tr.innerHTML )
-
-        tdList = trParser.getElementsByTagName('td')
-
-        # FILL OPTION DATA
-        option = copy.deepcopy( optionSample )
-        option['size']    = tdList[1].innerText
-        # WHEN AUDIO TAB IS PROCESSED THERE IS BUTTON BEFORE A ELEMENT
-        # ------------------------------------------------------------
-        if len( tdList[2].getChildren() ) == 2:
-            index = 1
+    # ASK FOR FILE OVERWRITE
+    # -------------------------------------------------------------------------
+    filePath  = client.getFilePath( link, useCurrentDir )
+    overwrite = False
+
+    if path.isfile( filePath ):
+        if interactive:
+            overwrite = _ask_yes_not(
+                'File \'{}\' already exists, overwride?'.format( filePath )
+            ).isYes
+
+        # NON INTERACTIVE RUNS NEVER DELETE EXISTING FILES
+        if overwrite:
+            print( 'File \'{}\' will be replaced!'.format( filePath ) )
         else:
-            index = 0
-        # ------------------------------------------------------------       
-        option['type']    = tdList[2].getChildren()[index] \
-            .getAttribute('data-ftype')
+            print( 'File \'{}\' renamed to \'{}\''.format(
+                path.basename( filePath ),
+                path.basename( addFilePrefix( filePath ) )
+            ) )
+    # -------------------------------------------------------------------------
 
-        option['quality'] = tdList[2].getChildren()[index] \
-            .getAttribute('data-fquality')
-        
-        # REPLACE p AND HFR strings ON quality INDEX
-        option['quality'] = option['quality'].replace('p', '')
-        option['quality'] = option['quality'].replace('HFR', '')
+    # DOWNLOAD FILE
+    # -------------------------------------------------------------------------
+    _verbose( verbose, f'Status: File to download: \'{link.link}\'' )
+    _verbose( verbose, 'Status: Tryng to downloading file...', end = '' )
 
-        option['quality'] = int( option['quality'] )
-        options.append( option )
+    downloadTimeout = 60
+    while True:
+        try:
+            result = client.download(
+                link, filePath, overwrite = overwrite,
+                timeout = downloadTimeout
+            )
+        except ServerError as e:
+            _verbose( verbose, '[ERROR] HTTP {}!'.format( e.status ) )
 
-    return options
+            # CLOUDFLARE 522 ERROR FIX
+            if e.status != 522 or not interactive:
+                raise
+
+            print( '\n' + str( e ) )
+
+            # RETRY OPTION LOOP
+            answer = _ask_yes_not( '\nDo you want to retry?' )
+
+            if answer.isNot:
+                raise Y2mateError( 'bye!' )
+
+            _verbose( verbose, '[INFO] HTTP 522 Retryng!' )
+            downloadTimeout += 60
+            print( f'\nRetrying with timeout of {downloadTimeout} seconds...!' )
+            continue
 
-def selectQuality( options, format, quality ):
+        break
+
+    print( formatStats( result.stats ) )
+    print( 'Saved at \'{}\'...'.format( result.filePath ) )
+    _verbose( verbose, '[OK]' )
+
+    for algorithm, digest in result.stats.get( 'checksums', {} ).items():
+        _verbose( verbose, 'Status: {} {}'.format( algorithm, digest ) )
+    # -------------------------------------------------------------------------
+    ###########################################################################
+
+    return result.filePath
+
+def readURLs( source ):
     '''
-    Select quality according given parameters.
-    
-    When format is not available the program exit.
-    If quality is None, then max value is returned.
-    Otherwise is the closest one.
+    Yield urls from a file one by one, '-' reads from stdin.
+    Empty lines and lines starting with '#' are ignored.
     '''
-    if format not in options:
-        exit( '[Error]: Format specified not available!' )
-    else:
-        option = options[format]
-        qualities = [ e['quality'] for e in option ]
-        qualities.sort()
+    f = stdin if source == '-' else open( source, 'r' )
 
-        # IF QUALITY IS NONE SELECT MAX QUALITY
-        if quality == None:
-            quality = max( qualities )
-        
-        # GET CLOSEST QUALITY FROM AVAILABLE
-        else:
-            quality = min( qualities, key = lambda x:abs( x - quality ) )
-        
-        return quality
+    try:
+        for line in f:
+            line = line.strip()
+
+            if line == '' or line.startswith( '#' ):
+                continue
+
+            yield line
+    finally:
+        if f is not stdin:
+            f.close()
+
+def runAsync( urls, workers = 100, verbose = False, debug = False, \
+        cache = None, engine = 'fast', limiter = None, fileRate = 0, \
+        ledger = None, manifest = None, checksums = [], converts = 8, \
+        convertDeadline = 600, chunk = 'auto', writeBuffers = 0, \
+        fsync = False, **kwargs ):
+    '''
+    Download every url from urls iterable on asyncio event loop with
+    AsyncClient. Same results as Y2mateClient.runBatch, with mp3Convert
+    converts more urls wait for their conversion meanwhile. Streams
+    aren't adaptive, 'auto' chunk is AsyncClient default one.
+    '''
+    import asyncio
+    from AsyncClient import AsyncClient
+
+    concurrency = workers + ( converts if kwargs.get( 'mp3Convert' ) else 0 )
+    options     = {} if chunk == 'auto' else { 'chunk': chunk }
+
+    async def run():
+        async with AsyncClient(
+            analyzeLimit  = workers,
+            convertLimit  = workers,
+            downloadLimit = workers,
+            cache         = cache,
+            engine        = engine,
+            limiter       = limiter,
+            fileRate      = fileRate,
+            ledger        = ledger,
+            manifest      = manifest,
+            checksums     = checksums,
+            debug         = debug,
+            verbose       = verbose,
+            writeBuffers  = writeBuffers,
+            fsync         = fsync,
+            convertDeadline = convertDeadline,
+            **options
+        ) as client:
+            return await client.runBatch(
+                urls, concurrency = concurrency, **kwargs
+            )
 
-def downloadFile(
-        kID, vID, mp3Convert = False, useCurrentDir = False, fileName = '',
-        format = None, quality = None, debug = False, verbose = False
+    # ITS PHASES RUN INTERLEAVED, THE WHOLE LOOP IS ONE PROFILED PHASE
+    with getProfiler().phase( 'async' ):
+        return asyncio.run( run() )
+
+def submitJobs(
+        address, urls, format, quality = None, mp3Convert = False,
+        useCurrentDir = False, redownload = False, wait = False,
+        verbose = False
     ):
     '''
-    Download a file from youtube with y2mate.com API
-    Parameters:
-    - kID:           Security ID generated by y2mate on their JavaScript Code.
-    - vID:           Youtube video ID
-    - useCurrentDir: Let you download files on current directory
-    - fileName:      FileName name
-    - format:        Selected format with -f
-    - quality:       Selected quality with -q
-    - debug:         Show debug info
-    - verbose:       Show status info
+    Submit a download job for every url to daemon at address, files are
+    saved on current dir with useCurrentDir. With redownload files on
+    daemon ledger are downloaded again. With wait, return
+    ( url, status, filePath or error message ) tuples like batch mode
+    when jobs end, otherwise ( url, True, job ID ) when they are queued.
+    A rejected url doesn't stop the others, daemon errors are raised as
+    JobError.
+    - verbose: Show progress of jobs while waiting.
     '''
+    from JobClient import JobClient
 
-    if fileName == '':
-        return None
+    client  = JobClient( address )
+    folder  = getcwd() if useCurrentDir else None
+    jobs    = []
+    results = []
 
-    if format == None or quality == None:
-        return None
+    for url in urls:
+        try:
+            job = client.submit(
+                url, format, quality, mp3Convert, folder, redownload
+            )
+        except JobError as e:
+            if e.status is None:
+                raise
 
-    # GET DOWNLOAD LINK
-    ###########################################################################
-    if mp3Convert:
-        print( 'This may take a while, please be patient!\n' )
+            print( 'Rejected {}: {}'.format( url, e ) )
+            jobs.append( { 'url': url, 'state': 'failed', 'error': str( e ) } )
+            continue
 
-        getLinkURL = 'https://www.y2mate.com/mates/mp3Convert'
-    else:
-        getLinkURL = 'https://www.y2mate.com/mates/es/convert'
-    
-    data = {
-        'type':     'youtube',
-        '_id':      kID,
-        'v_id':     vID,
-        'ajax':     1,
-        'token':    '',
-        'ftype':    format,
-        'fquality': quality
-    }
-    
-    headers = {
-        'authority':      urlGetNetloc( getLinkURL ),
-        'method':         'POST',
-        'path':           urlGetPath( getLinkURL ),
-        'scheme':         urlGetScheme( getLinkURL ),
-        'content-type':   getContentType( 'form' ),
-        'origin':         urlGetPath( getLinkURL ),
-        'pragma':         'no-cache',
-        'referer':        'https://y2mate.com/es/youtube/' + vID,
-        'user-agent':     getChromeAgent(), 
-        'x-request-with': 'XMLHttpRequest'
-    } 
-
-    req = Request(
-        url = getLinkURL, method = 'POST', headers = headers, data = data, \
-        debug = debug
-    )
+        print( 'Job {}: queued {}'.format( job['id'], url ) )
+        jobs.append( job )
 
-    _verbose( verbose, 'Status: Getting file download link...', end = '' ) 
+    for job in jobs:
+        if job['state'] == 'failed':
+            results.append( ( job['url'], False, job['error'] ) )
+            continue
 
-    res = req.do()
-    if res.status_code == 200:
-        parser = AdvancedHTMLParser.AdvancedHTMLParser()
-        parser.parseStr( res.json()['result'] )
+        if not wait:
+            results.append( ( job['url'], True, job['id'] ) )
+            continue
 
-        # DETECT TO LONG VIDEO ERROR
-        if 'video is too long' in res.json()['result']:
-            exit( '[Error] Video is too long, try with shorter one!' )
+        while job['state'] not in [ 'done', 'failed' ]:
+            job = client.get( job['id'], wait = 1 if verbose else 30 )
+            progress = job['progress']
 
-        # GET DOWNLOAD LINK
-        if len( parser.getElementsByTagName('a') ) == 0:
-            exit( '[Error] something is wrong with download... try again!' )
-        
-        fileLink = parser.getElementsByTagName('a')[0].href
-        # FIX HTTPS => HTTP
-        if 'https' in fileLink:
-            fileLink = fileLink.replace( 'https', 'http' )
+            _verbose( verbose, 'Status: Job {} {} {} {:.2f}/{:.2f} MB'.format(
+                job['id'], job['state'], job['phase'] or '',
+                progress['bytes'] / ( 1024 * 1024 ),
+                progress['total'] / ( 1024 * 1024 )
+            ) )
 
-        _verbose( verbose, '[OK]' )
-        
-        # DOWNLOAD FILE
-        # ---------------------------------------------------------------------
-        _verbose( verbose, f'Status: File to download: \'{fileLink}\'' )
-        _verbose( verbose, 'Status: Tryng to downloading file...', end = '' )
-
-        # REMOVE CHARACTERS
-        fileName = fileName.replace( '/', '' ) \
-                .replace( '[', '' ) \
-                .replace( ']', '' ) \
-                .replace( "'", '' )
-        fileName = fileName.split('.')
-        ext  = fileName.pop()
-        name = '.'.join(fileName).strip()
-        fileName = name + '.' + ext 
-
-        # SET FILE PATH TO CURRENT DIRECTORY
-        if useCurrentDir:
-            filePath = './' + fileName
-        # CHOSE FILE PATH FROM ENVIROMENT VARIABLES
+        if job['state'] == 'done':
+            results.append( ( job['url'], True, job['filePath'] ) )
         else:
-            # AUDIO FILES
-            if format in [ 'mp3', 'm4a' ]:
-                saveDir = getAudioFolderPath()
-            # VIDEO FILES
-            else:
-                saveDir = getVideoFolderPath()
-            filePath = saveDir + fileName
-
-        chunk = 1024
-        downloadTimeout = 60
-        while True:
-            # CONFIGURE DOWNLOAD
-            headers = {
-                'User-Agent': getChromeAgent(),
-                'authority': urlGetNetloc( fileLink ),
-                'Connection': 'Keep-Alive'
-            }
-            reDownload = Request(
-                url = fileLink, \
-                headers = headers, \
-                debug = debug, \
-                stream = True, \
-                timeout = downloadTimeout
-            )
-            
-            # DISABLE SSL WARNING
-            reDownload.disableSSLVerification()
-            res = reDownload.do()
-            
-            # FILE NOT FOUND. SERVER ERROR
-            if res.status_code == 404:
-                _verbose( verbose, '[ERROR] HTTP 404!')
-                exit( '[Server Error]: File not found!' )
-            
-            # CLOUDFLARE 522 ERROR FIX
-            if res.status_code == 522:
-                _verbose( verbose, '[ERROR] HTTP 522!' )
-                print( '\n[Server Error]: HTTP 522 Connection timeout!' )
-                
-                # RETRY OPTION LOOP
-                answer = _ask_yes_not( '\nDo you want to retry?' )
-
-                if answer.isNot:
-                    exit( 'bye!' )
-                else:
-                    _verbose( verbose, '[INFO] HTTP 522 Retryng!' )
-                    downloadTimeout += 60
-                    print( f'\nRetrying with timeout of {downloadTimeout} seconds...!' )
-                    continue
-            
-            # BREAK DOWNLOAD RETRYNG LOOP
-            if res.status_code == 200:
-                break
-        # ASK FOR FILE OVERWRITE
-        # ---------------------------------------------------------------------
-        if path.exists( filePath ) and path.isfile( filePath ):
-            answer = _ask_yes_not( 
-                'File \'{}\' already exists, overwride?'.format( filePath )
+            results.append( ( job['url'], False, job['error'] ) )
+
+    return results
+
+def getBatchSummary( results, stats = None ):
+    '''
+    Get batch results summary in string, download stats are shown when
+    given.
+    '''
+    ok = len( [ r for r in results if r[1] ] )
+    output = '\n Batch summary: {} ok, {} failed'.format(
+        ok, len( results ) - ok
+    )
+
+    if stats is not None:
+        from Download import formatStats
+        output += '\n ' + formatStats( stats )
+
+    output += '\n ' + '-' * 62
+
+    for url, status, detail in results:
+        output += '\n [{}] {}\n        {}'.format(
+            'OK' if status else 'FAIL', url, detail
+        )
+    output += '\n {}\n'.format( '-' * 62 )
+
+    return output
+
+def getInfoOutput( info, formats = None ):
+    '''
+    Get '-sio' options table of VideoInfo in string, only formats when
+    given.
+    '''
+    q_postFix = { 'audio': 'kbps', 'mp4': 'p' }
+    f_separator = { 'audio': '   ', 'mp4': '\t   ' }
+    lines = [ getProjectInfo() ]
+
+    # SET Y2MATE SERVICE TITLE
+    lines.append( ' Service: Y2mate Youtube {}'.format(
+        'MP3 Converter' if info.mp3Convert else 'Downloader'
+    ) )
+    lines.append( '\n Available options:' )
+
+    for format in info.options.keys() if formats is None else formats:
+        # CONVERT FORMAT TO SET KEY ACCESIBLE
+        set_k = 'audio' if format in [ 'audio', 'mp3' ] else 'mp4'
+
+        lines += [ '', ' ' + format.capitalize(), ' ' + '-' * 22 ]
+        lines.append( ' Quality | Size' )
+        lines += [
+            ' {}{}{}'.format(
+                str( option.quality ) + q_postFix[set_k], f_separator[set_k],
+                formatSize( option.size )
             )
+            for option in info.options.get( format, [] )
+        ]
+        lines.append( ' ' + '-' * 22 )
 
-            if answer.isYes:
-                remove( filePath )
-                print( 'File \'{}\' deleted!'.format( filePath ) )
-            # CHANGE FILE NAME FOR NOT OVERWRITE
-            else:
-                _fileName = fileName
-                _path = filePath.split('/') 
-                filePath = '/'.join( _path[:-1] ) + '/2_' + _path[-1] 
-                fileName = '2_' + fileName
-                print( 'File \'{}\' renamed to \'{}\''.format( _fileName, fileName ) )
-        # ---------------------------------------------------------------------
-
-        # SAVE FILE STREAM
-        # ---------------------------------------------------------------------
-        filePath = path.normpath( filePath )
-        fileSize = int( res.headers.get( 'content-length', 0 ) )
-
-        with open( filePath, 'wb' ) as f, tqdm(
-            desc=fileName, total = fileSize, unit = 'iB', unit_scale = True,
-            unit_divisor = chunk
-        ) as bar:
-            for data in res.iter_content( chunk_size = chunk ):
-                size = f.write( data )
-                bar.update( size )
-        
-        print('Saved at \'{}\'...'.format( filePath ))
-        # ---------------------------------------------------------------------
-       
-        _verbose( verbose, '[OK]' )
-        # ---------------------------------------------------------------------
-    else:
-        _verbose( verbose, '[error]' )
+    return '\n'.join( lines ) + '\n'
 
-    ###########################################################################
+def getInfoJSON( info, formats = None, url = None ):
+    '''
+    Get '-sio --json' line of VideoInfo, sizes are bytes (null when
+    unknown). Only formats when given.
+    '''
+    data = info.toDict( formats )
+
+    if url is not None:
+        data = dict( url = url, **data )
+
+    return json.dumps( data, ensure_ascii = False )
 
 def getProjectInfo( indentChar = ' ' ):
     '''
@@ -538,200 +469,771 @@ def getProjectInfo( indentChar = ' ' ):
 
 # CLI PARAMETERS
 # ------------------------------------------------------------------------------
-ap = argparse.ArgumentParser(
-    add_help = False,
-    description = 'Download or Convert to MP3 a Youtube Video'
-)
-ap.version = '0.0.1'
-# VERSION
-# ==============================================================================
-ap.add_argument( '-v', '--version', action = 'version', \
-    help = 'Show version of this program.' )
-# ==============================================================================
-
-# DEBUG
-# ==============================================================================
-ap.add_argument( '-d', '--debug', action = 'store_true', dest = 'isDebug', \
-    help = 'Show debug info.'  )
-# ==============================================================================
-
-# VERBOSE
-# ==============================================================================
-ap.add_argument( '-ve', '--verbose', action = 'store_true', \
-    dest = 'isVerbose', help = 'Show process status and info.' )
-# ==============================================================================
-
-# FORMAT
-# ==============================================================================
-formatExclusiveGroup = ap.add_mutually_exclusive_group( required = True )
-formatExclusiveGroup.add_argument( '-f', '--format', action = 'store', dest = 'format', \
-    choices = [ 'm4a', 'mp3', 'mp4' ], default = 'mp3', \
-    help = 'Specify output format.' )
-# ==============================================================================
-
-# QUALITY
-# ==============================================================================
-ap.add_argument( '-q', '--quality', action = 'store', dest = 'quality', \
-    type = int, help = 'Specify output quality.' )
-# ==============================================================================
-# SHOW INFO ONLY
-# ==============================================================================
-ap.add_argument( '-sio', action = 'store_true', dest = 'showInfoOnly', \
-    help = 'Only get and show info about format and qualities availables.' )
-# ==============================================================================
-
-# SHOW FORMAT ONLY
-# ==============================================================================
-ap.add_argument( '-sfo', action = 'store_true', dest = 'showFormatOnly', \
-    help = 'Show specified format info Only.')
-# ==============================================================================
-
-# DOWNLOAD FILES ON CURRENT DIR
-# ==============================================================================
-ap.add_argument( '-cd', action = 'store_true', dest = 'useCurrentDir', \
-    help = 'Download files on current dir.' )
-# ==============================================================================
-
-# MP3 CONVERT
-# ==============================================================================
-ap.add_argument( '--mp3-convert', action = 'store_true', dest = 'mp3Convert', \
-    help = 'Use Y2mate\'s youtube MP3 converter service' )
-# ==============================================================================
-
-# OVERRIDE HELP COMMAND
-# ==============================================================================
-formatExclusiveGroup.add_argument( '-h', '--help', action = 'store_true', dest = 'showHelp', \
-    help = 'Show this help message and exit.')
-# ==============================================================================
-
-# URL (POSITIONAL ARGUMENT)
-# ==============================================================================
-ap.add_argument( 'url', nargs = '?', action = 'store' )
-# ==============================================================================
-
-# CHECK VERSION
-# ==============================================================================
-result = checkVersion( interrupt = True )
-
-if not result['status']:
-    exit( result['msg'] )
-# ==============================================================================
-
-args = ap.parse_args()
-# ------------------------------------------------------------------------------
+def chunkSize( value ):
+    '''Parse chunk size CLI value, bytes count or auto'''
+    if value == 'auto':
+        return value
 
-# IF SOME RESULTS GIVE NONE START AGAIN
-while True:
+    if not value.isdigit() or int( value ) <= 0:
+        raise argparse.ArgumentTypeError( 'must be \'auto\' or bytes > 0' )
+
+    return int( value )
+
+def rate( value ):
+    '''Parse rate CLI value, bytes/sec with K, M or G suffix'''
     try:
-        # CHECK HELP
-        if args.showHelp:
-            print( getProjectInfo( indentChar = '' )[1:] )
-            ap.print_help() 
-            exit()
-
-        # CHECK MP3 CONVERT AND FORMAT OPTION
-        if args.format != 'mp3' and args.mp3Convert:
-            _verbose( args.isVerbose, 'Status: CLI wrong parameters!' )
-            exit( 'You must specified \'-f mp3\' to use \'--mp3-convert\' option!' )
-        
-        # CHECK FOR EMPTY VIDEO URL
-        if args.url == None or args.url == '':
-            _verbose( args.isVerbose, 'Status: You must give me a video url!' )
+        return parseRate( value )
+    except ValueError as e:
+        raise argparse.ArgumentTypeError( str( e ) )
+
+def retryRules( value ):
+    '''Parse retry rules CLI value, comma separated list'''
+    rules = [ r.strip().lower() for r in value.split( ',' ) if r.strip() ]
+
+    for r in rules:
+        if not r.isdigit() and r not in [ '5xx', 'connection', 'timeout' ]:
+            raise argparse.ArgumentTypeError(
+                'invalid rule \'{}\''.format( r )
+            )
+
+    return rules
+
+def size( value ):
+    '''Parse size CLI value, bytes with K, M or G suffix'''
+    count = parseSize( value )
+
+    if count is None or count <= 0:
+        raise argparse.ArgumentTypeError( 'must be bytes > 0 (i.e. 200M)' )
+
+    return count
+
+def formats( value ):
+    '''Parse formats CLI value, comma separated list'''
+    formats = [ f.strip().lower() for f in value.split( ',' ) if f.strip() ]
+
+    for f in formats:
+        if f not in [ 'm4a', 'mp3', 'mp4' ]:
+            raise argparse.ArgumentTypeError(
+                'invalid format \'{}\''.format( f )
+            )
+
+    return formats
+
+def checksums( value ):
+    '''Parse checksums CLI value, comma separated algorithms or none'''
+    algorithms = [ a.strip().lower() for a in value.split( ',' ) if a.strip() ]
+
+    if algorithms == [ 'none' ]:
+        return []
+
+    for a in algorithms:
+        if a not in ALGORITHMS:
+            raise argparse.ArgumentTypeError(
+                'invalid checksum \'{}\''.format( a )
+            )
+
+    return algorithms
+
+def getArgumentParser():
+    '''Get CLI parameters parser'''
+
+    ap = argparse.ArgumentParser(
+        add_help = False,
+        description = 'Download or Convert to MP3 a Youtube Video'
+    )
+    ap.version = '0.0.1'
+    # VERSION
+    # ==========================================================================
+    ap.add_argument( '-v', '--version', action = 'version', \
+        help = 'Show version of this program.' )
+    # ==========================================================================
+
+    # DEBUG
+    # ==========================================================================
+    ap.add_argument( '-d', '--debug', action = 'store_true', dest = 'isDebug', \
+        help = 'Show debug info.'  )
+    # ==========================================================================
+
+    # VERBOSE
+    # ==========================================================================
+    ap.add_argument( '-ve', '--verbose', action = 'store_true', \
+        dest = 'isVerbose', help = 'Show process status and info.' )
+    # ==========================================================================
+
+    # FORMAT
+    # ==========================================================================
+    # REQUIRED BUT ON --serve, CHECKED BY main
+    formatExclusiveGroup = ap.add_mutually_exclusive_group()
+    formatExclusiveGroup.add_argument( '-f', '--format', action = 'store', dest = 'format', \
+        choices = [ 'm4a', 'mp3', 'mp4' ], default = None, \
+        help = 'Specify output format.' )
+    # ==========================================================================
+
+    # QUALITY
+    # ==========================================================================
+    ap.add_argument( '-q', '--quality', action = 'store', dest = 'quality', \
+        type = int, help = 'Specify output quality.' )
+    # ==========================================================================
+
+    # QUALITY POLICY
+    # ==========================================================================
+    ap.add_argument( '--max-size', action = 'store', dest = 'maxSize', \
+        type = size, metavar = 'SIZE', help = 'Only options of at most ' \
+        + 'SIZE bytes (i.e. 200M, 1.5G), unknown sizes don\'t fit.' )
+    ap.add_argument( '--min-quality', action = 'store', dest = 'minQuality', \
+        type = int, metavar = 'N', help = 'Only options of at least N ' \
+        + '(p or kbps).' )
+    ap.add_argument( '--max-quality', action = 'store', dest = 'maxQuality', \
+        type = int, metavar = 'N', help = 'Only options of at most N ' \
+        + '(p or kbps).' )
+    ap.add_argument( '--prefer', action = 'store', dest = 'prefer', \
+        choices = PREFERENCES, default = 'quality', help = 'Option taken ' \
+        + 'when -q is not given: highest quality or smallest file ' \
+        + '(default: quality).' )
+    ap.add_argument( '--fallback', action = 'store', dest = 'fallback', \
+        type = formats, default = [], metavar = 'FORMATS', \
+        help = 'Comma separated formats tried in order when -f one has no ' \
+        + 'option that fits (i.e. m4a,mp3).' )
+    # ==========================================================================
+    # SHOW INFO ONLY
+    # ==========================================================================
+    ap.add_argument( '-sio', action = 'store_true', dest = 'showInfoOnly', \
+        help = 'Only get and show info about format and qualities availables.' )
+    # ==========================================================================
+
+    # SHOW FORMAT ONLY
+    # ==========================================================================
+    ap.add_argument( '-sfo', action = 'store_true', dest = 'showFormatOnly', \
+        help = 'Show specified format info Only.')
+    # ==========================================================================
+
+    # SHOW INFO AS JSON
+    # ==========================================================================
+    ap.add_argument( '--json', action = 'store_true', dest = 'json', \
+        help = 'Show info as JSON, sizes in bytes (implies -sio). With ' \
+        + '--batch one JSON line per url is shown, -w urls at once.' )
+    # ==========================================================================
+
+    # DOWNLOAD FILES ON CURRENT DIR
+    # ==========================================================================
+    ap.add_argument( '-cd', action = 'store_true', dest = 'useCurrentDir', \
+        help = 'Download files on current dir.' )
+    # ==========================================================================
+
+    # MP3 CONVERT
+    # ==========================================================================
+    ap.add_argument( '--mp3-convert', action = 'store_true', dest = 'mp3Convert', \
+        help = 'Use Y2mate\'s youtube MP3 converter service' )
+    ap.add_argument( '--converts', action = 'store', dest = 'converts', \
+        type = int, default = 8, metavar = 'N', help = 'Conversions ' \
+        + 'requested at once, on batch and daemon modes urls waiting for ' \
+        + 'them don\'t hold a download worker.' )
+    ap.add_argument( '--convert-deadline', action = 'store', \
+        dest = 'convertDeadline', type = float, default = 600, \
+        metavar = 'SECONDS', help = 'Max seconds a file conversion is ' \
+        + 'waited for, it\'s requested again while the server converts it.' )
+    # ==========================================================================
+
+    # SEGMENTED DOWNLOAD
+    # ==========================================================================
+    ap.add_argument( '-s', '--segments', action = 'store', dest = 'segments', \
+        type = int, default = 1, help = 'Download each file on N parallel ' \
+        + 'connections (HTTP Range).' )
+    # ==========================================================================
+
+    # HTML PARSER ENGINE
+    # ==========================================================================
+    ap.add_argument( '--parser', action = 'store', dest = 'parser', \
+        choices = ENGINES, default = 'fast', \
+        help = 'Y2mate result HTML parser engine.' )
+    # ==========================================================================
+
+    # OPTIONS CACHE
+    # ==========================================================================
+    ap.add_argument( '--no-cache', action = 'store_true', dest = 'noCache', \
+        help = 'Don\'t use cached download options.' )
+    ap.add_argument( '--refresh', action = 'store_true', dest = 'refreshCache', \
+        help = 'Get download options again and update cache.' )
+    ap.add_argument( '--cache-ttl', action = 'store', dest = 'cacheTTL', \
+        type = int, default = 3600, metavar = 'SECONDS', \
+        help = 'Seconds cached download options are valid.' )
+    # ==========================================================================
+
+    # DOWNLOAD LEDGER
+    # ==========================================================================
+    ap.add_argument( '--ledger', action = 'store', dest = 'ledger', \
+        metavar = 'FILE', help = 'SQLite ledger of completed downloads, ' \
+        + 'urls on it are not downloaded again (default: downloads.sqlite3 ' \
+        + 'on cache folder).' )
+    ap.add_argument( '--no-ledger', action = 'store_true', dest = 'noLedger', \
+        help = 'Don\'t use download ledger.' )
+    ap.add_argument( '--ledger-verify', action = 'store', \
+        dest = 'ledgerVerify', choices = VERIFY_POLICIES, default = 'size', \
+        help = 'Check of recorded files before they are used, a file that ' \
+        + 'fails it is downloaded again.' )
+    ap.add_argument( '--ledger-mode', action = 'store', dest = 'ledgerMode', \
+        choices = MODES, default = 'skip', help = 'Recorded file asked on ' \
+        + 'another folder is left where it is, hard linked or copied.' )
+    ap.add_argument( '--redownload', action = 'store_true', \
+        dest = 'redownload', help = 'Download again urls on ledger.' )
+    # ==========================================================================
+
+    # CHECKSUMS
+    # ==========================================================================
+    ap.add_argument( '--checksum', action = 'store', dest = 'checksums', \
+        type = checksums, default = [ 'sha256' ], metavar = 'ALGORITHMS', \
+        help = 'Comma separated checksums computed while files are saved: ' \
+        + '{} or none (default: sha256).'.format( ', '.join( ALGORITHMS ) ) )
+    ap.add_argument( '--manifest', action = 'store', dest = 'manifest', \
+        metavar = 'FILE', help = 'Append path, bytes, content-length and ' \
+        + 'checksums of every saved file to FILE (JSON lines).' )
+    # ==========================================================================
+
+    # DOWNLOAD PROGRESS
+    # ==========================================================================
+    ap.add_argument( '--progress', action = 'store', dest = 'progress', \
+        choices = REPORTERS, default = 'bar', help = 'How progress of ' \
+        + 'downloads is shown on stderr: one bar of all of them, log ' \
+        + 'lines, JSON events or none (default: bar).' )
+    ap.add_argument( '--progress-interval', action = 'store', \
+        dest = 'progressInterval', type = float, metavar = 'SECONDS', \
+        help = 'Seconds between progress updates (default: 0.2 bar, 5 log, ' \
+        + '1 json).' )
+    # ==========================================================================
+
+    # CHUNK SIZE
+    # ==========================================================================
+    ap.add_argument( '--chunk-size', action = 'store', dest = 'chunkSize', \
+        type = chunkSize, default = 'auto', metavar = 'BYTES', \
+        help = 'Bytes read at once on downloads, \'auto\' adapts it to ' \
+        + 'network speed.' )
+    # ==========================================================================
+
+    # DISK WRITES
+    # ==========================================================================
+    ap.add_argument( '--write-buffers', action = 'store', \
+        dest = 'writeBuffers', type = int, default = 0, metavar = 'N', \
+        help = 'Write downloads on a writer thread with N chunk buffers, ' \
+        + 'so reads go on while the disk is slow (i.e. NFS). 0 writes on ' \
+        + 'the reading thread (default).' )
+    ap.add_argument( '--fsync', action = 'store_true', dest = 'fsync', \
+        help = 'Flush every completed file to disk before it\'s renamed.' )
+    # ==========================================================================
+
+    # BANDWIDTH LIMIT
+    # ==========================================================================
+    ap.add_argument( '--limit-rate', action = 'store', dest = 'limitRate', \
+        type = rate, default = 0, metavar = 'RATE', \
+        help = 'Bytes/sec of all downloads together (i.e. 500K, 2M).' )
+    ap.add_argument( '--limit-file-rate', action = 'store', \
+        dest = 'limitFileRate', type = rate, default = 0, metavar = 'RATE', \
+        help = 'Bytes/sec of every download.' )
+    ap.add_argument( '--rate-control', action = 'store', dest = 'rateControl', \
+        metavar = 'FILE', help = 'Read --limit-rate (and burst) from FILE, ' \
+        + 'reloaded when it changes or on SIGUSR1.' )
+    # ==========================================================================
+
+    # BATCH MODE
+    # ==========================================================================
+    ap.add_argument( '-b', '--batch', action = 'store', dest = 'batch', \
+        metavar = 'FILE', help = 'Download every url in FILE (one per line, ' \
+        + '\'-\' reads stdin).' )
+    ap.add_argument( '-w', '--workers', action = 'store', dest = 'workers', \
+        type = int, default = 4, help = 'Concurrent downloads on batch mode.' )
+    # ==========================================================================
+
+    # RETRY POLICY
+    # ==========================================================================
+    ap.add_argument( '--retries', action = 'store', dest = 'retries', \
+        type = int, default = 3, metavar = 'N', \
+        help = 'Max attempts of every request (1 is no retries).' )
+    ap.add_argument( '--retry-backoff', action = 'store', dest = 'retryBackoff', \
+        type = float, default = 1, metavar = 'SECONDS', \
+        help = 'Base wait between attempts, doubled on every retry ' \
+        + '(with random jitter).' )
+    ap.add_argument( '--retry-on', action = 'store', dest = 'retryOn', \
+        type = retryRules, default = DEFAULT_RULES, metavar = 'RULES', \
+        help = 'Comma separated failures that are retried: HTTP status ' \
+        + 'codes, 5xx, connection and timeout (default: {}).' \
+            .format( ','.join( DEFAULT_RULES ) ) )
+    ap.add_argument( '--retry-deadline', action = 'store', \
+        dest = 'retryDeadline', type = float, default = 0, metavar = 'SECONDS', \
+        help = 'Max seconds for all attempts of a request, 0 is no limit.' )
+    ap.add_argument( '--non-interactive', action = 'store_true', \
+        dest = 'nonInteractive', help = 'Never ask, failed requests are ' \
+        + 'retried by retry policy only and existing files are kept.' )
+    # ==========================================================================
+
+    # HEDGED REQUESTS
+    # ==========================================================================
+    ap.add_argument( '--hedge', action = 'store', dest = 'hedge', \
+        type = float, default = None, metavar = 'PERCENTILE', \
+        help = 'Send again analyze and convert requests slower than ' \
+        + 'PERCENTILE of recent ones (i.e. 95), the first answer wins.' )
+    ap.add_argument( '--hedge-budget', action = 'store', dest = 'hedgeBudget', \
+        type = float, default = 0.1, metavar = 'FRACTION', \
+        help = 'Max hedges per request (default: 0.1, one every 10).' )
+    ap.add_argument( '--hedge-max-delay', action = 'store', \
+        dest = 'hedgeMaxDelay', type = float, default = 2, \
+        metavar = 'SECONDS', help = 'Max wait before a hedge, used until ' \
+        + 'there are enough request times (default: 2).' )
+    # ==========================================================================
+
+    # METRICS
+    # ==========================================================================
+    ap.add_argument( '--metrics', action = 'store', dest = 'metrics', \
+        metavar = 'FILE', help = 'Write phase times, bytes, throughput and ' \
+        + 'retries of every url to FILE.' )
+    ap.add_argument( '--metrics-format', action = 'store', \
+        dest = 'metricsFormat', choices = FORMATS, default = None, \
+        help = 'JSON lines (one per url) or Prometheus textfile (default: ' \
+        + 'prometheus for \'.prom\' files, jsonl otherwise).' )
+    # ==========================================================================
+
+    # PROFILING
+    # ==========================================================================
+    ap.add_argument( '--profile', action = 'store', dest = 'profile', \
+        metavar = 'FOLDER', help = 'Profile CPU (cProfile) and memory ' \
+        + '(tracemalloc) of analyze, parse and download phases and write ' \
+        + 'their reports to FOLDER when the run ends (slower run).' )
+    ap.add_argument( '--profile-top', action = 'store', dest = 'profileTop', \
+        type = int, default = 30, metavar = 'N', help = 'Functions and ' \
+        + 'allocation sites shown on profile reports (default: 30).' )
+    # ==========================================================================
+
+    # Y2MATE BASE URL
+    # ==========================================================================
+    ap.add_argument( '--base-url', action = 'store', dest = 'baseURL', \
+        metavar = 'URL', help = 'Y2mate base URL, i.e. a local stand-in ' \
+        + 'server (default: Y2MATE_BASE_URL or {}).'.format( BASE_URL ) )
+    ap.add_argument( '--mirror', action = 'append', dest = 'mirrors', \
+        default = [], metavar = 'URL', help = 'Base URL of another host ' \
+        + 'with y2mate API, the fastest healthy one is used and failed ' \
+        + 'requests go to the next one (can be given many times).' )
+    # ==========================================================================
+
+    # ASYNCIO MODE
+    # ==========================================================================
+    ap.add_argument( '--async', action = 'store_true', dest = 'useAsync', \
+        help = 'Run downloads on asyncio event loop (needs aiohttp), ' \
+        + '-w sets concurrent urls. Downloads are single stream (no -s).' )
+    # ==========================================================================
+
+    # DAEMON MODE
+    # ==========================================================================
+    ap.add_argument( '--serve', action = 'store', dest = 'serve', nargs = '?', \
+        const = DEFAULT_ADDRESS, metavar = 'ADDRESS', help = 'Run as daemon ' \
+        + 'that downloads submitted jobs, -w sets concurrent jobs. ADDRESS ' \
+        + 'is \'unix:PATH\' or \'HOST:PORT\' (default: {}).' \
+            .format( DEFAULT_ADDRESS ) )
+    ap.add_argument( '--submit', action = 'store', dest = 'submit', \
+        nargs = '?', const = DEFAULT_ADDRESS, metavar = 'ADDRESS', \
+        help = 'Submit url (or --batch urls) to daemon at ADDRESS instead ' \
+        + 'of downloading it here.' )
+    ap.add_argument( '--wait', action = 'store_true', dest = 'wait', \
+        help = 'Wait for submitted jobs and show their summary.' )
+    # ==========================================================================
+
+    # OVERRIDE HELP COMMAND
+    # ==========================================================================
+    formatExclusiveGroup.add_argument( '-h', '--help', action = 'store_true', dest = 'showHelp', \
+        help = 'Show this help message and exit.')
+    # ==========================================================================
+
+    # URL (POSITIONAL ARGUMENT)
+    # ==========================================================================
+    ap.add_argument( 'url', nargs = '?', action = 'store' )
+    # ==========================================================================
+
+    return ap
+# ------------------------------------------------------------------------------
+
+def main( arguments = None ):
+    '''Run y2mate-download with CLI arguments (sys.argv by default)'''
+
+    ap = getArgumentParser()
+
+    # CHECK VERSION
+    # ==========================================================================
+    result = checkVersion( interrupt = True )
+
+    if not result['status']:
+        exit( result['msg'] )
+    # ==========================================================================
+
+    args = ap.parse_args( arguments )
+
+    # CHECK HELP
+    if args.showHelp:
+        print( getProjectInfo( indentChar = '' )[1:] )
+        ap.print_help() 
+        exit()
+
+    # CHECK FORMAT, ONLY DAEMON MODE RUNS WITHOUT IT
+    if args.format is None and not args.serve:
+        ap.error( 'one of the arguments -f/--format -h/--help is required' )
+
+    # JSON IS A WAY TO SHOW INFO
+    args.showInfoOnly = args.showInfoOnly or args.json
+
+    # CHECK MP3 CONVERT AND FORMAT OPTION
+    if args.format != 'mp3' and args.mp3Convert:
+        _verbose( args.isVerbose, 'Status: CLI wrong parameters!' )
+        exit( 'You must specified \'-f mp3\' to use \'--mp3-convert\' option!' )
+
+    # SUBMIT TO DAEMON, NOTHING IS DOWNLOADED HERE
+    # ==========================================================================
+    if args.submit:
+        if args.batch:
+            urls = readURLs( args.batch )
+        elif args.url:
+            urls = [ args.url ]
+        else:
             exit( 'You must give me a video url!' )
 
-        vID     = getVideoID( args.url, verbose = args.isVerbose )
-        result  = getOptions(
-            vID, debug = args.isDebug, verbose = args.isVerbose,
-            mp3Convert = args.mp3Convert
+        try:
+            results = submitJobs(
+                args.submit, urls, args.format, args.quality,
+                mp3Convert    = args.mp3Convert,
+                useCurrentDir = args.useCurrentDir,
+                redownload    = args.redownload,
+                wait          = args.wait,
+                verbose       = args.isVerbose
+            )
+        except JobError as e:
+            exit( str( e ) )
+        except KeyboardInterrupt:
+            exit( '\nCacelled by user!' )
+
+        if args.wait:
+            print( getBatchSummary( results ) )
+
+        exit( 0 if all( r[1] for r in results ) else 1 )
+    # ==========================================================================
+
+    # LOAD DOWNLOAD DEPENDENCIES
+    import requests
+    from Download import Downloader
+    from DownloadLedger import DownloadLedger
+    from EndpointRegistry import EndpointRegistry, setEndpointRegistry
+    from Hedge import HedgePolicy, setHedgePolicy
+    from OptionsCache import OptionsCache
+    from RateLimiter import RateControl, RateLimiter
+    from SessionPool import formatPoolStats, getSessionPool
+
+    if args.baseURL:
+        setBaseURL( args.baseURL )
+
+    # API ENDPOINTS, THEIR HEALTH IS KEPT BETWEEN RUNS
+    endpoints = EndpointRegistry(
+        path.join( getCacheFolderPath(), 'endpoints.json' ),
+        mirrors = args.mirrors
+    )
+    setEndpointRegistry( endpoints )
+    atexit.register( endpoints.save )
+
+    if args.metrics:
+        setMetrics( Metrics( args.metrics, args.metricsFormat ) )
+
+    # REPORTS ARE WRITTEN ON EXIT, ERRORS TOO
+    if args.profile:
+        profiler = Profiler( args.profile, top = args.profileTop )
+        setProfiler( profiler )
+        atexit.register( profiler.close )
+
+    # RETRY POLICY OF EVERY REQUEST
+    setRetryPolicy( RetryPolicy(
+        attempts = args.retries, backoff = args.retryBackoff,
+        rules = args.retryOn, deadline = args.retryDeadline
+    ) )
+
+    # OPTION SELECTED ON EVERY DOWNLOAD
+    setQualityPolicy( QualityPolicy(
+        maxSize = args.maxSize, minQuality = args.minQuality,
+        maxQuality = args.maxQuality, prefer = args.prefer,
+        fallback = args.fallback
+    ) )
+
+    # STRAGGLER ANALYZE AND CONVERT REQUESTS ARE SENT AGAIN
+    if args.hedge is not None:
+        setHedgePolicy( HedgePolicy(
+            percentile = args.hedge, maxDelay = args.hedgeMaxDelay,
+            budget = args.hedgeBudget
+        ) )
+
+    # BANDWIDTH LIMIT SHARED BY ALL DOWNLOADS
+    limiter = RateLimiter( args.limitRate )
+
+    if args.rateControl:
+        RateControl( limiter, args.rateControl, verbose = args.isVerbose ).start()
+
+    # DAEMONS RUN MANY DOWNLOADS AT ONCE, PROGRESS IS ON JOB STATUS
+    reporter = None if args.serve else getReporter( args.progress )
+
+    if reporter is not None:
+        progress = Progress( reporter, args.progressInterval )
+        setProgress( progress )
+        atexit.register( progress.close )
+
+    downloader = Downloader(
+        segments = args.segments, chunk = args.chunkSize, verify = False,
+        limiter = limiter, fileRate = args.limitFileRate,
+        checksums = args.checksums, writeBuffers = args.writeBuffers,
+        fsync = args.fsync, debug = args.isDebug
+    )
+
+    # OPTIONAL CHECKSUM MODULES
+    try:
+        [ newDigest( a ) for a in args.checksums ]
+    except ValueError as e:
+        exit( '[Error]: {}!'.format( e ) )
+
+    manifest = Manifest( args.manifest ) if args.manifest else None
+
+    # OPTIONS CACHE
+    if args.noCache:
+        cache = None
+    else:
+        cache = OptionsCache( getCacheFolderPath(), ttl = args.cacheTTL )
+
+    # DOWNLOAD LEDGER
+    if args.noLedger:
+        ledger = None
+    else:
+        ledger = DownloadLedger(
+            args.ledger or path.join( getCacheFolderPath(), 'downloads.sqlite3' ),
+            verify = args.ledgerVerify, mode = args.ledgerMode
         )
 
-        if result == None:
-            _verbose(
-                    args.isVerbose,
-                    'Status: Error getting options... restarting process!'
+    client = Y2mateClient(
+        cache = cache, downloader = downloader, engine = args.parser,
+        ledger = ledger, manifest = manifest, converts = args.converts,
+        convertDeadline = args.convertDeadline, debug = args.isDebug,
+        verbose = args.isVerbose
+    )
+
+    # KEEP A CONNECTION ALIVE FOR EVERY BATCH WORKER AND CONVERSION
+    sessionPool = getSessionPool()
+    sessionPool.poolMaxsize = max(
+        sessionPool.poolMaxsize, args.workers + args.converts
+    )
+
+    # DAEMON MODE, RUN SUBMITTED JOBS UNTIL INTERRUPTED
+    # ==========================================================================
+    if args.serve:
+        from JobServer import JobServer
+
+        try:
+            server = JobServer(
+                client, args.serve, workers = args.workers,
+                verbose = args.isVerbose
             )
-            continue
-        
-        # SHOW INFO ONLY
-        # ----------------------------------------------------------------------
-        if args.showInfoOnly:
-            q_postFix = { 'audio': 'kbps', 'mp4': 'p' }
-            f_separator = { 'audio': '   ', 'mp4': '\t   ' }
-
-            # SHOW FORMAT ONLY
-            # ------------------------------------
-            if args.showFormatOnly:
-                formats = [ args.format ]
-            else:
-                formats = result['options'].keys()
-            # ------------------------------------
-            
-            output = getProjectInfo()                
-
-            # SET Y2MATE SERVICE TITLE
-            # ----------------------------------------------
-            output += '\n Service: '
-            if args.mp3Convert:
-                output += 'Y2mate Youtube MP3 Converter\n'
-            else:
-                output += 'Y2mate Youtube Downloader\n'
-            # ----------------------------------------------
-            
-            # PROCESS FORMATS
-            output += '\n Available options:\n'
-
-            for format in formats:
-                # CONVERT FORMAT TO SET KEY ACCESIBLE
-                # ------------------------------------
-                if format in [ 'audio', 'mp3' ]:
-                    set_k = 'audio'
+        except ( OSError, ValueError ) as e:
+            exit( '[Error]: Can\'t serve at \'{}\' ({})!'.format(
+                args.serve, e
+            ) )
+
+        print( 'Serving download jobs at \'{}\', {} at once'.format(
+            server.address, server.queue.workers
+        ), flush = True )
+
+        try:
+            server.serveForever()
+        except KeyboardInterrupt:
+            exit( '\nDaemon stopped!' )
+    # ==========================================================================
+
+    # IF SOME RESULTS GIVE NONE START AGAIN, ACCORDING RETRY POLICY
+    attempt = 0
+    started = monotonic()
+
+    def retryOptions():
+        '''Wait before getting options again or exit when there are no attempts'''
+        nonlocal attempt
+
+        delay = getRetryPolicy().next( attempt, started )
+
+        if delay is None:
+            _verbose( args.isVerbose, 'Status: No retries left!' )
+            exit( '[Error]: Can\'t get download options!' )
+
+        _verbose(
+            args.isVerbose,
+            'Status: Error getting options... retrying in {:.1f} s!' \
+                .format( delay )
+        )
+        sleep( delay )
+        attempt += 1
+
+    while True:
+        try:
+            # ASYNCIO MODE
+            # ------------------------------------------------------------------
+            if args.useAsync and not args.showInfoOnly:
+                if args.segments > 1:
+                    exit(
+                        'Option \'-s\' can\'t be used with \'--async\', ' \
+                            + 'its downloads are single stream!'
+                    )
+
+                if args.batch:
+                    urls = readURLs( args.batch )
+                elif args.url:
+                    urls = [ args.url ]
                 else:
-                    set_k = 'mp4'
-                # ------------------------------------
+                    exit( 'You must give me a video url!' )
+
+                results, stats = runAsync(
+                    urls,
+                    workers       = args.workers,
+                    format        = args.format,
+                    quality       = args.quality,
+                    mp3Convert    = args.mp3Convert,
+                    useCurrentDir = args.useCurrentDir,
+                    debug         = args.isDebug,
+                    verbose       = args.isVerbose,
+                    cache         = cache,
+                    refresh       = args.refreshCache,
+                    redownload    = args.redownload,
+                    ledger        = ledger,
+                    manifest      = manifest,
+                    checksums     = args.checksums,
+                    engine        = args.parser,
+                    limiter       = limiter,
+                    fileRate      = args.limitFileRate,
+                    converts      = args.converts,
+                    chunk         = args.chunkSize,
+                    writeBuffers  = args.writeBuffers,
+                    fsync         = args.fsync,
+                    convertDeadline = args.convertDeadline
+                )
+                print( getBatchSummary( results, stats ) )
+                exit( 0 if all( r[1] for r in results ) else 1 )
+            # ------------------------------------------------------------------
+
+            # BATCH MODE
+            # ------------------------------------------------------------------
+            if args.batch and args.showInfoOnly:
+                if not args.json:
+                    exit(
+                        'Option \'-sio\' can\'t be used with \'--batch\' ' \
+                            + 'without \'--json\'!'
+                    )
 
-                output += '\n {}\n {}'.format(
-                    format.capitalize(),
-                    '-' * 22
+                failed  = 0
+                formats = [ args.format ] if args.showFormatOnly else None
+
+                for url, info in client.analyzeBatch(
+                        readURLs( args.batch ),
+                        workers    = args.workers,
+                        mp3Convert = args.mp3Convert,
+                        refresh    = args.refreshCache
+                    ):
+                    if isinstance( info, Y2mateError ):
+                        failed += 1
+                        line = json.dumps( { 'url': url, 'error': str( info ) } )
+                    else:
+                        line = getInfoJSON( info, formats, url )
+
+                    print( line, flush = True )
+
+                exit( 1 if failed else 0 )
+
+            if args.batch:
+
+                results, stats = client.runBatch(
+                    readURLs( args.batch ),
+                    workers       = args.workers,
+                    format        = args.format,
+                    quality       = args.quality,
+                    mp3Convert    = args.mp3Convert,
+                    useCurrentDir = args.useCurrentDir,
+                    refresh       = args.refreshCache,
+                    redownload    = args.redownload
+                )
+                print( getBatchSummary( results, stats ) )
+                _verbose(
+                    args.isVerbose,
+                    'Status: ' + formatPoolStats( sessionPool.getStats() )
                 )
-                output += '\n Quality | Size'
-
-                for details in result['options'][format]:
-                    # FIX UNKNOWN SIZE
-                    # -------------------------------------
-                    if len( details['size'].split() ) == 1:
-                        continue
-                    # -------------------------------------
-
-                    output += '\n {}{}{}'.format(
-                        str(details['quality']).strip() + q_postFix[set_k],
-                        f_separator[set_k],
-                        details['size'].strip()
+
+                # EXIT WITH ERROR WHEN SOME URL FAILED
+                exit( 0 if all( r[1] for r in results ) else 1 )
+            # ------------------------------------------------------------------
+
+            # CHECK FOR EMPTY VIDEO URL
+            if args.url == None or args.url == '':
+                _verbose( args.isVerbose, 'Status: You must give me a video url!' )
+                exit( 'You must give me a video url!' )
+
+            # EVERY ATTEMPT IS A METRICS RUN
+            with getMetrics().run( args.url ) as run:
+                saved = None
+
+                try:
+                    info = getVideoInfo(
+                        client, args.url, mp3Convert = args.mp3Convert,
+                        refresh = args.refreshCache, verbose = args.isVerbose
                     )
-                output += '\n {}\n'.format( '-' * 22 )
-            print( output )
-        # ----------------------------------------------------------------------
-                   
-        else:
-            quality = selectQuality(
-                result['options'],
-                args.format,
-                args.quality
-            )
-            fileName = '{}.{}'.format( result['title'], args.format )
 
-            downloadFile(
-                result['kID'],
-                vID,
-                useCurrentDir = args.useCurrentDir,
-                mp3Convert    = args.mp3Convert,
-                fileName      = fileName,
-                format        = args.format,
-                quality       = quality,
-                debug         = args.isDebug,
-                verbose       = args.isVerbose
-            ) 
-    except KeyboardInterrupt:
-        _verbose( args.isVerbose, 'Status: Task cancelled by user!' )
-        exit( '\nCacelled by user!' )
+                    # SELECTED OPTION ALREADY DOWNLOADED, NOTHING IS CONVERTED
+                    if not args.showInfoOnly and not args.redownload:
+                        saved = getDownloaded(
+                            client, info, args.format, args.quality,
+                            useCurrentDir = args.useCurrentDir,
+                            verbose       = args.isVerbose
+                        )
+                except OptionsError as e:
+                    run.fail( e )
+                    info = None
+                except Y2mateError as e:
+                    exit( str( e ) )
+
+                # SHOW INFO ONLY
+                # --------------------------------------------------------------
+                if info != None and args.showInfoOnly:
+                    formats = [ args.format ] if args.showFormatOnly else None
+
+                    if args.json:
+                        print( getInfoJSON( info, formats ) )
+                    else:
+                        print( getInfoOutput( info, formats ) )
+                # --------------------------------------------------------------
+                   
+                elif info != None and saved is None:
+                    try:
+                        downloadFile(
+                            client,
+                            info,
+                            args.format,
+                            args.quality,
+                            useCurrentDir = args.useCurrentDir,
+                            verbose       = args.isVerbose,
+                            interactive   = not args.nonInteractive
+                        )
+                    except OptionsError as e:
+                        run.fail( e )
+                    except Y2mateError as e:
+                        exit( str( e ) )
+
+                    _verbose(
+                        args.isVerbose,
+                        'Status: ' + formatPoolStats( sessionPool.getStats() )
+                    )
 
-    break
+            # OPTIONS FAILED, RETRY ACCORDING RETRY POLICY
+            if run.status != 'ok':
+                retryOptions()
+                continue
+        # NETWORK ERROR AFTER ALL RETRIES
+        except requests.RequestException as e:
+            _verbose( args.isVerbose, 'Status: No retries left!' )
+            exit( '[Network Error]: {}'.format( e ) )
+        except KeyboardInterrupt:
+            _verbose( args.isVerbose, 'Status: Task cancelled by user!' )
+            exit( '\nCacelled by user!' )
+
+        break
+
+if __name__ == '__main__':
+    main()